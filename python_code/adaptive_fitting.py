@@ -2,6 +2,11 @@
 #
 # Output 1: LAF fit estimate for each grid point in the mu-gamma space
 #
+# Several parameters (e.g. --pdfparameter all) and representations (e.g. --representation flux,cloudexpo) can be
+# fitted in one run: the data set is read once, the neighbors of the grid centers are searched once per representation
+# (they depend only on mu and gamma) and the results are written in one table (one row per representation and grid
+# point, one group of columns per parameter)
+#
 # Author: Massimiliano Ignaccolo
 #         massimiliano.ignaccolo [at] tutanota.com. massimiliano.ignaccolo [at] sas.com
 # Last modified: Feb 01 2022
@@ -22,6 +27,7 @@ from grispy import GriSPy
 # if pack_path not in sys.path:
 # sys.path.append(pack_path)
 import disdrorain as dr
+import laf
 #  ------------- Necessary Python packages -END
 
 # ARGUMENTS
@@ -32,9 +38,11 @@ parser.add_argument('--disdrodatapath', action="store", dest='_ddp_', default='_
 parser.add_argument('--disdrocatalog', action="store", dest='_dc_', default='_NONE_')
 # --disdroacronym: acronym identifying the data set in the catalog
 parser.add_argument('--disdroacronym', action="store", dest='_da_', default='_NONE_')
-# --pdfparameter: the statistical moments to fit as a function of mu and gamma
+# --pdfparameter: the statistical moments to fit as a function of mu and gamma: comma separated list of values among
+#                 "sigma", "kappa", "eta", or "all" for all of them
 parser.add_argument('--pdfparameter', action="store", dest='_pp_', default='_NONE_')
 # --representation: which type of drop size representation to adopt: possible values are "flux", "cloudexpo", "cloudplaw", and "cloud2dvd"
+#                   comma separated list of values to fit several representations
 #                   default is "flux"
 parser.add_argument('--representation', action="store", dest='_re_', default='flux')
 # --renorm_table: path to file containing the renormalization values table
@@ -42,24 +50,28 @@ parser.add_argument('--renorm_table', action="store", dest='_rnt_', default='_NO
 # --renorm_type: which type of renormalization to adopt:
 #                the argument of --renorm_type must be one the values in the
 #                column "renorm_type" column of the file with the renormalization values table
+#                comma separated list with one value for each representation (a single value is used for all of them)
+#                default is the name of the representation
 parser.add_argument('--renorm_type', action="store", dest='_rnty_', default='')
 # --radiusseq
 parser.add_argument('--radiusseq', action="store", dest='_rs_', default='_NONE_')
 # --occupancy
 parser.add_argument('--occupancy', action="store", dest='_oc_', default='20')
+# --neighborsearch: how the neighbors of the grid centers are searched: possible values are
+#                   "singlepass" (one search with the largest radius, the smallest radius with enough neighbors is found
+#                   for each center from the distances of the neighbors) and "perradius" (one search for each radius of the
+#                   sequence on the centers without enough neighbors). The results are the same
+#                   default is "singlepass"
+parser.add_argument('--neighborsearch', action="store", dest='_ns_', default='singlepass')
+# --workers: number of worker processes evaluating the tiles of the grid of centers (only for --neighborsearch singlepass)
+#            default is 1 (no pool of processes)
+parser.add_argument('--workers', action="store", dest='_wo_', default='1')
 # --output: output file name for the adaptive fit results output
 parser.add_argument('--output', action="store", dest='_ou_', default='')
-args = parser.parse_args()
-
-#
-print("Executing: ", sys.argv[0])
-print()
-
-catalog = pd.read_csv(args._dc_, sep=',')
 
 
 # Method calculating the renormalized values of the statistical moments
-def _renormalize_(_dfin_, _rntable_, _rnrmtype_, _param_):
+def _renormalize_(_dfin_, _rntable_, _rnrmtype_, _listparam_):
     # renormalize the values of statistical moments
     _df_ = copy.deepcopy(_dfin_)
     # obtain renormalization parameters for mean
@@ -85,7 +97,8 @@ def _renormalize_(_dfin_, _rntable_, _rnrmtype_, _param_):
     # calculate renormalized statistical moments
     _df_.loc[:, 'mu_r'] = (_df_.mu-mu_min)/(mu_max-mu_min)
     _df_.loc[:, 'gamma_r'] = (_df_.gamma-gamma_min)/(gamma_max-gamma_min)
-    _df_.loc[:, f"{_param_}_r"] = (_df_[_param_]-dict_min[_param_])/(dict_max[_param_]-dict_min[_param_])
+    for _param_ in _listparam_:
+        _df_.loc[:, f"{_param_}_r"] = (_df_[_param_]-dict_min[_param_])/(dict_max[_param_]-dict_min[_param_])
 
     return _df_
 
@@ -117,146 +130,202 @@ def _unrenormalize_laf_results_(_dfin_, _rntable_, _rnrmtype_, _param_):
     _df_.loc[:, 'mu'] = (_df_.mu_r*(mu_max-mu_min))+mu_min
     _df_.loc[:, 'gamma'] = (_df_.gamma_r*(gamma_max-gamma_min))+gamma_min
 
-    _df_.loc[:, f"{_param_}_median"] = np.round((fitted.predicted_r*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
-    _df_.loc[:, f"{_param_}_5%"] = np.round((fitted['predicted_5%']*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
-    _df_.loc[:, f"{_param_}_q1"] = np.round((fitted.predicted_q1*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
-    _df_.loc[:, f"{_param_}_q3"] = np.round((fitted.predicted_q3*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
-    _df_.loc[:, f"{_param_}_95%"] = np.round((fitted['predicted_95%']*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
+    _df_.loc[:, f"{_param_}_median"] = np.round((_dfin_.predicted_r*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
+    _df_.loc[:, f"{_param_}_5%"] = np.round((_dfin_['predicted_5%']*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
+    _df_.loc[:, f"{_param_}_q1"] = np.round((_dfin_.predicted_q1*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
+    _df_.loc[:, f"{_param_}_q3"] = np.round((_dfin_.predicted_q3*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
+    _df_.loc[:, f"{_param_}_95%"] = np.round((_dfin_['predicted_95%']*(dict_max[_param_]-dict_min[_param_]))+dict_min[_param_], 6)
 
     return _df_
 
 
+# Method organizing the LAF estimates of a set of centers in a data frame
+# _quantiles_: quantiles of the parameter values of the neighbors of each center (see laf.QUANTILES)
+def _laf_estimates_(_centers_, _quantiles_):
+    _quantiles_ = np.round(_quantiles_, 6)
+    return pd.DataFrame({'mu_r': np.round(_centers_[:, 0], 6), 'gamma_r': np.round(_centers_[:, 1], 6),
+                         'predicted_r': _quantiles_[:, 0], 'predicted_5%': _quantiles_[:, 3],
+                         'predicted_q1': _quantiles_[:, 1], 'predicted_q3': _quantiles_[:, 2],
+                         'predicted_95%': _quantiles_[:, 4]})
+
+
 # Method implenting the LAF fitting procedure
-def _build_model_(_df_, _param_, _listradius_, _occupancy_):
+# the neighbors of the grid centers are searched once and used for all the parameters of _listparam_
+# returns the results of each parameter {parameter: results}
+def _build_model_(_df_, _listparam_, _listradius_, _occupancy_, _search_='singlepass', _workers_=1):
     _data_ = _df_[['mu_r', 'gamma_r']].values
-    _params_ = _df_[[_param_+'_r']].values
+    _params_ = {_param_: _df_[[_param_+'_r']].values for _param_ in _listparam_}
     _mu_coor = np.mgrid[-0.51:2.01:0.02]
     _gamma_coor = np.mgrid[-0.51:2.01:0.02]
     _centers_ = np.array(np.meshgrid(_mu_coor, _gamma_coor)).T.reshape(-1, 2)
 
-    gsp = GriSPy(_data_)
-
     results = pd.DataFrame(columns=['mu_r', 'gamma_r', 'predicted_r', 'radius'])
     results = results.astype(dtype={'mu_r': 'float64', 'gamma_r': 'float64', 'predicted_r': 'float64', 'radius': 'float64'})
+    results = {_param_: results for _param_ in _listparam_}
+
+    if _search_ == 'singlepass':
+        # one neighbor search with the largest radius: smallest radius with enough neighbors for each center
+        # the grid centers are split in tiles evaluated by _workers_ worker processes (see laf.laf_grid)
+        print("processing radii:", ",".join(_listradius_))
+        _rindex_, _quantiles_ = laf.laf_grid(_data_, np.hstack([_params_[_param_] for _param_ in _listparam_]), _centers_,
+                                             _listradius_, _occupancy_, workers=_workers_)
+        _selected_ = _rindex_ >= 0
+        # same order of the search radius by radius: by radius, then by center
+        _order_ = np.argsort(_rindex_[_selected_], kind='stable')
+        for j, _param_ in enumerate(_listparam_):
+            _temp_ = _laf_estimates_(_centers_[_selected_], _quantiles_[_selected_, j, :])
+            _temp_.loc[:, 'radius'] = np.asarray(_listradius_, dtype=object)[_rindex_[_selected_]]
+            results[_param_] = pd.concat([results[_param_], _temp_.iloc[_order_]], ignore_index=True)
+        return results
 
+    gsp = GriSPy(_data_)
     for _radius_ in _listradius_:
         print("processing radius:", _radius_)
         # Query for neighbors within upper_radii
         bubble_dist, bubble_ind = gsp.bubble_neighbors(
             _centers_, distance_upper_bound=float(_radius_))
 
-        _squareindex_array_ = []
-        _dataindex_array_ = []
-        j = 0
-        for _item_ in bubble_ind:
-            if (len(_item_) >= int(_occupancy_)):
-                _squareindex_array_.append(j)
-                _dataindex_array_.append(_item_)
-            j = j+1
-
-        parammedian = []
-        paramq1 = []
-        paramq3 = []
-        param5 = []
-        param95 = []
-        for _indexsubset_ in _dataindex_array_:
-            _params_sel = np.array([_params_[index] for index in _indexsubset_])
-            parammedian.append(np.round(np.median(_params_sel), 6))
-            paramq1.append(np.round(np.quantile(_params_sel, 0.25), 6))
-            paramq3.append(np.round(np.quantile(_params_sel, 0.75), 6))
-            param5.append(np.round(np.quantile(_params_sel, 0.05), 6))
-            param95.append(np.round(np.quantile(_params_sel, 0.95), 6))
-
-        _centers_sel = np.array([_centers_[index] for index in _squareindex_array_])
-        xy = np.vstack(_centers_sel)
-        x = np.round(xy[:, 0], 6)
-        y = np.round(xy[:, 1], 6)
-        z = np.array(parammedian)
-        zq1 = np.array(paramq1)
-        zq3 = np.array(paramq3)
-        zq5 = np.array(param5)
-        zq95 = np.array(param95)
-
-        _temp_ = pd.DataFrame({'mu_r': x, 'gamma_r': y, 'predicted_r': z, 'predicted_5%': zq5,
-                               'predicted_q1': zq1, 'predicted_q3': zq3, 'predicted_95%': zq95})
-        _temp_.loc[:, 'radius'] = _radius_
-        # print(_temp_.head(10))
-        # results = results.append(_temp_)
-        results = pd.concat([results, _temp_], ignore_index=True)
-        _centers_ = _centers_[~np.isin(np.arange(len(_centers_)), _squareindex_array_)]
+        # centers with enough neighbors
+        _lengths_ = np.array([len(_item_) for _item_ in bubble_ind])
+        _squareindex_array_ = np.flatnonzero(_lengths_ >= int(_occupancy_))
+        if len(_squareindex_array_) > 0:
+            _dataindex_array_ = np.concatenate([bubble_ind[j] for j in _squareindex_array_])
+        else:
+            _dataindex_array_ = np.zeros(0, dtype=np.int64)
+
+        for _param_ in _listparam_:
+            # quantiles of the parameter values of the neighbors of all the selected centers at once
+            # (flat array of neighbor indices, one segment per center, see laf.segment_quantiles)
+            _quantiles_ = laf.segment_quantiles(_params_[_param_][_dataindex_array_, 0], _lengths_[_squareindex_array_],
+                                                laf.QUANTILES)
+            _temp_ = _laf_estimates_(_centers_[_squareindex_array_], _quantiles_)
+            _temp_.loc[:, 'radius'] = _radius_
+            # print(_temp_.head(10))
+            # results = results.append(_temp_)
+            results[_param_] = pd.concat([results[_param_], _temp_], ignore_index=True)
+        # remove the centers with enough neighbors
+        _remaining_ = np.ones(len(_centers_), dtype=bool)
+        _remaining_[_squareindex_array_] = False
+        _centers_ = _centers_[_remaining_]
         # print("3",_radius_,_centers_.shape)
 
     return results
 
 
-# load catalog
-catalog = pd.read_csv(args. _dc_, sep=',')
-# retrieve index of catalog data frame corresponding to the desired acronym
-index_acronym = catalog[catalog['ID2'] == args._da_].index.tolist()
-# load renormalization parameters`table
-renorm_table = pd.read_csv(args._rnt_, sep=',')
-# load radii sequence
-radius = []
-with open(args._rs_, "r") as csv_file:
-    csv_reader = csv.reader(csv_file, delimiter=',')
-    for lines in csv_reader:
-        radius = lines
-
-# check if representation value is admitted (only: flux, cloudexpo, cloudplaw)
-if args._re_ not in ['flux', 'cloudexpo', 'cloudplaw', 'cloud2dvd']:
-    print("ERROR: representation value not found!")
-    print("possible choices are flux, cloudexpo, cloudplaw, cloud2dvd")
-    sys.exit()
-
-# if acronym is part of the catalog we proceed
-if index_acronym:
-    row = catalog.loc[catalog.ID2 == args._da_, :]  # retrieve row corresponding to acronym
-    celllimits_path = args._ddp_+'/'+row['CELLLIMITS'].values[0]  # set file name with cell limits values
-    areainstr = row['AREA_INSTRUMENT'].values[0]  # set area of instrument
-    instr = row['INSTRUMENT'].values[0]  # set instrument type
-    tr = row['TIME_RESOLUTION'].values[0]  # set instrument time resolution
-    pathtodata = args._ddp_+'/'+args._da_  # set path to data set
-
-    # if data set is not from 2DVD disdrometer
-    if (instr != '2DVD'):
-        # if data set is RD80 with standard cell limits division
-        if ((instr == 'RD80') & (row['CELLLIMITS'].values[0] == 'standard')):
-            disdrodata = dr.disdrorain(datapath=pathtodata, instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-        else:
-            disdrodata = dr.disdrorain(classpath=celllimits_path, datapath=pathtodata,
-                                       instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-    else:
-        disdrodata = dr.disdrorain_2dvd(datapath=pathtodata, instrument_area=areainstr,
-                                        time_interval=tr)  # create disdrodata class for 2dvd data
-
-    # calculate dsd paramters
-    if args._re_ == 'flux':
+# Method selecting the drop size distribution parameters of a representation
+def _dsd_parameters_(_disdrodata_, _representation_):
+    if _representation_ == 'flux':
         # calculate central moments in the flux (ground) representation
-        dsdpar = disdrodata.flux_phase_space_parameters()
+        return _disdrodata_.psp_flux
+    # calculate phase space paramter in the cloud representation for on 2DVD data
+    if _representation_ == 'cloudexpo':
+        # exponential law for drop speed
+        return _disdrodata_.psp_cloud_vexpo
+    if _representation_ == 'cloudplaw':
+        # expoential law for drop speed
+        return _disdrodata_.psp_cloud_vplaw
+    # cloud2dvd: this are 2dvd data and we know the speed of each drop
+    return _disdrodata_.psp_cloud
+
+
+# Method joining the results of several parameters in one table (one group of columns per parameter)
+def _join_parameters_(_listresults_, _listparam_):
+    _common_ = ['mu_r', 'gamma_r', 'radius', 'mu', 'gamma']
+    _predicted_ = ['predicted_r', 'predicted_5%', 'predicted_q1', 'predicted_q3', 'predicted_95%']
+    # the grid centers (and their radius) are the same for all the parameters: they depend only on mu and gamma
+    _parts_ = [_listresults_[0][_common_]]
+    for _param_, _res_ in zip(_listparam_, _listresults_):
+        _res_ = _res_.drop(columns=_common_)
+        _parts_.append(_res_.rename(columns={_col_: f"{_param_}_{_col_}" for _col_ in _predicted_}))
+    return pd.concat(_parts_, axis=1)
+
+
+# the program is executed only when invoked (see the note in workerpool.py)
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    #
+    print("Executing: ", sys.argv[0])
+    print()
+
+    # load catalog
+    catalog = dr.open_catalog(args._dc_, args._ddp_)
+    # load renormalization parameters`table
+    renorm_table = pd.read_csv(args._rnt_, sep=',')
+    # load radii sequence
+    radius = []
+    with open(args._rs_, "r") as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        for lines in csv_reader:
+            radius = lines
+
+    # parameters and representations to fit
+    listparam = ['sigma', 'kappa', 'eta'] if args._pp_ == 'all' else args._pp_.split(',')
+    listrepr = args._re_.split(',')
+    listrenorm = args._rnty_.split(',') if args._rnty_ != '' else listrepr
+    if len(listrenorm) == 1:
+        listrenorm = listrenorm*len(listrepr)
+
+    # check if representation value is admitted (only: flux, cloudexpo, cloudplaw)
+    if any([_re_ not in ['flux', 'cloudexpo', 'cloudplaw', 'cloud2dvd'] for _re_ in listrepr]):
+        print("ERROR: representation value not found!")
+        print("possible choices are flux, cloudexpo, cloudplaw, cloud2dvd")
+        sys.exit()
+
+    # check if pdfparameter value is admitted (only: sigma, kappa, eta)
+    if any([_pp_ not in ['sigma', 'kappa', 'eta'] for _pp_ in listparam]):
+        print("ERROR: pdfparameter value not found!")
+        print("possible choices are sigma, kappa, eta, all")
+        sys.exit()
+
+    # check if there is one renormalization type for each representation
+    if len(listrenorm) != len(listrepr):
+        print("ERROR: the number of renorm_type values is different from the number of representations!")
+        sys.exit()
+
+    # check if neighbor search value is admitted (only: singlepass, perradius)
+    if args._ns_ not in ['singlepass', 'perradius']:
+        print("ERROR: neighborsearch value not found!")
+        print("possible choices are singlepass, perradius")
+        sys.exit()
+
+    # if acronym is part of the catalog we proceed
+    if args._da_ in catalog:
+        # create disdrodata class (disdrorain class or disdrorain_2dvd class for 2dvd data)
+        disdrodata = catalog.dataset(args._da_)
+
+        results = list()
+        for _re_, _rnty_ in zip(listrepr, listrenorm):
+            print("processing representation:", _re_)
+            # calculate dsd paramters
+            dsdpar = _dsd_parameters_(disdrodata, _re_)
+
+            # renormalize drop size distribution parameters
+            dsdpar_r = _renormalize_(dsdpar, renorm_table, _rnty_, listparam)
+            # perform LAF: results are stored in the result cache of the disdrorain package (see disdrorain.open_resultcache)
+            # and calculated again only if the data, the renormalization values or the LAF parameters change
+            renorm_values = renorm_table.loc[renorm_table['renorm_type'] == _rnty_, :].values.tolist()
+            fitted = disdrodata.cached_result('laf', lambda: _build_model_(dsdpar_r, listparam, radius, args._oc_, args._ns_,
+                                                                             int(args._wo_)),
+                                              representation=_re_, pdfparameter=listparam, renorm_values=renorm_values,
+                                              radius=radius, occupancy=args._oc_)
+
+            # un-renormalize results
+            _listresults_ = [_unrenormalize_laf_results_(fitted[_pp_], renorm_table, _rnty_, _pp_) for _pp_ in listparam]
+            if (len(listparam) == 1) and (len(listrepr) == 1):
+                # one parameter and one representation: same table as the single fit
+                results.append(_listresults_[0])
+            else:
+                _res_ = _join_parameters_(_listresults_, listparam)
+                _res_.insert(0, 'representation', _re_)
+                results.append(_res_)
+
     else:
-        # calculate phase space paramter in the cloud representation for on 2DVD data
-        if args._re_ == 'cloudexpo':
-            # exponential law for drop speed
-            dsdpar = disdrodata.cloud_phase_space_parameters(_speed_='expo')
-        if args._re_ == 'cloudplaw':
-            # expoential law for drop speed
-            dsdpar = disdrodata.cloud_phase_space_parameters(_speed_='plaw')
-        if args._re_ == 'cloud2dvd':
-            # this are 2dvd data and we know the speed of each drop
-            dsdpar = disdrodata.cloud_phase_space_parameters()
-
-    # renormalize drop size distribution parameters
-    dsdpar_r = _renormalize_(dsdpar, renorm_table, args._rnty_, args._pp_)
-    # perform LAF
-    fitted = _build_model_(dsdpar_r, args._pp_, radius, args._oc_)
-
-else:
-    print("Acronym not found in catalog")
-    sys.exit()
-
-# un-renormalize results
-results = _unrenormalize_laf_results_(fitted, renorm_table, args._rnty_, args._pp_)
-# add site info to results
-results.loc[:, 'site'] = args._da_
-# save results to file
-results.to_csv(args._ou_, sep=' ', index=None)
+        print("Acronym not found in catalog")
+        sys.exit()
+
+    results = pd.concat(results, ignore_index=True)
+    # add site info to results
+    results.loc[:, 'site'] = args._da_
+    # save results to file
+    results.to_csv(args._ou_, sep=' ', index=None)
@@ -0,0 +1,202 @@
+# This program runs a set of analysis programs on all the datasets of the catalog (or on a subset of them)
+# Possible analyses (program executed) are
+#   dsd_parameters   -> drop_size_distribution_parameters.py
+#   dsd_moments      -> drop_size_distribution_moments.py
+#   xcorr            -> xcorr_drop_size_distribution_parameters.py
+#   pca              -> pca_dropsize_distribution_parameters.py
+#   rmi_parameters   -> mutualinfo_drop_size_distribution_parameters.py
+#   rmi_moments      -> mutualinfo_drop_size_distribution_moments.py
+#   adaptive_fitting -> adaptive_fitting.py
+#
+# The datasets are distributed over a pool of worker processes. Each worker runs all the requested analyses of
+# a dataset one after the other inside the same python process: python packages are imported only once per worker
+# and the dataset is built only once (the analysis programs obtain it from disdrorain.open_catalog, which keeps the
+# datasets already built together with their calculated attributes; only the dataset of the current task is kept).
+# Optionally the parsed values are stored in the binary cache of the disdrorain package (see the --cachedir argument)
+# and the results of the analyses (phase space parameters, RMI matrices, LAF fits) in the result cache of the
+# disdrorain package (see the --resultcache argument): running the batch again only calculates the results of new
+# (or changed) datasets and parameters. Both caches are persistent directories: they are used only if requested
+#
+# Output 1: the output files of each analysis, in the output directory, named <ID2>_<analysis output name>
+# Output 2: summary of the batch run (one row per dataset and analysis)
+#
+# Example: all RD80 and PARSIVEL datasets, cross correlation and PCA analysis, 8 workers
+#   python3 batch_analysis.py --disdrodatapath ../data --disdrocatalog ../data_catalog.csv \
+#           --instrument RD80,PARSIVEL --analyses xcorr,pca --workers 8
+# Example: options of a single analysis
+#   python3 batch_analysis.py ... --analyses dsd_parameters --analysisoptions "dsd_parameters:--representation cloudexpo"
+#
+# Author: Massimiliano Ignaccolo
+#         massimiliano.ignaccolo [at] tutanota.com. massimiliano.ignaccolo [at] sas.com
+# Last modified: Feb 01 2022
+
+
+# ------------- Necessary Python packages -START
+import os
+import sys
+import time
+import shlex
+import runpy
+import argparse
+import multiprocessing
+import pandas as pd
+
+# The disdrorain package is expected to be in the same directory where program is executed
+# If this is not the case change value of pack_path accordingly
+# pack_path = os.getcwd()
+# if pack_path not in sys.path:
+# sys.path.append(pack_path)
+import disdrorain as dr
+#  ------------- Necessary Python packages -END
+
+# analyses: program to execute and its output arguments (with default output names)
+ANALYSES = {'dsd_parameters': ('drop_size_distribution_parameters.py', {'--output': 'dsd_parameters'}),
+            'dsd_moments': ('drop_size_distribution_moments.py', {'--output': 'dsd_moments'}),
+            'xcorr': ('xcorr_drop_size_distribution_parameters.py', {'--xcorroutmatrix': 'xcorrmatrix_dsd_paramters',
+                                                                      '--xcorroutplot': 'xcorrplot_dsd_paramters'}),
+            'pca': ('pca_dropsize_distribution_parameters.py', {'--pcavarianceexp': 'pca_varexpl_dsd_paramters',
+                                                                '--pcacomponents': 'pca_compo_dsd_paramters'}),
+            'rmi_parameters': ('mutualinfo_drop_size_distribution_parameters.py', {'--rmioutmatrix': 'rmimatrix_dsd_paramters',
+                                                                                   '--rmioutplot': 'rmiplot_dsd_paramters'}),
+            'rmi_moments': ('mutualinfo_drop_size_distribution_moments.py', {'--rmioutmatrix': 'rmimatrix_dsd_moments',
+                                                                             '--rmioutplot': 'rmiplot_dsd_moments'}),
+            'adaptive_fitting': ('adaptive_fitting.py', {'--output': 'adaptive_fitting'})}
+
+# ARGUMENTS
+parser = argparse.ArgumentParser(description='run analyses on the datasets of the catalog', epilog="")
+# --disdrodatapath: path to directory contain the disdrometer data
+parser.add_argument('--disdrodatapath', action="store", dest='_ddp_', default='_NONE_')
+# --disdrocatalog: full path to file with data catalog (data catalog contain metdata about the dataset)
+parser.add_argument('--disdrocatalog', action="store", dest='_dc_', default='_NONE_')
+# --acronyms, --geoid, --instrument, --origin: comma separated lists of values of the ID2, GEO_ID, INSTRUMENT, ORIGIN
+#                                              columns of the catalog. Only datasets matching all the given lists are
+#                                              processed. Default is "all" (no selection)
+parser.add_argument('--acronyms', action="store", dest='_id2_', default='all')
+parser.add_argument('--geoid', action="store", dest='_geo_', default='all')
+parser.add_argument('--instrument', action="store", dest='_ins_', default='all')
+parser.add_argument('--origin', action="store", dest='_ori_', default='all')
+# --analyses: comma separated list of analyses to run (see the list at the beginning of the program)
+parser.add_argument('--analyses', action="store", dest='_an_', default='dsd_parameters')
+# --analysisoptions: additional arguments of an analysis program in the format "analysis:arguments"
+#                    e.g. "adaptive_fitting:--pdfparameter sigma --radiusseq LAF_radius_sequence"
+#                    can be repeated (one for each analysis)
+parser.add_argument('--analysisoptions', action="append", dest='_ao_', default=[])
+# --workers: number of worker processes. Default is 1 (no pool of processes)
+parser.add_argument('--workers', action="store", dest='_wo_', default='1')
+# --cachedir: directory of the binary cache of the parsed datasets (see disdrorain.cached_read_csv)
+#             default is the value of the environment variable DISDRORAIN_CACHEDIR or, if not set, "none": the
+#             dataset files are parsed again in each analysis (no cache)
+parser.add_argument('--cachedir', action="store", dest='_cd_', default=os.environ.get(dr.CACHEDIR_ENV, 'none'))
+# --resultcache: directory of the persistent cache of the analysis results (see disdrorain.open_resultcache)
+#                default is the value of the environment variable DISDRORAIN_RESULTCACHE or, if not set, "none":
+#                all the results are calculated again (no cache)
+parser.add_argument('--resultcache', action="store", dest='_rc_', default=os.environ.get(dr.RESULTCACHE_ENV, 'none'))
+# --outputdir: directory of the output files. Default is the directory from which code is invoked
+parser.add_argument('--outputdir', action="store", dest='_od_', default='.')
+# --output: output file name for the summary of the batch run
+parser.add_argument('--output', action="store", dest='_ou_', default='batch_summary')
+
+
+# Method for selecting the catalog rows
+def select_datasets(_catalog_, _selection_):
+    _mask_ = pd.Series(True, index=_catalog_.index)
+    for _column_, _values_ in _selection_.items():
+        if _values_ != 'all':
+            _mask_ &= _catalog_[_column_].isin(_values_.split(','))
+    return _catalog_.loc[_mask_, :]
+
+
+# Method for running all the analyses of one dataset (executed by a worker process)
+# the task carries all the values needed: worker processes do not depend on the arguments parsed by the main process
+def run_dataset(_task_):
+    (_acronym_, _analyses_, _options_, _datapath_, _catalogpath_, _outputdir_) = _task_
+    # the analysis programs obtain the dataset from this catalog (see disdrorain.open_catalog): a worker processes
+    # many datasets one after the other, only the dataset of the current task is kept in memory
+    dr.open_catalog(_catalogpath_, _datapath_).maxsize = 1
+    _rows_ = list()
+    for _name_ in _analyses_:
+        (_program_, _outputs_) = ANALYSES[_name_]
+        _argv_ = [os.path.join(os.path.dirname(os.path.abspath(__file__)), _program_),
+                  '--disdrodatapath', _datapath_, '--disdrocatalog', _catalogpath_, '--disdroacronym', _acronym_]
+        for _option_, _output_ in _outputs_.items():
+            _argv_ += [_option_, os.path.join(_outputdir_, f"{_acronym_}_{_output_}")]
+        _argv_ += _options_.get(_name_, [])
+
+        # the analysis program is executed as if invoked from the command line
+        _start_ = time.time()
+        _argv_saved_ = sys.argv
+        sys.argv = _argv_
+        try:
+            runpy.run_path(_argv_[0], run_name='__main__')
+            _status_ = 'done'
+        except SystemExit as _err_:
+            _status_ = 'exit' if _err_.code in (None, 0) else f"exit {_err_.code}"
+        except Exception as _err_:
+            _status_ = f"error: {type(_err_).__name__}: {_err_}"
+        finally:
+            sys.argv = _argv_saved_
+        _rows_.append([_acronym_, _name_, _status_, round(time.time() - _start_, 1)])
+        print(f"{_acronym_} {_name_}: {_status_}")
+
+    return _rows_
+
+
+# Method for running the batch: parse the arguments, run the analyses, write the summary
+# (only in the main process: with the "spawn" or "forkserver" start methods worker processes import this program)
+def main():
+    args = parser.parse_args()
+    print("Executing: ", sys.argv[0])
+    print()
+
+    # check the list of analyses
+    list_analyses = args._an_.split(',')
+    for _name_ in list_analyses:
+        if _name_ not in ANALYSES:
+            print("ERROR: analysis not found!", _name_)
+            print("possible choices are", ', '.join(ANALYSES.keys()))
+            sys.exit()
+    # additional arguments of the analysis programs
+    analysis_options = dict()
+    for _elem_ in args._ao_:
+        (_name_, _options_) = _elem_.split(':', 1)
+        analysis_options[_name_] = shlex.split(_options_)
+
+    # the binary cache is shared by all the analyses of a dataset (and by the worker processes)
+    if args._cd_ != 'none':
+        os.environ[dr.CACHEDIR_ENV] = os.path.abspath(args._cd_)
+    else:
+        os.environ.pop(dr.CACHEDIR_ENV, None)
+    # the result cache is shared by all the analyses (and by the worker processes)
+    if args._rc_ != 'none':
+        os.environ[dr.RESULTCACHE_ENV] = os.path.abspath(args._rc_)
+    else:
+        os.environ.pop(dr.RESULTCACHE_ENV, None)
+    os.makedirs(args._od_, exist_ok=True)
+
+    # load catalog and select datasets
+    catalog = pd.read_csv(args._dc_, sep=',')
+    selected = select_datasets(catalog, {'ID2': args._id2_, 'GEO_ID': args._geo_, 'INSTRUMENT': args._ins_, 'ORIGIN': args._ori_})
+    print("number of datasets:", selected.shape[0], " analyses:", ', '.join(list_analyses))
+    print()
+
+    # largest datasets first: the pool is kept busy until the end
+    selected = selected.sort_values(by='NREC', ascending=False)
+    list_tasks = [(_acronym_, list_analyses, analysis_options, args._ddp_, args._dc_, args._od_) for _acronym_ in selected.ID2]
+
+    results = list()
+    if int(args._wo_) > 1:
+        with multiprocessing.Pool(processes=int(args._wo_)) as pool:
+            for _rows_ in pool.imap_unordered(run_dataset, list_tasks):
+                results += _rows_
+    else:
+        for _task_ in list_tasks:
+            results += run_dataset(_task_)
+
+    results = pd.DataFrame(results, columns=['acronym', 'analysis', 'status', 'seconds'])
+    results.to_csv(os.path.join(args._od_, args._ou_), sep=' ', index=None)
+    print()
+    print(results.groupby('analysis').status.value_counts())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+# This program compares the two ways of calculating the normalization term of the rescaled mutual information (RMI)
+# The RMI of a couple of drop size distribution parameters (x,y) is MI(x,y)/MI(xs,ys) where xs, ys are the
+# sorted values of x and y (comonotone couple with the same marginal distributions of x and y).
+# The normalization term MI(xs,ys) is calculated on the sorted values with their small noise used by
+# mutualinfo_drop_size_distribution_*.py (see rmi.noisy_variables)
+#   1) with the kd-tree search of the k-nearest neighbors (as any other couple)
+#   2) as in mutualinfo_drop_size_distribution_*.py: with the search of the k-nearest neighbors for comonotone
+#      couples (lnc.MI.knn_comonotone) if the noisy sorted values are comonotone, with the kd-tree otherwise (tied
+#      values, e.g. N or Nv, are in random order after the noise is added)
+# The two values are identical except when a point has two neighbors at exactly the same distance (after the small
+# noise is added): in this case the neighbor chosen is arbitrary and the two searches might choose differently
+# Both are compared with the denominator of the original code, MI.mi_LNC([xs, ys]), which draws a new noise at each
+# call. It is averaged over --noiseseeds noise draws and its spread (standard deviation) is reported. The agreement
+# is checked with a t test: the value of the RMI programs is one more noise draw of the original denominator if the
+# difference from the mean, in standard deviations of the difference, is within the Student t quantile (--noiseseeds
+# - 1 degrees of freedom) of significance --significance divided by the number of couples of all datasets (Bonferroni
+# correction). If a couple does not agree, or a dataset is not processed, the program ends with an error (after
+# writing the outputs)
+# Note: with a few tied values the noise draws are not normally distributed (the order of the tied values after the
+#       noise is added changes the term by ~1e-4, e.g. kappa_eta of pes_r1min): with a small --noiseseeds all the
+#       draws can have the same order and a standard deviation close to 0. Use the default --noiseseeds 20
+#
+# Datasets whose data file is not in --disdrodatapath (e.g. ale_2dvd: the 2DVD drops are not distributed with the
+# repository) are processed from the dsd parameter tables stored by drop_size_distribution_parameters.py in the
+# directories of --storedparameters (files dsd_parameters_<acronym>_<representation>), if available. Otherwise the
+# summary reports why the dataset was not processed
+#
+# Note: the term does not depend only on the number of records and on k: it depends on the values of the couple
+#       (e.g. on the values of N and of the mean mu of the dataset), hence it is calculated for each couple
+#
+# Output 1: for each dataset, pdf representation and couple of parameters the two values of the normalization
+#           term, the time spent, if the comonotone search was used, mean and standard deviation of the original
+#           denominator and agreement with it
+# Output 2: summary for each dataset (file <output>_summary), including the datasets not processed and the reason.
+#           comonotone is the fraction of couples calculated with the comonotone search
+#
+# Author: Massimiliano Ignaccolo
+#         massimiliano.ignaccolo [at] tutanota.com. massimiliano.ignaccolo [at] sas.com
+# Last modified: Feb 01 2022
+
+# ------------- Necessary Python packages -START
+import os
+import sys
+import time
+import pandas as pd
+import numpy as np
+import argparse
+from scipy import stats
+
+# The disdrorain package is expected to be in the same directory where program is executed
+# The LNC mutual infromation package is expected to be in the same directory where program is executed
+# If this is not the case change value of pack_path accordingly
+# pack_path = os.getcwd()
+# if pack_path not in sys.path:
+# sys.path.append(pack_path)
+import disdrorain as dr
+import rmi
+from lnc import MI
+#  ------------- Necessary Python packages -END
+
+# ARGUMENTS
+parser = argparse.ArgumentParser(description='', epilog="")
+# --disdrodatapath: path to directory contain the disdrometer data
+parser.add_argument('--disdrodatapath', action="store", dest='_ddp_', default='_NONE_')
+# --disdrocatalog: full path to file with data catalog (data catalog contain metdata about the data
+parser.add_argument('--disdrocatalog', action="store", dest='_dc_', default='_NONE_')
+# --disdroacronyms: comma separated list of acronyms identifying the data sets in the catalog
+#                   default are the 4 data sets of the repository
+parser.add_argument('--disdroacronyms', action="store", dest='_da_', default='ale_2dvd,bby_r1min,drw_r1min,pes_r1min')
+# --seed: seed of the random generator of the small noise added to the data
+parser.add_argument('--seed', action="store", dest='_se_', default='1')
+# --noiseseeds: number of noise draws of the original denominator (seeds 0, 1, ...)
+parser.add_argument('--noiseseeds', action="store", dest='_ns_', default='20')
+# --significance: significance level of the test of agreement with the original denominator (all couples together)
+parser.add_argument('--significance', action="store", dest='_sg_', default='0.01')
+# --storedparameters: comma separated list of directories with stored dsd parameter tables, used for the datasets
+#                     whose data file is not found. Default is the analysis_results directories of the repository
+parser.add_argument('--storedparameters', action="store", dest='_sp_',
+                    default=','.join(os.path.join('..', 'disdrometer_data_clean', _site_, 'analysis_results')
+                                     for _site_ in ['ALE', 'BBY', 'DRW', 'PES']))
+# --output: output file name for the comparison results
+parser.add_argument('--output', action="store", dest='_ou_', default='benchmark_rmi_normalization')
+args = parser.parse_args()
+
+
+# Method for comparing the two values of the normalization term for all the couples of parameters
+# (and the original denominator, averaged over _noiseseeds_ noise draws)
+def compare_normalization(_temp_, _pdftype_='flux', _seed_=1, _noiseseeds_=20):
+    if _pdftype_ == 'flux':
+        listv = ['N', 'mu', 'sigma', 'gamma', 'kappa', 'eta']
+    else:
+        listv = ['Nv', 'mu', 'sigma', 'gamma', 'kappa', 'eta']
+    # sorted values with the small noise of mutualinfo_drop_size_distribution_*.py
+    points_sorted = rmi.noisy_variables(_temp_.loc[:, listv], _seed_)[1]
+    trees = MI.marginal_trees(points_sorted)
+
+    _rows_ = list()
+    for k in range(0, len(listv)):
+        for l in range(k+1, len(listv)):
+            _points_ = points_sorted[:, [k, l]]
+            _comonotone_ = MI.is_comonotone(_points_)
+            _start_ = time.time()
+            mi_tree = MI.mi_LNC_points(_points_, k=20, base=np.exp(1), alpha=0.25, trees=[trees[k], trees[l]], comonotone=False)
+            _middle_ = time.time()
+            mi_rmi = MI.mi_LNC_points(_points_, k=20, base=np.exp(1), alpha=0.25, trees=[trees[k], trees[l]])
+            _stop_ = time.time()
+            # original denominator: noise added to the sorted values
+            xs = np.sort(_temp_.loc[:, listv[k]].values)
+            ys = np.sort(_temp_.loc[:, listv[l]].values)
+            mi_old = [MI.mi_LNC([xs, ys], k=20, base=np.exp(1), alpha=0.25, rng=np.random.default_rng(_seed_))
+                      for _seed_ in range(0, _noiseseeds_)]
+            _rows_.append([f"{listv[k]}_{listv[l]}", mi_tree, mi_rmi, _comonotone_, _middle_-_start_, _stop_-_middle_,
+                           np.mean(mi_old), np.std(mi_old, ddof=1) if _noiseseeds_ > 1 else np.nan])
+
+    _res_ = pd.DataFrame(_rows_, columns=['couple', 'mi_tree', 'mi_rmi', 'comonotone', 'seconds_tree', 'seconds_rmi',
+                                          'mi_old_mean', 'mi_old_std'])
+    _res_['abs_difference'] = (_res_.mi_tree - _res_.mi_rmi).abs()
+    _res_['old_difference'] = _res_.mi_rmi - _res_.mi_old_mean
+    # difference of one noise draw from the mean of _noiseseeds_ draws, in standard deviations
+    _res_['old_difference_over_std'] = _res_.old_difference.abs() / (_res_.mi_old_std * np.sqrt(1 + 1 / _noiseseeds_))
+    _res_['pdftype'] = _pdftype_
+    return _res_
+
+
+# Method for reading the dsd parameter tables of a dataset stored by drop_size_distribution_parameters.py
+# returns a list of (table, pdf representation), empty if no table is found
+def stored_parameters(_acronym_, _directories_):
+    _suffixes_ = {'flux_r': 'flux', 'cloudexpo_r': 'cloudexpo', 'cloudplaw_r': 'cloudplaw',
+                  'cloud_rexpo': 'cloudexpo', 'cloud_rplaw': 'cloudplaw'}
+    _tables_ = list()
+    for _dir_ in _directories_:
+        for _suffix_, _pdftype_ in _suffixes_.items():
+            _path_ = os.path.join(_dir_, f"dsd_parameters_{_acronym_}_{_suffix_}")
+            if os.path.exists(_path_):
+                _tables_.append((pd.read_csv(_path_, sep=' '), _pdftype_))
+        if len(_tables_) > 0:
+            return _tables_
+    return _tables_
+
+
+print("Executing: ", sys.argv[0])
+print()
+
+catalog = dr.open_catalog(args._dc_, args._ddp_)
+
+results = list()
+notes = dict()
+for _acronym_ in args._da_.split(','):
+    if _acronym_ not in catalog:
+        notes[_acronym_] = 'not run: acronym not found in the catalog'
+        print("Skipping:", _acronym_, notes[_acronym_])
+        continue
+    instr = catalog.metadata(_acronym_)['INSTRUMENT']  # set instrument type
+    print("processing:", _acronym_)
+    if os.path.exists(os.path.join(args._ddp_, _acronym_)):
+        disdrodata = catalog.dataset(_acronym_)
+        _tables_ = [(disdrodata.psp_flux, 'flux')]
+        if (instr != '2DVD'):
+            _tables_.append((disdrodata.psp_cloud_vexpo, 'cloudexpo'))
+            _tables_.append((disdrodata.psp_cloud_vplaw, 'cloudplaw'))
+        else:
+            _tables_.append((disdrodata.psp_cloud, 'cloud2dvd'))
+        notes[_acronym_] = 'data file'
+    else:
+        _tables_ = stored_parameters(_acronym_, args._sp_.split(','))
+        if len(_tables_) == 0:
+            notes[_acronym_] = f"not run: data file not found in {args._ddp_} and no stored dsd parameter tables"
+            print("Skipping:", _acronym_, notes[_acronym_])
+            continue
+        notes[_acronym_] = f"stored dsd parameter tables ({', '.join(_pdftype_ for _, _pdftype_ in _tables_)}): data file not found"
+        print(_acronym_, notes[_acronym_])
+
+    _res_ = [compare_normalization(_table_, _pdftype_, int(args._se_), int(args._ns_))
+             for (_table_, _pdftype_) in _tables_]
+    _res_ = pd.concat(_res_, ignore_index=True)
+    _res_['site'] = _acronym_
+    _res_['instrument'] = instr
+    _res_['nrecords'] = _tables_[0][0].shape[0]
+    results.append(_res_)
+
+# summary: largest differences and total time for each data set, separately for the couples with the number of drops
+# (N or Nv: integer values with ties) and the other couples (and reason of the data sets not processed)
+summary = pd.DataFrame({'source': pd.Series(notes)})
+summary.index.name = 'site'
+if len(results) > 0:
+    results = pd.concat(results, ignore_index=True)
+    results['couples'] = np.where(results.couple.str.match(r'^Nv?_'), 'N/Nv', 'other')
+    # t test of agreement (Bonferroni correction for the number of couples)
+    _threshold_ = stats.t.ppf(1 - float(args._sg_) / (2 * results.shape[0]), int(args._ns_) - 1)
+    results['agreement'] = results.old_difference_over_std <= _threshold_
+    print(f"agreement with the original denominator: difference within {_threshold_:.2f} standard deviations")
+    results.to_csv(args._ou_, sep=' ', index=None)
+    _results_ = results.assign(rel_old_difference=(results.old_difference / results.mi_old_mean).abs())
+    _stats_ = _results_.groupby(['site', 'couples']).agg(nrecords=('nrecords', 'first'),
+                                                         max_abs_difference=('abs_difference', 'max'),
+                                                         max_mi=('mi_tree', 'max'),
+                                                         max_rel_old_difference=('rel_old_difference', 'max'),
+                                                         max_old_std=('mi_old_std', 'max'),
+                                                         max_old_difference_over_std=('old_difference_over_std', 'max'),
+                                                         agreement=('agreement', 'all'),
+                                                         comonotone=('comonotone', 'mean'),
+                                                         seconds_tree=('seconds_tree', 'sum'),
+                                                         seconds_rmi=('seconds_rmi', 'sum'))
+    summary = summary.join(_stats_.reset_index(level='couples'))
+summary.reset_index().to_csv(f"{args._ou_}_summary", sep=' ', index=None)
+print()
+with pd.option_context('display.width', 250, 'display.max_columns', 20, 'display.max_colwidth', 60):
+    print(summary)
+
+# the normalization term of the RMI programs must agree with the original denominator for all the couples of all
+# the datasets requested
+_notrun_ = [_acronym_ for _acronym_, _note_ in notes.items() if _note_.startswith('not run')]
+if (len(_notrun_) > 0) or (len(results) == 0) or (not results.agreement.all()):
+    print()
+    if len(_notrun_) > 0:
+        print(f"ERROR: agreement not checked for {', '.join(_notrun_)} (see the summary)")
+    if (len(results) > 0) and (not results.agreement.all()):
+        _bad_ = results.loc[~results.agreement, :]
+        print(f"ERROR: {_bad_.shape[0]} couples do not agree with the original denominator:")
+        print(_bad_.loc[:, ['site', 'pdftype', 'couple', 'mi_rmi', 'mi_old_mean', 'mi_old_std', 'old_difference_over_std']])
+    sys.exit(1)
@@ -5,6 +5,12 @@
 #   THIRD ROUND (remove outliers of pdf)
 #   FOURTH ROUND (remove narrow pdf)
 #
+# The drop by drop data are expected to be sorted by timestamp: the file is read a chunk of drops at a time and
+# all rounds are applied minute by minute, so that clean drops are written to the output as they are produced
+# (memory use does not depend on the size of the data set, and time is linear in the number of drops)
+# A ValueError is raised if the timestamps are not sorted (a minute split in two records would be cleaned as two
+# separate records)
+#
 # Output 1: clean disdrometer data
 # Output 2: summary of the cleaning procedure
 #
@@ -29,41 +35,50 @@ import disdrorain as dr
 # ------------- Necessary Python packages -END
 
 
-# to remove drops ouliers we cast 2DVD dat to PARSIVEL classes
-def remove_drops_outlier(r2dvd, rparsi_before, rparsi_after, _summary_):
-    _t_ = r2dvd.data.groupby('timestamp').count()
-    _t_.reset_index(inplace=True)
-    _t_.reset_index(inplace=True)
-    _t_.drop(columns=['diameter', 'speed'], inplace=True)
-    _t_.set_index('timestamp', inplace=True)
-    r2dvd.data.set_index('timestamp', inplace=True)
-    _y_ = r2dvd.data.join(_t_)
-
-    for j in range(0, _summary_.shape[0]):
-        record = _summary_.iloc[j, 0]
-        # print(j,record,type(record))
-        rb = rparsi_before.data.iloc[record, 0: 32]
-        ra = rparsi_after.data.iloc[record, 0: 32]
-        for l in range(0, 32):
-            if rb[l] != ra[l]:
-                a = rparsi_before.classlimits.loc['left', rb.index[l]]
-                b = rparsi_before.classlimits.loc['right', rb.index[l]]
-                _y_ = _y_.loc[(_y_['index'] != record) | ((_y_['index'] == record) & ((_y_.diameter < a) | (_y_.diameter >= b))), :]
-    return(_y_)
-
-
-# to remove too narrow pdfs we cast 2DVD dat to PARSIVEL classes
-def remove_drops_narrow(r2dvd, rparsi_narrows, _summary_):
-    _t_ = r2dvd.data.groupby('timestamp').count()
-    _t_.reset_index(inplace=True)
-    _t_.reset_index(inplace=True)
-    _t_.drop(columns=['diameter', 'speed'], inplace=True)
-    _t_.set_index('timestamp', inplace=True)
-    recs_toremove = rparsi_narrows.data.index.values.tolist()
-    _t_ = _t_.loc[_t_['index'].isin(recs_toremove), :]
-    timestamps_toremove = _t_.index.values.tolist()
-    _y_ = r2dvd.data.loc[~r2dvd.data['timestamp'].isin(timestamps_toremove), :]
-    return(_y_)
+# Method applying the four rounds of cleaning to a block of drops containing only complete minutes
+# the number of records, the number of drops, and the cumulated rainfall rate after each round
+# are added to the running totals (one entry per round)
+def clean_minutes(_block_, _classlimits_, _area_, _totals_):
+    diameter = _block_.diameter.values
+    speed = _block_.speed.values
+    _minutes_, _minid_ = np.unique(_block_.timestamp.values, return_inverse=True)
+    _nmin_ = len(_minutes_)
+
+    # drops per minute and update of the running totals of a round
+    def round_totals(_round_, _keep_):
+        ndrops = np.bincount(_minid_[_keep_], minlength=_nmin_)
+        # Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
+        _totals_[_round_] += [np.count_nonzero(ndrops), ndrops.sum(), (PI / 6) * (1 / _area_) * np.sum(diameter[_keep_]**3)]
+        return ndrops
+
+    # ZERO ROUND (Initial Stats)
+    _keep_ = np.ones(len(_block_), dtype=bool)
+    round_totals(0, _keep_)
+
+    # FIRST ROUND (remove drops with off-bound speed: see krawjeski paper)
+    lower_speed_bound = (9.65-10.3*np.exp(-0.6*diameter))*0.6
+    upper_speed_bound = (9.65-10.3*np.exp(-0.6*diameter))*1.4
+    _keep_ &= (speed <= upper_speed_bound) & (speed >= lower_speed_bound)
+    ndrops = round_totals(1, _keep_)
+
+    # SECOND ROUND (remove quiescent minutes)
+    _keep_ &= (ndrops >= 60)[_minid_]
+    round_totals(2, _keep_)
+
+    # THIRD ROUND (remove outliers of pdf)
+    # cast 2DVD data to parsivel classes
+    _bin_, _nclasses_ = dr.drop_classes(diameter, _classlimits_)
+    _counts_ = np.bincount(_minid_[_keep_] * _nclasses_ + _bin_[_keep_], minlength=_nmin_ * _nclasses_).reshape(_nmin_, _nclasses_)
+    _keep_ &= dr.outlier_keep_mask(_counts_)[_minid_, _bin_]
+    round_totals(3, _keep_)
+
+    # FOURTH ROUND (remove narrow pdf)
+    # cast 2DVD data to parsivel classes
+    _counts_ = np.bincount(_minid_[_keep_] * _nclasses_ + _bin_[_keep_], minlength=_nmin_ * _nclasses_).reshape(_nmin_, _nclasses_)
+    _keep_ &= ((_counts_ > 0).sum(axis=1) >= 3)[_minid_]
+    round_totals(4, _keep_)
+
+    return _block_[_keep_]
 
 
 # ARGUMENTS
@@ -79,6 +94,8 @@ parser.add_argument('--disdroarea', action="store", dest='_da_', default='10000'
 parser.add_argument('--disdrotimeresolution', action="store", dest='_dtr_', default='60')
 # --disdrooout: the processed didrometer data
 parser.add_argument('--disdroout', action="store", dest='_do_', default='_NONE_')
+# --chunksize: number of drops read at a time (default = 1000000)
+parser.add_argument('--chunksize', action="store", dest='_cs_', default='1000000')
 args = parser.parse_args()
 
 #
@@ -87,144 +104,64 @@ print()
 PI = 3.141592653589793  # approximate value of greek pi
 seconds_in_hour = 3600  # for converting rainfall rate in mm/h
 
-disdrodata = dr.disdrorain_2dvd(datapath=args._dd_, instrument_area=float(args._da_), time_interval=float(args._dtr_))
+# PARSIVEL class limits
+parsivel_limits = pd.read_csv(args._dl_, sep=' ', header=None)
+parsivel_limits.rename(index={0: 'left', 1: 'right'}, inplace=True)
 
-# print(disdrodata.data.head(5))
 # ---- preprocess
+# running totals (number of records, number of drops, cumulated rainfall rate) for each round
+totals = np.zeros((5, 3))
+
+try:
+    _reader_ = pd.read_csv(args._dd_, sep=' ', header=None, chunksize=int(args._cs_))
+except pd.errors.EmptyDataError:
+    # empty input file: empty output, all totals are 0
+    _reader_ = list()
+    open(args._do_, 'w').close()
+_carry_ = None
+_mode_ = 'w'
+for _chunk_ in _reader_:
+    _chunk_.rename(columns={0: 'timestamp', 1: 'diameter', 2: 'speed'}, inplace=True)
+    if _carry_ is not None:
+        _chunk_ = pd.concat([_carry_, _chunk_], ignore_index=True)
+    # timestamps must not decrease, within the chunk and from the minute carried from the previous chunk (all the
+    # minutes before it have already been cleaned)
+    _unsorted_ = np.flatnonzero(np.diff(_chunk_.timestamp.values) < 0)
+    if len(_unsorted_) > 0:
+        raise ValueError(f"drops are not sorted by timestamp: timestamp {_chunk_.timestamp.values[_unsorted_[0] + 1]} "
+                         f"after {_chunk_.timestamp.values[_unsorted_[0]]} (drops processed: {int(totals[0][1])})")
+    # the last minute of the chunk may continue in the next chunk: keep it for later
+    _complete_ = (_chunk_.timestamp.values != _chunk_.timestamp.values[-1])
+    _carry_ = _chunk_[~_complete_]
+    _clean_ = clean_minutes(_chunk_[_complete_], parsivel_limits, float(args._da_), totals)
+    _clean_.to_csv(args._do_, sep=' ', header=None, index=None, mode=_mode_)
+    _mode_ = 'a'
+    print("drops processed: ", int(totals[0][1]))
+# last minute of the data set
+if _carry_ is not None:
+    _clean_ = clean_minutes(_carry_, parsivel_limits, float(args._da_), totals)
+    _clean_.to_csv(args._do_, sep=' ', header=None, index=None, mode=_mode_)
+
 # define results dataframe
 results = pd.DataFrame(columns=['round', 'action_type', 'var', 'value', 'percent_of_total'])
 results = results.astype(dtype={'round': 'int64', 'action_type': 'object', 'var':  'object',
                                 'value': 'float64', 'percent_of_total': 'float64'})
 
-# ZERO ROUND (Initial Stats)
-# define count / rainfall rate dataframe
-print("ROUND: 0")
-NR = pd.DataFrame(columns=['N', 'R'])
-NR = NR.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR['N'] = disdrodata.data.groupby('timestamp')['diameter'].count().values
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR['R'] = (PI / 6) * (1 / (disdrodata.instrument_area)) * NR.N * R_df_.M3
-
-new_row = {'round': 0, 'action_type': "initial stats", 'var': "n_records", 'value': NR.shape[0], 'percent_of_total': 100}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 0, 'action_type': "initial stats", 'var': "n_drops", 'value': NR.N.sum(), 'percent_of_total': 100}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 0, 'action_type': "initial stats", 'var': "cumulated rainfall rate",
-           'value': round(NR.R.sum(), 1), 'percent_of_total': 100}
-results = results.append(new_row, ignore_index=True)
-
-# FIRST ROUND (remove drops with off-bound speed: see krawjeski paper)
-print("ROUND: 1")
-disdrodata1 = disdrodata.remove_drops_offbound_speed()
-
-# define count / rainfall rate dataframe
-NR1 = pd.DataFrame(columns=['N', 'R'])
-NR1 = NR1.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR1['N'] = disdrodata1.data.groupby('timestamp')['diameter'].count().values
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata1.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR1['R'] = (PI / 6) * (1 / (disdrodata.instrument_area)) * NR1.N * R_df_.M3
-
-new_row = {'round': 1, 'action_type': "remove drops with off-bound speed", 'var': "n_records", 'value': NR1.N.count(),
-           'percent_of_total': round(NR1.N.count()/NR.shape[0]*100, 1)}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 1, 'action_type': "remove drops with off-bound speed", 'var': "n_drops", 'value': NR1.N.sum(),
-           'percent_of_total': round(NR1.N.sum()/NR.N.sum()*100, 1)}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 1, 'action_type': "remove drops with off-bound speed", 'var': "cumulated rainfall rate",
-           'value': round(NR1.R.sum(), 1), 'percent_of_total': round(NR1.R.sum()/NR.R.sum()*100, 1)}
-results = results.append(new_row, ignore_index=True)
-
-# SECOND ROUND (remove quiescent minutes)
-print("ROUND: 2")
-disdrodata2 = disdrodata1.remove_counts_below_threshold()
-
-# define count / rainfall rate dataframe
-NR2 = pd.DataFrame(columns=['N', 'R'])
-NR2 = NR2.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR2['N'] = disdrodata2.data.groupby('timestamp')['diameter'].count().values
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata2.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR2['R'] = (PI / 6) * (1 / (disdrodata2.instrument_area)) * NR2.N * R_df_.M3
-
-new_row = {'round': 2, 'action_type': "remove quiescent minutes", 'var': "n_records", 'value': NR2.shape[0],
-           'percent_of_total': round(NR2.shape[0]/NR.shape[0]*100, 1)}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 2, 'action_type': "remove quiescent minutes", 'var': "n_drops", 'value': NR2.N.sum(),
-           'percent_of_total': round(NR2.N.sum()/NR.N.sum()*100, 1)}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 2, 'action_type': "remove quiescent minutes", 'var': "cumulated rainfall rate",
-           'value': round(NR2.R.sum(), 1), 'percent_of_total': round(NR2.R.sum()/NR.R.sum()*100, 1)}
-results = results.append(new_row, ignore_index=True)
-
-# THIRD ROUND (remove outliers of pdf)
-print("ROUND: 3")
-# cast 2DVD data to parsivel classes
-_df_ = disdrodata2.twodvd_to_parsivel()
-disdrodata2a = dr.disdrorain(classpath=args._dl_, dataframe=_df_, instrument_area=10000)
-(disdrodata2b, summary) = disdrodata2a.outlier_deletion()
-_mydata_ = remove_drops_outlier(disdrodata2, disdrodata2a, disdrodata2b, summary)
-_mydata_.reset_index(inplace=True)
-_mydata_.drop(columns=['index'], inplace=True)
-_mydata_.index.rename('record number', inplace=True)
-disdrodata3 = dr.disdrorain_2dvd(dataframe=_mydata_, instrument_area=10000)
-
-#
-NR3 = pd.DataFrame(columns=['N', 'R'])
-NR3 = NR3.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR3['N'] = disdrodata3.data.groupby('timestamp')['diameter'].count().values
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata3.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR3['R'] = (PI / 6) * (1 / (disdrodata3.instrument_area)) * NR3.N * R_df_.M3
-
-new_row = {'round': 3, 'action_type': "remove outliers of pdf", 'var': "n_records", 'value': NR3.shape[0],
-           'percent_of_total': round(NR3.shape[0]/NR.shape[0]*100, 1)}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 3, 'action_type': "remove outliers of pdf", 'var': "n_drops", 'value': NR3.N.sum(),
-           'percent_of_total': round(NR3.N.sum()/NR.N.sum()*100, 1)}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 3, 'action_type': "remove outliers of pdf", 'var': "cumulated rainfall rate",
-           'value': round(NR3.R.sum(), 1), 'percent_of_total': round(NR3.R.sum()/NR.R.sum()*100, 1)}
-results = results.append(new_row, ignore_index=True)
-
-# FOURTH ROUND (remove narrow pdf)
-print("ROUND: 4")
-# cast 2DVD data to parsivel classes
-_df_ = disdrodata3.twodvd_to_parsivel()
-disdrodata3a = dr.disdrorain(classpath=args._dl_, dataframe=_df_, instrument_area=10000)
-(disdrodata3b, disdrodata3a_n, summary) = disdrodata3a.remove_narrow(_nclmin_=3)
-_mydata_ = remove_drops_narrow(disdrodata3, disdrodata3a_n, summary)
-disdrodata4 = dr.disdrorain_2dvd(dataframe=_mydata_, instrument_area=10000)
-
-#
-NR4 = pd.DataFrame(columns=['N', 'R'])
-NR4 = NR4.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR4['N'] = disdrodata4.data.groupby('timestamp')['diameter'].count().values
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata4.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR4['R'] = (PI / 6) * (1 / int((disdrodata4.instrument_area))) * NR4.N * R_df_.M3
-
-new_row = {'round': 4, 'action_type': "remove narrow pdf", 'var': "n_records", 'value': NR4.shape[0],
-           'percent_of_total': round(NR4.shape[0]/NR.shape[0]*100, 1)}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 4, 'action_type': "remove narrow pdf", 'var': "n_drops", 'value': NR4.N.sum(),
-           'percent_of_total': round(NR4.N.sum()/NR.N.sum()*100, 1)}
-results = results.append(new_row, ignore_index=True)
-new_row = {'round': 4, 'action_type': "remove narrow pdf", 'var': "cumulated rainfall rate",
-           'value': round(NR4.R.sum(), 1), 'percent_of_total': round(NR4.R.sum()/NR.R.sum()*100, 1)}
-results = results.append(new_row, ignore_index=True)
+action_types = ["initial stats", "remove drops with off-bound speed", "remove quiescent minutes", "remove outliers of pdf",
+                "remove narrow pdf"]
+# percentages of the initial totals (0 if the initial total is 0, e.g. empty input)
+percents = np.divide(totals * 100, totals[0], out=np.zeros_like(totals), where=totals[0] > 0)
+for _round_ in range(0, 5):
+    (n_records, n_drops, rainfall) = totals[_round_]
+    new_row = {'round': [_round_], 'action_type': [action_types[_round_]], 'var': ["n_records"], 'value': [n_records],
+               'percent_of_total': [round(percents[_round_][0], 1)]}
+    results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
+    new_row = {'round': [_round_], 'action_type': [action_types[_round_]], 'var': ["n_drops"], 'value': [n_drops],
+               'percent_of_total': [round(percents[_round_][1], 1)]}
+    results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
+    new_row = {'round': [_round_], 'action_type': [action_types[_round_]], 'var': ["cumulated rainfall rate"],
+               'value': [round(rainfall, 1)], 'percent_of_total': [round(percents[_round_][2], 1)]}
+    results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
 
 # save result to file
-disdrodata4.data.to_csv(args._do_, sep=' ', header=None, index=None)
 results.to_csv('summary_'+args._do_, sep=':', index=None)
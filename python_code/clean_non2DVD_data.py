@@ -8,6 +8,10 @@
 # Output 1: clean disdrometer data
 # Output 2: summary of the cleaning procedure
 #
+# All rounds are record-local: with --chunksize the raw data are read and cleaned a chunk of records at a time
+# and clean records are appended to the output as they are produced (memory use does not depend on the
+# length of the data set)
+#
 #
 # Author: Massimiliano Ignaccolo
 #         massimiliano.ignaccolo [at] tutanota.com. massimiliano.ignaccolo [at] sas.com
@@ -41,6 +45,9 @@ parser.add_argument('--disdroarea', action="store", dest='_da_', default='5000')
 parser.add_argument('--disdrotimeresolution', action="store", dest='_dtr_', default='60')
 # --disdrooout: the processed didrometer data
 parser.add_argument('--disdroout', action="store", dest='_do_', default='_NONE_')
+# --chunksize: number of records read and cleaned at a time (streaming mode)
+#              default is 0: all records are read and cleaned at once
+parser.add_argument('--chunksize', action="store", dest='_cs_', default='0')
 args = parser.parse_args()
 
 print("Executing: ", sys.argv[0])
@@ -50,113 +57,99 @@ print()
 PI = 3.141592653589793  # approximate value of greek pi
 seconds_in_hour = 3600  # for converting rainfall rate in mm/h
 
+
+# Method for calculating number of drops (N) and rainfall rate (R) of each record
+def NR_calculator(disdro):
+    # define count / rainfall rate dataframe
+    NR = pd.DataFrame(columns=['N', 'R'])
+    NR = NR.astype(dtype={'N': 'int64', 'R': 'float64'})
+    # number of drops trough the catchment area N
+    NR['N'] = disdro.data.sum(axis=1)
+    # Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
+    R_df_ = disdro.flux_moment_calculator([3])
+    R_df_[np.isnan(R_df_)] = 0
+    NR['R'] = (PI / 6) * (1 / (disdro.instrument_area)) * NR.N * R_df_.M3
+    return NR
+
+
+# Method for applying the four rounds of cleaning to a chunk of records
+# the number of records, the number of drops, and the cumulated rainfall rate after each round
+# are added to the running totals (one entry per round)
+def clean_rounds(disdrodata, _totals_):
+    # ZERO ROUND (Initial Stats)
+    NR = NR_calculator(disdrodata)
+    _totals_[0] += [NR.shape[0], NR.N.sum(), NR.R.sum()]
+
+    # FIRST ROUND (remove zero counts records)
+    _totals_[1] += [NR[NR.N > 0].N.count(), NR.N.sum(), NR.R.sum()]
+
+    # SECOND ROUND (remove quiescent minutes)
+    disdrodata2 = disdrodata.remove_counts_below_threshold()
+    NR2 = NR_calculator(disdrodata2)
+    _totals_[2] += [NR2.shape[0], NR2.N.sum(), NR2.R.sum()]
+
+    # THIRD ROUND (remove outliers of pdf)
+    (disdrodata3, summary) = disdrodata2.outlier_deletion()
+    NR3 = NR_calculator(disdrodata3)
+    _totals_[3] += [NR3.shape[0], NR3.N.sum(), NR3.R.sum()]
+
+    # FOURTH ROUND (remove narrow pdf)
+    (disdrodata4, disdrodata3_n, summary_nn) = disdrodata3.remove_narrow(_nclmin_=3)
+    NR4 = NR_calculator(disdrodata4)
+    _totals_[4] += [NR4.shape[0], NR4.N.sum(), NR4.R.sum()]
+
+    return disdrodata4
+
+
 if (args._dl_ == "standard"):  # standard
-    disdrodata = dr.disdrorain(datapath=args._dd_, instrument_area=float(args._da_), time_interval=float(args._dtr_))
+    _classpath_ = None
 if (args._dl_ != "standard"):  # non 2dvd disdrometer data with specific classlimit
-    disdrodata = dr.disdrorain(classpath=args._dl_, datapath=args._dd_, instrument_area=float(args._da_), time_interval=float(args._dtr_))
+    _classpath_ = args._dl_
 
 # ---- preprocess
+# running totals (number of records, number of drops, cumulated rainfall rate) for each round
+totals = np.zeros((5, 3))
+
+if int(args._cs_) > 0:
+    # streaming mode: clean records a chunk at a time and append them to the output
+    try:
+        _reader_ = pd.read_csv(args._dd_, sep=' ', header=None, chunksize=int(args._cs_))
+    except pd.errors.EmptyDataError:
+        # empty input file: empty output, all totals are 0
+        _reader_ = list()
+        open(args._do_, 'w').close()
+    _mode_ = 'w'
+    for _chunk_ in _reader_:
+        disdrodata = dr.disdrorain(classpath=_classpath_, dataframe=_chunk_.reset_index(drop=True),
+                                   instrument_area=float(args._da_), time_interval=float(args._dtr_))
+        disdrodata4 = clean_rounds(disdrodata, totals)
+        disdrodata4.data.to_csv(args._do_, sep=' ', header=None, index=None, mode=_mode_)
+        _mode_ = 'a'
+else:
+    disdrodata = dr.disdrorain(classpath=_classpath_, datapath=args._dd_, instrument_area=float(args._da_),
+                               time_interval=float(args._dtr_))
+    disdrodata4 = clean_rounds(disdrodata, totals)
+    disdrodata4.data.to_csv(args._do_, sep=' ', header=None, index=None)
+
 # define results dataframe
 results = pd.DataFrame(columns=['round', 'action_type', 'var', 'value', 'percent_of_total'])
 results = results.astype(dtype={'round': 'int64', 'action_type': 'object', 'var':  'object',
                                 'value': 'float64', 'percent_of_total': 'float64'})
 
-# ZERO ROUND (Initial Stats)
-# define count / rainfall rate dataframe
-NR = pd.DataFrame(columns=['N', 'R'])
-NR = NR.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR['N'] = disdrodata.data.sum(axis=1)
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR['R'] = (PI / 6) * (1 / (disdrodata.instrument_area)) * NR.N * R_df_.M3
-
-new_row = {'round': [0], 'action_type': ["initial stats"], 'var': ["n_records"], 'value': [NR.shape[0]], 'percent_of_total': [100]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [0], 'action_type': ["initial stats"], 'var': ["n_drops"], 'value': [NR.N.sum()], 'percent_of_total': [100]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [0], 'action_type': ["initial stats"], 'var': ["cumulated rainfall rate"],
-           'value': [round(NR.R.sum(), 1)], 'percent_of_total': [100]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-
-
-# FIRST ROUND (remove zero counts records)
-new_row = {'round': [1], 'action_type': ["remove zero count records"], 'var': ["n_records"], 'value': [NR[NR.N > 0].N.count()],
-           'percent_of_total': [round(NR[NR.N > 0].N.count()/NR.shape[0]*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [1], 'action_type': ["remove zero count records"], 'var': ["n_drops"], 'value': [NR.N.sum()], 'percent_of_total': [100]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [1], 'action_type': ["remove zero count records"], 'var': ["cumulated rainfall rate"],
-           'value': [round(NR.R.sum(), 1)], 'percent_of_total': [100]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-
-# SECOND ROUND (remove quiescent minutes)
-disdrodata2 = disdrodata.remove_counts_below_threshold()
-#
-NR2 = pd.DataFrame(columns=['N', 'R'])
-NR2 = NR2.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR2['N'] = disdrodata2.data.sum(axis=1)
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata2.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR2['R'] = (PI / 6) * (1 / (disdrodata2.instrument_area)) * NR2.N * R_df_.M3
-
-new_row = {'round': [2], 'action_type': ["remove quiescent minutes"], 'var': ["n_records"], 'value': [NR2.shape[0]],
-           'percent_of_total': [round(NR2.shape[0]/NR.shape[0]*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [2], 'action_type': ["remove quiescent minutes"], 'var': ["n_drops"], 'value': [NR2.N.sum()],
-           'percent_of_total': [round(NR2.N.sum()/NR.N.sum()*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [2], 'action_type': ["remove quiescent minutes"], 'var': ["cumulated rainfall rate"], 'value': [round(NR2.R.sum(), 1)],
-           'percent_of_total': [round(NR2.R.sum()/NR.R.sum()*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-
-# THIRD ROUND (remove outliers of pdf)
-(disdrodata3, summary) = disdrodata2.outlier_deletion()
-#
-NR3 = pd.DataFrame(columns=['N', 'R'])
-NR3 = NR3.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR3['N'] = disdrodata3.data.sum(axis=1)
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata3.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR3['R'] = (PI / 6) * (1 / (disdrodata3.instrument_area)) * NR3.N * R_df_.M3
-
-new_row = {'round': [3], 'action_type': ["remove outliers of pdf"], 'var': ["n_records"], 'value': [NR3.shape[0]],
-           'percent_of_total': [round(NR3.shape[0]/NR.shape[0]*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [3], 'action_type': ["remove outliers of pdf"], 'var': ["n_drops"], 'value': [NR3.N.sum()],
-           'percent_of_total': [round(NR3.N.sum()/NR.N.sum()*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [3], 'action_type': ["remove outliers of pdf"], 'var': ["cumulated rainfall rate"], 'value': [round(NR3.R.sum(), 1)],
-           'percent_of_total': [round(NR3.R.sum()/NR.R.sum()*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-
-# FOURTH ROUND (remove narrow pdf)
-(disdrodata4, disdrodata3_n, summary_nn) = disdrodata3.remove_narrow(_nclmin_=3)
-
-NR4 = pd.DataFrame(columns=['N', 'R'])
-NR4 = NR4.astype(dtype={'N': 'int64', 'R': 'float64'})
-# number of drops trough the catchment area N
-NR4['N'] = disdrodata4.data.sum(axis=1)
-# Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
-R_df_ = disdrodata4.flux_moment_calculator([3])
-R_df_[np.isnan(R_df_)] = 0
-NR4['R'] = (PI / 6) * (1 / int((disdrodata4.instrument_area))) * NR4.N * R_df_.M3
-
-new_row = {'round': [4], 'action_type': ["remove narrow pdf"], 'var': ["n_records"], 'value': [NR4.shape[0]],
-           'percent_of_total': [round(NR4.shape[0]/NR.shape[0]*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [4], 'action_type': ["remove narrow pdf"], 'var': ["n_drops"], 'value': [NR4.N.sum()],
-           'percent_of_total': [round(NR4.N.sum()/NR.N.sum()*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-new_row = {'round': [4], 'action_type': ["remove narrow pdf"], 'var': ["cumulated rainfall rate"], 'value': [round(NR4.R.sum(), 1)],
-           'percent_of_total': [round(NR4.R.sum()/NR.R.sum()*100, 1)]}
-results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
-
-
-disdrodata4.data.to_csv(args._do_, sep=' ', header=None, index=None)
+action_types = ["initial stats", "remove zero count records", "remove quiescent minutes", "remove outliers of pdf",
+                "remove narrow pdf"]
+# percentages of the initial totals (0 if the initial total is 0, e.g. empty input)
+percents = np.divide(totals * 100, totals[0], out=np.zeros_like(totals), where=totals[0] > 0)
+for _round_ in range(0, 5):
+    (n_records, n_drops, rainfall) = totals[_round_]
+    new_row = {'round': [_round_], 'action_type': [action_types[_round_]], 'var': ["n_records"], 'value': [n_records],
+               'percent_of_total': [round(percents[_round_][0], 1)]}
+    results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
+    new_row = {'round': [_round_], 'action_type': [action_types[_round_]], 'var': ["n_drops"], 'value': [n_drops],
+               'percent_of_total': [round(percents[_round_][1], 1)]}
+    results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
+    new_row = {'round': [_round_], 'action_type': [action_types[_round_]], 'var': ["cumulated rainfall rate"],
+               'value': [round(rainfall, 1)], 'percent_of_total': [round(percents[_round_][2], 1)]}
+    results = pd.concat([results, pd.DataFrame.from_dict(new_row)], ignore_index=True)
+
 results.to_csv('summary_'+args._do_, sep=':', index=None)
@@ -7,6 +7,11 @@
 
 
 # ------------- Necessary Python packages -START
+import os
+import json
+import shutil
+import hashlib
+from collections import OrderedDict
 import pandas as pd
 import copy as cp
 import numpy as np
@@ -26,13 +31,537 @@ class LazyProperty(object):
         return result
 
 
+# environment variable with the path to the directory of the binary cache of parsed disdrometer files
+# (used when no cache directory is given explicitly)
+CACHEDIR_ENV = 'DISDRORAIN_CACHEDIR'
+
+
+# function to load the values of a file stored in the binary cache (see cached_read_csv)
+def _load_cache_entry_(_entry_, _meta_):
+    if _meta_['layout'] == 'matrix':
+        # copy=False: the data frame is a (read-only) view over the memory-mapped matrix
+        return pd.DataFrame(np.load(os.path.join(_entry_, 'matrix.npy'), mmap_mode='r'), copy=False)
+    return pd.DataFrame({i: np.load(os.path.join(_entry_, f"col{i}.npy"), mmap_mode='r') for i in range(_meta_['ncolumns'])})
+
+
+# function to load a cache entry if it is complete and stores the values of the current version of the file
+# (None otherwise, also if the entry is removed while it is read)
+def _cache_hit_(_entry_, _meta_):
+    try:
+        with open(os.path.join(_entry_, 'meta.json'), 'r') as _f_:
+            _stored_ = json.load(_f_)
+        if {k: _stored_[k] for k in _meta_ if k in _stored_} == _meta_:
+            return _load_cache_entry_(_entry_, _stored_)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+# function to read a disdrometer file (data or class limits) using a binary cache of the parsed values
+def cached_read_csv(_path_, fieldsep=' ', cachedir=None, _dtypes_=None):
+    """
+    Purpose: read a file with fields separated by fieldsep and no header (as pd.read_csv). If a cache directory is
+             given (or the environment variable DISDRORAIN_CACHEDIR is set) the parsed values are stored there in
+             binary .npy files, and later readings of the same file (same path, modification time and size) load
+             them memory-mapped without any parsing. If all columns have the same type the values are stored as
+             a single matrix (e.g. drop counts), otherwise one file per column is used (e.g. 2DVD drops)
+
+    Return: data frame
+
+    _path_: path to file
+    fieldsep: string separating field data
+    cachedir: path to the cache directory. If None the value of the environment variable DISDRORAIN_CACHEDIR is
+              used, if the variable is not set (or cachedir is an empty string) no cache is used
+    _dtypes_: numpy type used to store all the columns in the cache (e.g. np.int32 for drop counts), or
+              dictionary {column number: numpy type}. If None or if a column is not in the dictionary the column
+              type found by pd.read_csv is used. The type is used only if all values are represented exactly,
+              otherwise the column type found by pd.read_csv is used
+    """
+    if cachedir is None:
+        cachedir = os.environ.get(CACHEDIR_ENV)
+    if not cachedir:
+        return pd.read_csv(_path_, sep=fieldsep, header=None)
+    if (_dtypes_ is not None) and (not isinstance(_dtypes_, dict)):
+        _dtypes_ = {'all': _dtypes_}
+
+    _abspath_ = os.path.abspath(_path_)
+    _stat_ = os.stat(_abspath_)
+    _meta_ = {'path': _abspath_, 'mtime_ns': _stat_.st_mtime_ns, 'size': _stat_.st_size, 'fieldsep': fieldsep,
+              'dtypes': None if _dtypes_ is None else {str(k): np.dtype(v).str for k, v in _dtypes_.items()}}
+    _entry_ = os.path.join(cachedir, hashlib.sha1(_abspath_.encode()).hexdigest()[:16] + '_' + os.path.basename(_abspath_))
+
+    # cache hit: the file has not changed since it was stored
+    _hit_ = _cache_hit_(_entry_, _meta_)
+    if _hit_ is not None:
+        return _hit_
+
+    # cache miss: parse the file and store the values
+    _df_ = pd.read_csv(_path_, sep=fieldsep, header=None)
+    _columns_ = []
+    for i, _col_ in enumerate(_df_.columns):
+        _values_ = _df_[_col_].values
+        _target_ = _values_.dtype
+        if _dtypes_ is not None:
+            _target_ = np.dtype(_dtypes_.get(i, _dtypes_.get('all', _target_)))
+        # the compact type is used only if no information is lost (cached and parsed values must be identical)
+        _cast_ = _values_.astype(_target_)
+        if not np.array_equal(_cast_.astype(_values_.dtype), _values_, equal_nan=(_values_.dtype.kind == 'f')):
+            _cast_ = _values_
+        _columns_.append(_cast_)
+
+    # the entry is written in a temporary directory renamed when complete: processes sharing the cache never see
+    # (or memory-map) partially written files
+    _tmp_ = f"{_entry_}.tmp{os.getpid()}"
+    shutil.rmtree(_tmp_, ignore_errors=True)
+    os.makedirs(_tmp_)
+    if len(set(_c_.dtype for _c_ in _columns_)) == 1:
+        _meta_['layout'] = 'matrix'
+        np.save(os.path.join(_tmp_, 'matrix.npy'), np.column_stack(_columns_))
+    else:
+        _meta_['layout'] = 'columns'
+        for i, _c_ in enumerate(_columns_):
+            np.save(os.path.join(_tmp_, f"col{i}.npy"), _c_)
+    _meta_['ncolumns'] = len(_columns_)
+    with open(os.path.join(_tmp_, 'meta.json'), 'w') as _f_:
+        json.dump(_meta_, _f_)
+
+    for _attempt_ in range(0, 2):
+        try:
+            os.rename(_tmp_, _entry_)
+            # the stored values are returned as in a cache hit: results do not depend on the cache being already filled
+            return _load_cache_entry_(_entry_, _meta_)
+        except OSError:
+            pass
+        # entry already stored by another process
+        _hit_ = _cache_hit_(_entry_, _meta_)
+        if _hit_ is not None:
+            shutil.rmtree(_tmp_, ignore_errors=True)
+            return _hit_
+        # entry of an older version of the file: it is moved aside and removed (processes which have its files
+        # memory-mapped keep reading the old values)
+        _old_ = f"{_entry_}.old{os.getpid()}"
+        try:
+            os.rename(_entry_, _old_)
+            shutil.rmtree(_old_, ignore_errors=True)
+        except OSError:
+            pass
+
+    # the entry could not be replaced: the values are read in memory and the temporary directory is removed
+    _df_ = _load_cache_entry_(_tmp_, _meta_).copy(deep=True)
+    shutil.rmtree(_tmp_, ignore_errors=True)
+    return _df_
+
+
+# environment variables with the path to the directory of the persistent cache of analysis results and its maximum
+# size in bytes (used when no result cache is given explicitly, see open_resultcache)
+RESULTCACHE_ENV = 'DISDRORAIN_RESULTCACHE'
+RESULTCACHE_MAXBYTES_ENV = 'DISDRORAIN_RESULTCACHE_MAXBYTES'
+# version of the stored results: it is part of every key, change it when the way results are calculated changes
+RESULTCACHE_VERSION = 5
+
+# content hash of the files already read in this process {(path, modification time, size): hash}
+_file_fingerprints_ = dict()
+
+
+# function to obtain the content hash of a file
+def file_fingerprint(_path_):
+    """
+    Purpose: calculate the hash (sha1) of the content of a file. The hash is calculated only once in a process
+             for the same file (same path, modification time and size)
+
+    Return: string with the hexadecimal hash
+
+    _path_: path to file
+    """
+    _abspath_ = os.path.abspath(_path_)
+    _stat_ = os.stat(_abspath_)
+    _key_ = (_abspath_, _stat_.st_mtime_ns, _stat_.st_size)
+    if _key_ not in _file_fingerprints_:
+        _sha_ = hashlib.sha1()
+        with open(_abspath_, 'rb') as _f_:
+            for _block_ in iter(lambda: _f_.read(1 << 20), b''):
+                _sha_.update(_block_)
+        _file_fingerprints_[_key_] = _sha_.hexdigest()
+    return _file_fingerprints_[_key_]
+
+
+# function to obtain the hash of the values of a data frame (e.g. data not read from a file)
+def frame_fingerprint(_df_):
+    _sha_ = hashlib.sha1(json.dumps([list(map(str, _df_.columns)), list(map(str, _df_.dtypes))]).encode())
+    for _col_ in _df_.columns:
+        _sha_.update(np.ascontiguousarray(_df_[_col_].values).tobytes())
+    return _sha_.hexdigest()
+
+
+# function to store a result (data frame, numpy array, dictionary/list/tuple of them, or json value) in a directory
+# returns the description of the stored value (used to load it, see _load_result_)
+def _store_result_(_value_, _dir_, _name_):
+    if isinstance(_value_, pd.DataFrame):
+        _arrays_ = {'index': np.asarray(_value_.index)}
+        _object_ = []
+        for i, _col_ in enumerate(_value_.columns):
+            _arrays_[f"c{i}"] = np.asarray(_value_[_col_].values)
+            if _arrays_[f"c{i}"].dtype.kind == 'O':  # strings (e.g. pdftype): stored as unicode array
+                _arrays_[f"c{i}"] = _arrays_[f"c{i}"].astype(str)
+                _object_.append(i)
+        if _arrays_['index'].dtype.kind == 'O':
+            _arrays_['index'] = _arrays_['index'].astype(str)
+        np.savez(os.path.join(_dir_, _name_ + '.npz'), **_arrays_)
+        return {'type': 'frame', 'file': _name_ + '.npz', 'columns': list(_value_.columns), 'object': _object_,
+                'index_name': _value_.index.name}
+    if isinstance(_value_, np.ndarray):
+        np.save(os.path.join(_dir_, _name_ + '.npy'), _value_)
+        return {'type': 'array', 'file': _name_ + '.npy'}
+    if isinstance(_value_, dict):
+        return {'type': 'dict', 'keys': list(_value_.keys()),
+                'items': [_store_result_(v, _dir_, f"{_name_}_{i}") for i, v in enumerate(_value_.values())]}
+    if isinstance(_value_, (list, tuple)):
+        return {'type': type(_value_).__name__,
+                'items': [_store_result_(v, _dir_, f"{_name_}_{i}") for i, v in enumerate(_value_)]}
+    return {'type': 'json', 'value': _value_}
+
+
+# function to load a result stored by _store_result_
+def _load_result_(_desc_, _dir_):
+    if _desc_['type'] == 'frame':
+        with np.load(os.path.join(_dir_, _desc_['file'])) as _arrays_:
+            _columns_ = {_col_: _arrays_[f"c{i}"] for i, _col_ in enumerate(_desc_['columns'])}
+            for i in _desc_['object']:
+                _columns_[_desc_['columns'][i]] = _columns_[_desc_['columns'][i]].astype(object)
+            _index_ = pd.Index(_arrays_['index'], name=_desc_['index_name'])
+        return pd.DataFrame(_columns_, index=_index_, columns=_desc_['columns'])
+    if _desc_['type'] == 'array':
+        return np.load(os.path.join(_dir_, _desc_['file']))
+    if _desc_['type'] == 'dict':
+        return {k: _load_result_(v, _dir_) for k, v in zip(_desc_['keys'], _desc_['items'])}
+    if _desc_['type'] in ('list', 'tuple'):
+        _items_ = [_load_result_(v, _dir_) for v in _desc_['items']]
+        return tuple(_items_) if _desc_['type'] == 'tuple' else _items_
+    return _desc_['value']
+
+
+# estimated size in bytes of the result caches used in this process {cache directory: bytes}: the size found by the
+# last scan of the directory (see resultcache.evict) plus the size of the results stored since then by this process
+_resultcache_sizes_ = dict()
+
+
+# class to store analysis results on disk (content-addressed, least recently used results are discarded)
+class resultcache(object):
+    def __init__(self, cachedir=None, maxbytes=2**30):
+        """
+        resultcache class
+        # cachedir = path to the directory of the cache. If None results are not stored (every result is calculated)
+        # maxbytes = maximum size of the cache in bytes. When a new result is stored and the size of the cache is
+            larger than maxbytes the least recently used results are deleted. The size is estimated (the directory
+            is not scanned at every new result): results stored by other processes since the last scan are counted
+            only at the next scan, so the cache can temporarily be larger than maxbytes
+        Results are identified by a key (see key): a hash of everything the result depends on (e.g. the fingerprint of
+        the dataset and the parameters of the analysis). A result is never updated: when the data or the parameters
+        change the key changes, and results that are no longer used are eventually discarded
+        """
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+
+    # Method for obtaining the key of a result
+    @staticmethod
+    def key(*parts):
+        """
+        Purpose: calculate the key of a result
+
+        Return: string with the key (hexadecimal hash)
+
+        parts: json serializable values identifying the result (e.g. dataset fingerprint, analysis name, parameters)
+        """
+        return hashlib.sha1(json.dumps([RESULTCACHE_VERSION] + list(parts), sort_keys=True, default=str).encode()).hexdigest()
+
+    # Method for retrieving a stored result
+    def get(self, _key_):
+        """
+        Purpose: retrieve a stored result
+
+        Return: the stored result, None if the result is not in the cache
+
+        _key_: key of the result (see key)
+        """
+        if self.cachedir is None:
+            return None
+        _metapath_ = os.path.join(self.cachedir, _key_, 'meta.json')
+        # the result can be deleted by another process (see evict) at any time: it is then not in the cache
+        try:
+            with open(_metapath_, 'r') as _f_:
+                _desc_ = json.load(_f_)
+            os.utime(_metapath_)  # time of last use (least recently used results are discarded first)
+            return _load_result_(_desc_, os.path.join(self.cachedir, _key_))
+        except (OSError, ValueError):
+            return None
+
+    # Method for storing a result
+    def put(self, _key_, _value_):
+        """
+        Purpose: store a result (data frame, numpy array, dictionary/list/tuple of them, or json value)
+
+        Return: None
+
+        _key_: key of the result (see key)
+        _value_: result
+        """
+        if self.cachedir is None:
+            return
+        _entry_ = os.path.join(self.cachedir, _key_)
+        if os.path.exists(os.path.join(_entry_, 'meta.json')):
+            return
+        # the result is written in a temporary directory renamed when complete (processes can share the cache)
+        _tmp_ = f"{_entry_}.tmp{os.getpid()}"
+        os.makedirs(_tmp_, exist_ok=True)
+        _desc_ = _store_result_(_value_, _tmp_, 'value')
+        with open(os.path.join(_tmp_, 'meta.json'), 'w') as _f_:
+            json.dump(_desc_, _f_)
+        _nbytes_ = sum(_e_.stat().st_size for _e_ in os.scandir(_tmp_))
+        try:
+            os.rename(_tmp_, _entry_)
+        except OSError:  # already stored by another process
+            shutil.rmtree(_tmp_, ignore_errors=True)
+            return
+        # the cache directory is scanned (see evict) only when the estimated size is larger than maxbytes
+        _size_ = _resultcache_sizes_.get(self.cachedir)
+        if (_size_ is None) or (_size_ + _nbytes_ > self.maxbytes):
+            self.evict()
+        else:
+            _resultcache_sizes_[self.cachedir] = _size_ + _nbytes_
+
+    # Method for retrieving a result or calculating (and storing) it if not in the cache
+    def cached(self, _key_, _func_):
+        """
+        Purpose: retrieve a stored result. If the result is not in the cache it is calculated and stored
+
+        Return: the result
+
+        _key_: key of the result (see key)
+        _func_: function without arguments calculating the result
+        """
+        _value_ = self.get(_key_)
+        if _value_ is None:
+            _value_ = _func_()
+            self.put(_key_, _value_)
+        return _value_
+
+    # Method for deleting the least recently used results when the cache is larger than maxbytes
+    def evict(self):
+        """
+        Purpose: if the size of the cache is larger than maxbytes, delete the least recently used results until it
+                 is not larger than 90% of maxbytes (the next results can be stored without scanning the cache again)
+
+        Return: number of results deleted
+        """
+        if self.cachedir is None:
+            return 0
+        _entries_ = []
+        for _key_ in os.listdir(self.cachedir):
+            # results being written by other processes (temporary directories <key>.tmp<pid>) are not considered
+            if '.' in _key_:
+                continue
+            _metapath_ = os.path.join(self.cachedir, _key_, 'meta.json')
+            # results deleted by other processes during the scan are skipped
+            try:
+                _files_ = os.scandir(os.path.join(self.cachedir, _key_))
+                _entries_.append((os.stat(_metapath_).st_mtime, sum(_e_.stat().st_size for _e_ in _files_), _key_))
+            except OSError:
+                continue
+        _entries_.sort()
+        _total_ = sum(_e_[1] for _e_ in _entries_)
+        ndeleted = 0
+        _target_ = 0.9 * self.maxbytes if _total_ > self.maxbytes else self.maxbytes
+        while (_total_ > _target_) and (len(_entries_) > 0):
+            (_mtime_, _size_, _key_) = _entries_.pop(0)
+            shutil.rmtree(os.path.join(self.cachedir, _key_), ignore_errors=True)
+            _total_ -= _size_
+            ndeleted += 1
+        _resultcache_sizes_[self.cachedir] = _total_
+        return ndeleted
+
+
+# function to open the persistent cache of analysis results
+def open_resultcache(cachedir=None, maxbytes=None):
+    """
+    Purpose: open the persistent cache of analysis results (see the resultcache class)
+
+    Return: element of the resultcache class
+
+    cachedir: path to the cache directory. If None the value of the environment variable DISDRORAIN_RESULTCACHE is
+              used, if the variable is not set (or cachedir is an empty string) results are not stored
+    maxbytes: maximum size of the cache in bytes. If None the value of the environment variable
+              DISDRORAIN_RESULTCACHE_MAXBYTES is used (default 1 GB)
+    """
+    if cachedir is None:
+        cachedir = os.environ.get(RESULTCACHE_ENV)
+    if maxbytes is None:
+        maxbytes = int(os.environ.get(RESULTCACHE_MAXBYTES_ENV, 2**30))
+    if not cachedir:
+        return resultcache(None, maxbytes)
+    os.makedirs(cachedir, exist_ok=True)
+    return resultcache(os.path.abspath(cachedir), maxbytes)
+
+
+# cache of the "exponential" velocity cloud kernels: the kernel only depends on the class limits,
+# the velocity law constants, the number of cells and the list of moments order, so it is shared
+# by all the datasets with the same class limits (e.g. all PARSIVEL or all RD80 datasets)
+_cloud_expo_kernel_cache = dict()
+
+
+# function to obtain the (classes x moments) kernel for the cloud moments under the "exponential" drop velocity
+def cloud_expo_kernel(_left_, _right_, _alphalist_, Aexpospeed, Bexpospeed, Cexpospeed, ncells):
+    """
+    Purpose: calculate for each diameter class and each moment order alpha the average over the class of
+             D^alpha / v(D), with v(D) = Aexpospeed-Bexpospeed*exp(-Cexpospeed*D). The average is calculated
+             with the midpoint rule dividing each class in ncells cells
+
+    Return: numpy array of shape (number of classes, number of moments)
+
+    _left_: array with the left limits of the diameter classes
+    _right_: array with the right limits of the diameter classes
+    _alphalist_: list of moments order
+    """
+    _left_ = np.asarray(_left_, dtype=float)
+    _right_ = np.asarray(_right_, dtype=float)
+    _key_ = (tuple(_left_), tuple(_right_), tuple(_alphalist_), Aexpospeed, Bexpospeed, Cexpospeed, ncells)
+    if _key_ not in _cloud_expo_kernel_cache:
+        class_span = np.round(_right_ - _left_, 3)
+        _delta_ = class_span/ncells
+        # midpoint of each cell: shape (classes, cells)
+        d_effective = _left_[:, None] + (_delta_[:, None]/2) + np.arange(ncells)[None, :]*_delta_[:, None]
+        inv_speed = 1/(Aexpospeed - Bexpospeed*np.exp(-Cexpospeed*d_effective))
+        # shape (moments, classes, cells) -> (classes, moments)
+        d_alpha = np.power(d_effective[None, :, :], np.asarray(_alphalist_, dtype=float)[:, None, None])
+        _kernel_ = ((d_alpha*inv_speed[None, :, :]).sum(axis=2)*_delta_[None, :] / class_span[None, :]).T
+        _kernel_.setflags(write=False)
+        _cloud_expo_kernel_cache[_key_] = _kernel_
+    return _cloud_expo_kernel_cache[_key_]
+
+
+# function to calculate the phase space parameters (statistical moments) of a pdf from its moments
+def central_moments(_df_):
+    """
+    Purpose: calculate mean (mu), standard deviation (sigma), skewness (gamma), kurtosis (kappa),
+             fifth central moment (eta), sixth central moment (omega) from the moments M1, ..., M6 of a pdf
+
+    Return: _df_ with the above quantities as additional columns
+
+    _df_: data frame with the moments as columns (M1, ..., M6), e.g. output of the moment calculators
+    """
+    # the quantities are calculated on the arrays of the moments: same values, without the overhead of the data frame
+    # arithmetic (relevant when the records are processed one by one, see disdrorain_online)
+    (M1, M2, M3, M4, M5, M6) = [_df_[f"M{elem}"].values.astype(float) for elem in range(1, 7)]
+    # records with drops in one class only: sigma is 0 and the higher moments are missing or infinite
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _df_['mu'] = M1
+        _df_['sigma'] = pow((M2 - pow(M1, 2)), 0.5)
+        _df_['gamma'] = (M3 + (2 * pow(M1, 3)) - (3 * M1 * M2)) / (pow((M2 - (M1 * M1)), 1.5))
+        _df_['kappa'] = (M4 - (3 * pow(M1, 4)) + (6 * M2 * pow(M1, 2))
+                         - (4 * M1 * M3)) / (pow((M2 - (M1 * M1)), 2))
+        _df_['eta'] = (M5 + (4 * pow(M1, 5)) + (10 * M3 * pow(M1, 2)) - (10 * M2 * pow(M1, 3))
+                       - (5 * M4 * M1)) / (pow((M2 - (M1 * M1)), 2.5))
+        _df_['omega'] = (M6 - (6 * M5 * M1) + (15 * M4 * pow(M1, 2)) - (20 * M3 * pow(M1, 3))
+                         + (15 * M2 * pow(M1, 4)) - (5 * pow(M1, 6))) / (pow((M2 - (M1 * M1)), 3))
+    return _df_
+
+
+# cache of the fused moment kernels of count data: as the "exponential" velocity cloud kernels, they depend only
+# on the class limits, the velocity laws constants, the number of cells and the list of moments order
+_count_moment_kernel_cache = dict()
+
+
+# function to obtain the (classes x moments) kernel of the flux, cloud "plaw" and cloud "exponential" moments
+def count_moment_kernel(_left_, _right_, _alphalist_, Aplawspeed, Bplawspeed, Aexpospeed, Bexpospeed, Cexpospeed, ncells):
+    """
+    Purpose: calculate for each diameter class and each moment order alpha the average over the class of
+             1) D^alpha (flux pdf)
+             2) D^alpha / v(D), with v(D) = Aplawspeed*D^Bplawspeed (cloud pdf, "plaw" drop velocity)
+             3) D^alpha / v(D), with v(D) = Aexpospeed-Bexpospeed*exp(-Cexpospeed*D) (cloud pdf, "exponential" drop
+                velocity, see cloud_expo_kernel)
+             Multiplying the count matrix (records x classes) by the kernel gives the sums needed by the moments of
+             all records in the three representations with a single matrix multiply
+
+    Return: numpy array of shape (number of classes, 3 * number of moments): the flux, cloud "plaw" and cloud
+            "exponential" columns one block after the other (same order of moments of _alphalist_ in each block)
+
+    _left_: array with the left limits of the diameter classes
+    _right_: array with the right limits of the diameter classes
+    _alphalist_: list of moments order
+    """
+    _left_ = np.asarray(_left_, dtype=float)
+    _right_ = np.asarray(_right_, dtype=float)
+    _key_ = (tuple(_left_), tuple(_right_), tuple(_alphalist_), Aplawspeed, Bplawspeed, Aexpospeed, Bexpospeed,
+             Cexpospeed, ncells)
+    if _key_ not in _count_moment_kernel_cache:
+        class_span = _right_ - _left_
+        # average of D^alpha over a class: (right^(alpha+1) - left^(alpha+1)) / (class span * (alpha+1))
+        _alpha_ = np.asarray(_alphalist_, dtype=float)[None, :]
+        _flux_ = (pow(_right_[:, None], _alpha_ + 1) - pow(_left_[:, None], _alpha_ + 1)) / (class_span[:, None] * (_alpha_ + 1))
+        _alpha_ = _alpha_ - Bplawspeed
+        _plaw_ = (pow(_right_[:, None], _alpha_ + 1) - pow(_left_[:, None], _alpha_ + 1)) / \
+            (class_span[:, None] * (_alpha_ + 1)) / Aplawspeed
+        _expo_ = cloud_expo_kernel(_left_, _right_, _alphalist_, Aexpospeed, Bexpospeed, Cexpospeed, ncells)
+        _kernel_ = np.hstack([_flux_, _plaw_, _expo_])
+        _kernel_.setflags(write=False)
+        _count_moment_kernel_cache[_key_] = _kernel_
+    return _count_moment_kernel_cache[_key_]
+
+
+# function to find the counts that are not outliers
+def outlier_keep_mask(_matrix_):
+    """
+    Purpose: for all records (rows of _matrix_) at once we find
+             1) the class with max count
+             2) the class span of consencutive non zero counts which include the class with max count:
+                it goes from the last zero count class left of the max to the first zero count class right of the max
+             All other counts will be considered outliers
+
+    Return: boolean numpy array with the same shape of _matrix_: False for outliers counts
+
+    _matrix_: numpy array with drop counts (one row per record, one column per class)
+    """
+    _classes_ = np.arange(_matrix_.shape[1])[None, :]
+    imax = _matrix_.argmax(axis=1)[:, None]
+    zero_mask = (_matrix_ == 0)
+    lb = np.where(zero_mask & (_classes_ < imax), _classes_, -1).max(axis=1)[:, None]
+    rb = np.where(zero_mask & (_classes_ > imax), _classes_, _matrix_.shape[1]).min(axis=1)[:, None]
+    return (_classes_ >= lb) & (_classes_ < rb)
+
+
+# function to find the disdrometer class of each drop
+def drop_classes(_diameters_, classlimits=None):
+    """
+    Purpose: find the class (0 for first class) to which drops of given diameter belong. A drop belongs
+             to a class if left <= diameter < left of the next class. Drops smaller (larger) than the first (last)
+             class limit are assigned to the first (last) class
+
+    Return: (array with the class of each drop, number of classes)
+
+    _diameters_: array with the diameter of the drops
+    classlimits: data frame with the class limits (rows 'left' and 'right', one column per class) as the
+                 classlimits attribute of the disdrorain class. If None the PARSIVEL class limits are used
+    """
+    # PARSIVEL class limits
+    parsivel_edges = [0, 0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1, 1.125, 1.25, 1.5, 1.75, 2, 2.25, 2.5,
+                      3, 3.5, 4, 4.5, 5, 6, 7, 8, 9, 10, 12, 14, 16, 18, 20, 23, 26]
+
+    if classlimits is None:
+        _edges_ = np.array(parsivel_edges, dtype=float)
+    else:
+        _edges_ = np.append(classlimits.loc['left', :].values, classlimits.loc['right', :].values[-1]).astype(float)
+    _nclasses_ = len(_edges_) - 1
+
+    _bin_ = np.searchsorted(_edges_, _diameters_, side='right') - 1
+    return np.clip(_bin_, 0, _nclasses_ - 1), _nclasses_
+
+
 # class to process disdrometer data that are divided in classes (e.g. non 2DVD data)
 class disdrorain(object):
     def __init__(self, classpath=None, datapath=None, dataframe=None, fieldsep=' ',
                  instrument_area=5000, time_interval=60,
                  Aplawspeed=3.776, Bplawspeed=0.67,
                  Aexpospeed=9.65, Bexpospeed=10.3, Cexpospeed=0.6,
-                 ncells=25):
+                 ncells=25, cachedir=None, copy_data=True, rescache=None):
         """
         didrorain class
         # classpath = path to disdrometer class limits file
@@ -49,6 +578,14 @@ class disdrorain(object):
         # ncells = number of cells in which to divide a disdrometer class when calculating moments for a "cloud" distribution
             under the "exponential" law velocity. This division is necessary to ensure that inside each cell the speed can
             be considered  constant
+        # cachedir = path to the directory of the binary cache of parsed files (see cached_read_csv).
+            If None the environment variable DISDRORAIN_CACHEDIR is used, if not set no cache is used.
+            When the cache is used the data are a read-only view over the memory-mapped int32 count matrix
+        # copy_data = if False the data of dataframe are not copied but shared with it (the methods of the class never
+            modify the data in place)
+        # rescache = element of the resultcache class where the results of the calculations are stored (see
+            cached_result). If None the cache given by the environment variable DISDRORAIN_RESULTCACHE is used, if not
+            set results are not stored
         """
 
         # default diameter classes: RD80 Valdvogel
@@ -58,11 +595,17 @@ class disdrorain(object):
                      'C13': [2.441, 2.727], 'C14': [2.727, 3.011], 'C15': [3.011, 3.385], 'C16': [3.385, 3.704],
                      'C17': [3.704, 4.127], 'C18': [4.127, 4.573], 'C19': [4.573, 5.145], 'C20': [5.145, 5.601]}
         # if we are reading disdrometer data from csv file
+        self.rescache = open_resultcache() if rescache is None else rescache
+        # content hash of the data file (only if results are stored, see fingerprint)
+        self._source_ = None
         if datapath is not None:
-            self.data = pd.read_csv(datapath, sep=fieldsep, header=None)
+            self.data = cached_read_csv(datapath, fieldsep=fieldsep, cachedir=cachedir, _dtypes_=np.int32)
+            if self.rescache.cachedir is not None:
+                self._source_ = file_fingerprint(datapath)
         # if disdrometer data are already in a data frame
         if dataframe is not None:
-            self.data = dataframe.copy()
+            self.data = dataframe.copy(deep=copy_data)
+            self._source_ = None
         self.data.rename(columns=lambda x: 'C' + str(x + 1), inplace=True)
         self.data.index.name = 'record number'
         # if path to a csv file containing the limits of each class is not specified then use
@@ -71,7 +614,7 @@ class disdrorain(object):
             self.classlimits = pd.DataFrame(data=default_d)
             self.classlimits.rename(index={0: 'left', 1: 'right'}, inplace=True)
         else:  # load class limits from file
-            self.classlimits = pd.read_csv(classpath, sep=fieldsep, header=None)
+            self.classlimits = cached_read_csv(classpath, fieldsep=fieldsep, cachedir=cachedir, _dtypes_=np.float64)
             self.classlimits.rename(columns=lambda x: 'C' + str(x + 1), index={0: 'left', 1: 'right'}, inplace=True)
         self.classlimits.index.name = 'class borders'
         # initialize remaining class attributes
@@ -84,19 +627,63 @@ class disdrorain(object):
         self.Cexpospeed = Cexpospeed
         self.ncells = ncells
 
+    # Method for removing the values of the lazy attributes (e.g. psp_flux) calculated on the current data
+    def _clear_lazy_properties_(self):
+        for _name_, _attr_ in type(self).__dict__.items():
+            if isinstance(_attr_, LazyProperty):
+                self.__dict__.pop(_name_, None)
+
+    # Method for creating a new element of the class with the same attributes but different data:
+    # only the data are new, all other attributes (e.g. the class limits) are shared and not copied
+    def _copy_with_data_(self, _data_):
+        _obj_ = cp.copy(self)
+        _obj_.data = _data_
+        _obj_._source_ = None
+        _obj_._clear_lazy_properties_()
+        return _obj_
+
+    # this attribute is not initialized at time of object class creation
+    # but only if requested
+    @LazyProperty
+    # fingerprint attribute: hash of the data and of all the attributes used in the calculations (class limits,
+    # instrument area, velocity laws, ...). Results calculated with the same fingerprint are the same
+    def fingerprint(self):
+        _data_ = self._source_ if self._source_ is not None else frame_fingerprint(self.data)
+        return resultcache.key('disdrorain', _data_, self.classlimits.values.tolist(), float(self.instrument_area),
+                               float(self.time_interval), self.Aplawspeed, self.Bplawspeed, self.Aexpospeed,
+                               self.Bexpospeed, self.Cexpospeed, self.ncells)
+
+    # Method for retrieving a result from the result cache (calculating and storing it if not found)
+    def cached_result(self, _name_, _func_, **_params_):
+        """
+        Purpose: retrieve a result of the calculations on the data from the result cache (see the resultcache class).
+                 If the result is not found it is calculated and stored. The result is identified by the fingerprint
+                 of the element, the name of the calculation and its parameters: if the data, the class limits, ...
+                 or the parameters change the result is calculated again
+
+        Return: the result
+
+        _name_: name of the calculation (e.g. 'psp_flux', 'rmi_parameters')
+        _func_: function without arguments calculating the result
+        _params_: parameters of the calculation (json serializable values)
+        """
+        if self.rescache.cachedir is None:
+            return _func_()
+        return self.rescache.cached(resultcache.key(self.fingerprint, _name_, _params_), _func_)
+
     # this attribute is not initialized at time of object class creation
     # but only if requested
     @LazyProperty
     # Bulk Variable attribute: obtain bulk variables values using the "plaw" drop velocity
     def bulkvar_vplaw(self):
-        return self.bulk_variables()
+        return self.cached_result('bulkvar_vplaw', self.bulk_variables)
 
     # this attribute is not initialized at time of object class creation
     # but only if requested
     @LazyProperty
     # Bulk Variable attribute: obtain bulk variables values using the "exponential" drop velocity
     def bulkvar_vexpo(self):
-        return self.bulk_variables(_speed_='expo')
+        return self.cached_result('bulkvar_vexpo', lambda: self.bulk_variables(_speed_='expo'))
 
     # this attribute is not initialized at time of object class creation
     # but only if requested
@@ -104,7 +691,7 @@ class disdrorain(object):
     # phase space parameters attribute for flux representation:
     # obtain the satistical moments (phase space parameteres) of the flux pdf
     def psp_flux(self):
-        return self.flux_phase_space_parameters()
+        return self.cached_result('psp_flux', self.flux_phase_space_parameters)
 
     # this attribute is not initialized at time of object class creation
     # but only if requested
@@ -112,7 +699,7 @@ class disdrorain(object):
     # phase space parameters attribute for cloud representation under the "plaw" drop velocity:
     # obtain the satistical moments (phase space parameteres) of the cloud-plaw pdf
     def psp_cloud_vplaw(self):
-        return self.cloud_phase_space_parameters()
+        return self.cached_result('psp_cloud_vplaw', self.cloud_phase_space_parameters)
 
     # this attribute is not initialized at time of object class creation
     # but only if requested
@@ -120,7 +707,7 @@ class disdrorain(object):
     # phase space parameters attribute for cloud representation under the "exponential" drop velocity:
     # obtain the satistical moments (phase space parameteres) of the cloud-expo pdf
     def psp_cloud_vexpo(self):
-        return self.cloud_phase_space_parameters(_speed_='expo')
+        return self.cached_result('psp_cloud_vexpo', lambda: self.cloud_phase_space_parameters(_speed_='expo'))
 
     # this attribute is not initialized at time of object class creation
     # but only if requested
@@ -129,6 +716,49 @@ class disdrorain(object):
     def spectrum_flux(self):
         return self.flux_drop_pdf()
 
+    # Moment kernel shared by the moment calculators, the phase space parameters and the bulk variables:
+    # the number of drops and the flux, cloud "plaw" and cloud "exponential" sums of all the moments are obtained
+    # with one matrix multiply of the count matrix by the fused kernel (see count_moment_kernel)
+    def moment_kernel(self, _alphalist_):
+        """
+        Purpose: calculate for each record the number of drops and the sums over the classes of the counts times the
+                 class averages of D^alpha (flux), D^alpha/v with "plaw" velocity and D^alpha/v with "exponential"
+                 velocity (cloud) for all the moments in _alphalist_. The result is cached: the moments orders 0 to 6
+                 are always calculated, so that flux moments, cloud moments, phase space parameters and bulk
+                 variables of all the representations share the same matrix multiply
+
+        Return: (drops_per_record, flux_sums, cloud_plaw_sums, cloud_expo_sums) where drops_per_record is an array
+                with one value per record, and the sums are arrays with shape (records, moments)
+
+        _alphalist_: list of moments order
+        """
+        _left_ = self.classlimits.loc['left', :].values
+        _right_ = self.classlimits.loc['right', :].values
+        _params_ = (tuple(_left_), tuple(_right_), self.Aplawspeed, self.Bplawspeed, self.Aexpospeed, self.Bexpospeed,
+                    self.Cexpospeed, self.ncells)
+        # the cache is valid as long as the data frame is the same object and the kernel parameters do not change
+        _cache_ = self.__dict__.get('_moment_kernel_cache')
+        if (_cache_ is None) or (_cache_[0] is not self.data) or (_cache_[1] != _params_):
+            _cache_ = (self.data, _params_, dict())
+            self._moment_kernel_cache = _cache_
+        for _orders_, _result_ in _cache_[2].items():
+            if set(_alphalist_) <= set(_orders_):
+                _columns_ = [_orders_.index(elem) for elem in _alphalist_]
+                return (_result_[0],) + tuple(_sums_[:, _columns_] for _sums_ in _result_[1:])
+
+        _orders_ = tuple(sorted(set(_alphalist_) | {0, 1, 2, 3, 4, 5, 6}))
+        _kernel_ = count_moment_kernel(_left_, _right_, _orders_, self.Aplawspeed, self.Bplawspeed, self.Aexpospeed,
+                                       self.Bexpospeed, self.Cexpospeed, self.ncells)
+        _counts_ = self.data.values
+        drops_per_record = _counts_.sum(axis=1, dtype=np.int64)
+        # (records x classes) x (classes x 3*moments): one BLAS matrix multiply
+        _sums_ = _counts_.dot(_kernel_)
+        _result_ = (drops_per_record,) + tuple(np.split(_sums_, 3, axis=1))
+
+        _cache_[2][_orders_] = _result_
+        _columns_ = [_orders_.index(elem) for elem in _alphalist_]
+        return (_result_[0],) + tuple(_sums_[:, _columns_] for _sums_ in _result_[1:])
+
     # Moment Calculator method for the flux pdf
     def flux_moment_calculator(self, _alphalist_):
         """
@@ -140,13 +770,12 @@ class disdrorain(object):
         """
 
         moments_dict = dict()
-        drops_per_record = self.data.sum(axis=1)
-        class_span = self.classlimits.loc['right', :] - self.classlimits.loc['left', :]
-        for elem in _alphalist_:
-            class_span_alphap1 = pow(self.classlimits.loc['right', :], elem + 1) - pow(self.classlimits.loc['left', :], elem + 1)
-            moments_dict[f"M{elem}"] = self.data.dot(class_span_alphap1 / (class_span * (elem + 1))) / drops_per_record
+        drops_per_record, flux_sums, _, _ = self.moment_kernel(_alphalist_)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i, elem in enumerate(_alphalist_):
+                moments_dict[f"M{elem}"] = flux_sums[:, i] / drops_per_record
 
-        _df_ = pd.DataFrame(moments_dict)
+        _df_ = pd.DataFrame(moments_dict, index=self.data.index)
         return _df_
 
     # Moment Calculator method for the cloud pdf:
@@ -161,98 +790,26 @@ class disdrorain(object):
         _speed_: specifiy the law to use for the drop velocity deafult values is "plaw"
         """
 
-        # the zero-th moment is necessary for calculation
-        # we need to add to the list of calculated moments and then drop it if the zero-th
-        #   moment is not explicitely requested
-        zero_drop = False
+        # the zero-th moment is necessary for calculation: the moments of order alpha are
+        # <D^alpha/v> / <1/v>, the zero-th moment is <1/v>
+        moments_dict = dict()
         _alpha_ = _alphalist_.copy()
+        if 0 not in _alpha_:
+            _alpha_.append(0)
 
         # if _speed_ is anything but 'expo' the plaw formula for drop velocity is considered
-        if (_speed_ == 'expo'):
-            if 0 not in _alpha_:
-                _alpha_.append(0)
-                zero_drop = True
-            moments_dict = dict()
-            drops_per_record = self.data.sum(axis=1)
-            class_df = self.classlimits
-            _array_ = np.zeros(class_df.shape[1])
-            for elem in _alpha_:
-                for diamclass in range(0, class_df.shape[1]):
-                    class_span = round(class_df.loc['right', class_df.columns[diamclass]] -
-                                       class_df.loc['left', class_df.columns[diamclass]], 3)
-                    _delta_ = class_span/self.ncells
-                    _sum_ = 0.0
-                    for j in range(0, self.ncells):
-                        d_effective = class_df.loc['left', class_df.columns[diamclass]] + (_delta_/2) + j*_delta_
-                        _sum_ = _sum_ + \
-                            pow(d_effective, elem) / (self.Aexpospeed - self.Bexpospeed*np.exp(-self.Cexpospeed*d_effective))*_delta_
-                    _array_[diamclass] = _sum_ / class_span
-                _series_ = pd.Series(_array_, index=class_df.columns)
-                moments_dict[f"X{elem}"] = self.data.dot(_series_) / drops_per_record
-
-            #
-            _df_ = pd.DataFrame(moments_dict)
-            columns_drop = list()
-            for elem in _alpha_:
-                columns_drop.append(f"X{elem}")
-
-            #
-            if zero_drop is True:
-                columns_drop.append('M0')
-                for elem in _alpha_:
-                    _df_[f"M{elem}"] = _df_[f"X{elem}"]/_df_.X0
-            else:
-                for elem in _alpha_:
-                    if elem != 0:
-                        _df_[f"M{elem}"] = _df_[f"X{elem}"]/_df_.X0
-                    else:
-                        _df_[f"M{elem}"] = _df_[f"X{elem}"]
-
-            _df_.drop(columns=columns_drop, inplace=True)
-
-        # the drop velocity is power law
-        else:
-            if 0 not in _alpha_:
-                _alpha_.append(0)
-                zero_drop = True
-            _alpha_new = _alpha_.copy()
-            i = 0
-            for elem in _alpha_:
-                _alpha_new[i] = _alpha_[i]-self.Bplawspeed
-                i = i+1
-            _df_ = self.flux_moment_calculator(_alpha_new)/self.Aplawspeed
-
-            #
-            columns_drop = list()
-            for elem in _alpha_new:
-                columns_drop.append(f"M{elem}")
-
-            #
-            if zero_drop is True:
-                columns_drop.append('X-0.67')
-                for elem in _alpha_new:
-                    _df_[f"X{elem}"] = _df_[f"M{elem}"]/_df_['M-0.67']
-            else:
-                for elem in _alpha_new:
-                    if elem != -0.67:
-                        _df_[f"X{elem}"] = _df_[f"M{elem}"]/_df_['M-0.67']
-                    else:
-                        _df_[f"X{elem}"] = _df_[f"M{elem}"]
-
-            _df_.drop(columns=columns_drop, inplace=True)
-
-            #
-            columns_name = list()
-            if zero_drop is True:
-                for elem in _alpha_:
-                    if elem != 0:
-                        columns_name.append(f"M{elem}")
-            else:
-                for elem in _alpha_:
-                    columns_name.append(f"M{elem}")
-
-            _df_.columns = columns_name
+        drops_per_record, _, plaw_sums, expo_sums = self.moment_kernel(_alpha_)
+        cloud_sums = expo_sums if (_speed_ == 'expo') else plaw_sums
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _x_ = cloud_sums / drops_per_record[:, None]
+            _m0_ = _x_[:, _alpha_.index(0)]
+            for i, elem in enumerate(_alphalist_):
+                if elem != 0:
+                    moments_dict[f"M{elem}"] = _x_[:, i] / _m0_
+                else:
+                    moments_dict[f"M{elem}"] = _m0_
 
+        _df_ = pd.DataFrame(moments_dict, index=self.data.index)
         return _df_
 
     # Method for remove isolted drop counts (outliers)
@@ -275,38 +832,21 @@ class disdrorain(object):
         change_original: flag to decide if disdrorain class element output is (A <-> True) or (B <-> False)
         """
 
-        # the clean up function finds
-        # 1) the class with max count
-        # 2) the class span of consencutive non zero counts which include the class with max count
-        # All other counts will be considered outliers
-        def cleanup(x):
-            imax = x.argmax()
-            zeroin = np.where(x == 0)[0]
-            if len(np.where(zeroin > imax)[0]) > 0:
-                rbi = np.where(zeroin > imax)[0].min()
-                rb = zeroin[rbi]
-                for i in range(rb, len(x)):
-                    x[i] = 0
-            if len(np.where(zeroin < imax)[0]) > 0:
-                lbi = np.where(zeroin < imax)[0].max()
-                lb = zeroin[lbi]
-                for i in range(0, lb):
-                    x[i] = 0
-            return x
+        _matrix_ = self.data.values
+        keep_mask = outlier_keep_mask(_matrix_)
+        _tempdata_ = pd.DataFrame(np.where(keep_mask, _matrix_, 0), columns=self.data.columns, index=self.data.index)
+
+        sum_prior = self.data.sum(axis=1)  # total number of drops in each record prior to outlier removal
+        sum_after = _tempdata_.sum(axis=1)  # total number of drops in each racord after outlier removal
 
         # check if we keep original disdrorain class element untouched or not
         if change_original is False:
-            # self_no_outliers = cp.deepcopy(self)
-            rainobj = cp.deepcopy(self)
+            rainobj = self._copy_with_data_(_tempdata_)
         else:
             rainobj = self
-
-        sum_prior = rainobj.data.sum(axis=1)  # total number of drops in each record prior to outlier removal
-        _matrix_ = rainobj.data.values
-        for i, row in enumerate(_matrix_):
-            _matrix_[i] = cleanup(row)
-        _tempdata_ = pd.DataFrame(_matrix_, columns=rainobj.data.columns, index=rainobj.data.index)
-        sum_after = _tempdata_.sum(axis=1)  # total number of drops in each racord after outlier removal
+            rainobj.data = _tempdata_
+            rainobj._source_ = None
+            rainobj._clear_lazy_properties_()
 
         # create summary data frame -- START
         _df1_ = pd.DataFrame({'ndrops_prior': sum_prior.values})
@@ -326,6 +866,39 @@ class disdrorain(object):
         else:
             return summary
 
+    # Method for creating a new element of the class with only the records selected by a boolean mask:
+    # if all records are selected the data are shared (no copy)
+    def _select_records_(self, _mask_, renumber=True):
+        if _mask_.all():
+            _data_ = self.data.copy(deep=False)
+        else:
+            _data_ = self.data.iloc[np.flatnonzero(_mask_)]
+        if renumber is True:
+            _data_.index = pd.RangeIndex(len(_data_), name='record number')
+        return self._copy_with_data_(_data_)
+
+    # Method for finding the records with a large enough drop count
+    def counts_threshold_mask(self, _countth_=60):
+        """
+        Purporse: find the records with a drop count not smaller than a threshold
+
+        Return: boolean array (True for records with count >= _countth_)
+
+        _countth_: the count threshold
+        """
+        return self.data.values.sum(axis=1) >= _countth_
+
+    # Method for finding the records where enough classes are occupied
+    def narrow_mask(self, _nclmin_=4):
+        """
+        Purporse: find the records where at least _nclmin_ classes are occupied
+
+        Return: boolean array (True for records with at least _nclmin_ non zero classes)
+
+        _nclmin_: minumum number of class to be occupied
+        """
+        return np.count_nonzero(self.data.values, axis=1) >= _nclmin_
+
     # Method for removing records with a too small drop count
     def remove_counts_below_threshold(self, _countth_=60):
         """
@@ -336,12 +909,7 @@ class disdrorain(object):
         _countth_: the count threshold
         """
 
-        disdroclass_good = cp.deepcopy(self)
-        disdroclass_good.data['ndrops'] = disdroclass_good.data.sum(axis=1)
-        disdroclass_good.data = disdroclass_good.data[disdroclass_good.data['ndrops'] >= _countth_]
-        disdroclass_good.data.reset_index(inplace=True)
-        disdroclass_good.data.drop(columns=['ndrops', 'record number'], inplace=True)
-        disdroclass_good.data.index.names = ['record number']
+        disdroclass_good = self._select_records_(self.counts_threshold_mask(_countth_))
 
         return (disdroclass_good)
 
@@ -355,13 +923,10 @@ class disdrorain(object):
         _nclmin_: minumum number of class to be occupied
         """
 
-        disdroclass_notnarrow = cp.deepcopy(self)
-        disdroclass_narrow = cp.deepcopy(self)
-        disdroclass_narrow.data['nzero_ncl'] = disdroclass_narrow.data[disdroclass_narrow.data != 0].count(axis=1)
-        disdroclass_notnarrow.data['nzero_ncl'] = disdroclass_notnarrow.data[disdroclass_notnarrow.data != 0].count(axis=1)
-        disdroclass_notnarrow.data = \
-            disdroclass_notnarrow.data.loc[disdroclass_notnarrow.data.nzero_ncl >= _nclmin_, :].drop(columns=['nzero_ncl'])
-        disdroclass_narrow.data = disdroclass_narrow.data.loc[disdroclass_narrow.data.nzero_ncl < _nclmin_, :].drop(columns=['nzero_ncl'])
+        _mask_ = self.narrow_mask(_nclmin_)
+        # the narrow records keep their original record number
+        disdroclass_notnarrow = self._select_records_(_mask_)
+        disdroclass_narrow = self._select_records_(~_mask_, renumber=False)
 
         _row_ = [[disdroclass_notnarrow.data.shape[0], disdroclass_notnarrow.data.sum().sum(),
                   round(disdroclass_notnarrow.bulkvar_vplaw.R.sum()), 'legit']]
@@ -369,10 +934,6 @@ class disdrorain(object):
                       round(disdroclass_narrow.bulkvar_vplaw.R.sum()), 'narrow'])
         _summary_ = pd.DataFrame(_row_, columns=['nrecords', 'ndrops', 'rainfall_total', 'type'])
 
-        disdroclass_notnarrow.data.reset_index(inplace=True)
-        disdroclass_notnarrow.data.drop(columns=['record number'], inplace=True)
-        disdroclass_notnarrow.data.index.names = ['record number']
-
         return (disdroclass_notnarrow, disdroclass_narrow, _summary_)
 
     # Method for calculating the phase space parameters (statistical moments) of the pdf in the flux representation
@@ -386,16 +947,8 @@ class disdrorain(object):
         """
         list_moments_order = list([1, 2, 3, 4, 5, 6])
         _df_ = self.flux_moment_calculator(list_moments_order)
-        _df_['N'] = self.data.sum(axis=1)
-        _df_['mu'] = _df_.M1
-        _df_['sigma'] = pow((_df_.M2 - pow(_df_.M1, 2)), 0.5)
-        _df_['gamma'] = (_df_.M3 + (2 * pow(_df_.M1, 3)) - (3 * _df_.M1 * _df_.M2)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 1.5))
-        _df_['kappa'] = (_df_.M4 - (3 * pow(_df_.M1, 4)) + (6 * _df_.M2 * pow(_df_.M1, 2))
-                         - (4 * _df_.M1 * _df_.M3)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 2))
-        _df_['eta'] = (_df_.M5 + (4 * pow(_df_.M1, 5)) + (10 * _df_.M3 * pow(_df_.M1, 2)) - (10 * _df_.M2 * pow(_df_.M1, 3))
-                       - (5 * _df_.M4 * _df_.M1)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 2.5))
-        _df_['omega'] = (_df_.M6 - (6 * _df_.M5 * _df_.M1) + (15 * _df_.M4 * pow(_df_.M1, 2)) - (20 * _df_.M3 * pow(_df_.M1, 3))
-                         + (15 * _df_.M2 * pow(_df_.M1, 4)) - (5 * pow(_df_.M1, 6))) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 3))
+        _df_['N'] = self.moment_kernel(list_moments_order)[0]
+        _df_ = central_moments(_df_)
         _df_.drop(columns=['M1', 'M2', 'M3', 'M4', 'M5', 'M6'], inplace=True)
         return _df_
 
@@ -415,17 +968,9 @@ class disdrorain(object):
             _df_ = self.cloud_moment_calculator(list_moments_order, _speed_='expo')
         else:
             _df_ = self.cloud_moment_calculator(list_moments_order, _speed_='plaw')
-        _df_['N'] = self.data.sum(axis=1)
+        _df_['N'] = self.moment_kernel(list_moments_order)[0]
         _df_['Nv'] = (round(1 / ((self.instrument_area / 1000000) * self.time_interval) * _df_.N * _df_.M0)).astype(int)
-        _df_['mu'] = _df_.M1
-        _df_['sigma'] = pow((_df_.M2 - pow(_df_.M1, 2)), 0.5)
-        _df_['gamma'] = (_df_.M3 + (2 * pow(_df_.M1, 3)) - (3 * _df_.M1 * _df_.M2)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 1.5))
-        _df_['kappa'] = (_df_.M4 - (3 * pow(_df_.M1, 4)) + (6 * _df_.M2 * pow(_df_.M1, 2))
-                         - (4 * _df_.M1 * _df_.M3)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 2))
-        _df_['eta'] = (_df_.M5 + (4 * pow(_df_.M1, 5)) + (10 * _df_.M3 * pow(_df_.M1, 2)) - (10 * _df_.M2 * pow(_df_.M1, 3))
-                       - (5 * _df_.M4 * _df_.M1)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 2.5))
-        _df_['omega'] = (_df_.M6 - (6 * _df_.M5 * _df_.M1) + (15 * _df_.M4 * pow(_df_.M1, 2)) - (20 * _df_.M3 * pow(_df_.M1, 3))
-                         + (15 * _df_.M2 * pow(_df_.M1, 4)) - (5 * pow(_df_.M1, 6))) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 3))
+        _df_ = central_moments(_df_)
         _df_.drop(columns=['N', 'M0', 'M1', 'M2', 'M3', 'M4', 'M5', 'M6'], inplace=True)
         return _df_
 
@@ -451,7 +996,7 @@ class disdrorain(object):
                    'z': 'float64', 'w': 'float64'})
 
         # number of drops trough the catchment area N
-        NNvbulk['N'] = self.data.sum(axis=1)
+        NNvbulk['N'] = pd.Series(self.moment_kernel([0, 3, 6])[0], index=self.data.index)
 
         # Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
         R_df_ = self.flux_moment_calculator([3])
@@ -482,12 +1027,11 @@ class disdrorain(object):
 
         Return: data frame with pdf value per class (one row per record)
         """
-        dropfreq = cp.deepcopy(self.data)
-        dropfreq['ndrops'] = dropfreq.sum(axis=1)
-        dropfreq = dropfreq.div(dropfreq['ndrops'].values, axis=0)
-        dropfreq.drop(['ndrops'], axis=1, inplace=True)
-        class_span = self.classlimits.loc['right', :] - self.classlimits.loc['left', :]
-        droppdf = dropfreq/class_span
+        _counts_ = self.data.values
+        class_span = (self.classlimits.loc['right', :] - self.classlimits.loc['left', :]).values
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dropfreq = _counts_ / _counts_.sum(axis=1)[:, None]
+        droppdf = pd.DataFrame(dropfreq / class_span, columns=self.data.columns, index=self.data.index)
 
         return droppdf
 
@@ -498,72 +1042,34 @@ class disdrorain(object):
                  See https://hess.copernicus.org/articles/16/329/2012/hess-16-329-2012.pdf
         Return: data frame with the values of additional parameters
         """
-        pdf_df = self.flux_drop_pdf()
-        _df_ = cp.deepcopy(self.flux_phase_space_parameters()[['N']])
-
-        # mode variables
-        idxmax = pdf_df.idxmax(axis=1)  # column -- class with the maximum value of the pdf
-        pdfmax = pdf_df.max(axis=1)  # max value of pdf
-        diammax = self.classlimits.loc['left', idxmax] + (self.classlimits.loc['right', idxmax] - self.classlimits.loc['left', idxmax]) / 2
-        _df_.loc[:, 'class_mode'] = idxmax.values
-        _df_.loc[:, 'modeclassn'] = (idxmax.str.extract(r'([0-9]+)')).values.astype(int)
-        _df_.loc[:, 'pdf_mode'] = pdfmax
-        _df_.loc[:, 'D_mode'] = diammax.values
-
-        # span variables
-        res = pdf_df[pdf_df != 0].stack()
-        res.rename_axis(index=['record number', 'class'], inplace=True)
-        res2 = res.reset_index().drop(columns=[0])
-        firstclass = res2.groupby(['record number']).head(1)
-        firstclass.set_index('record number', inplace=True)
-        firstclass.columns = ['first_notzero_class']
-        lastclass = res2.groupby(['record number']).tail(1)
-        lastclass.set_index('record number', inplace=True)
-        lastclass.columns = ['last_notzero_class']
-
-        _df_ = _df_.join(firstclass)
-        _df_ = _df_.join(lastclass)
-        _df_['fclassn'] = _df_.first_notzero_class.str.extract(r'([0-9]+)').astype(int)
-        _df_['lclassn'] = _df_.last_notzero_class.str.extract(r'([0-9]+)').astype(int)
-        _df_['D_span'] = self.classlimits.loc['right', _df_.last_notzero_class].values - \
-            self.classlimits.loc['left', _df_.first_notzero_class].values
-
-        # gradient
-        _df_.loc[:, 'pln'] = (_df_.modeclassn-4)  # .astype(str)
-        _df_.loc[:, 'prn'] = (_df_.modeclassn+4)  # .astype(str)
-        _df_.loc[_df_.modeclassn-4 < _df_.fclassn, 'pln'] = (_df_.fclassn)  # .astype(str)
-        _df_.loc[_df_.modeclassn+4 > _df_.lclassn, 'prn'] = (_df_.lclassn)  # .astype(str)
-
-        _df_.loc[:, 'pl'] = 'C' + (_df_.modeclassn-4).astype(str)
-        _df_.loc[:, 'pr'] = 'C' + (_df_.modeclassn+4).astype(str)
-        _df_.loc[_df_.modeclassn-4 < _df_.fclassn, 'pl'] = 'C' + (_df_.fclassn).astype(str)
-        _df_.loc[_df_.modeclassn+4 > _df_.lclassn, 'pr'] = 'C' + (_df_.lclassn).astype(str)
-        _df_.reset_index(inplace=True)
-
-        pdf_df_matrix = pdf_df.values
-
-        rn = _df_.index.values
-        pdfpl = _df_.pln.values-1
-        pdfpr = _df_.prn.values-1
-        pdfmode = _df_.modeclassn.values-1
-
-        _df_.loc[:, 'delta_pdf_left'] = pdf_df_matrix[rn, pdfpl] - pdf_df_matrix[rn, pdfmode]
-        _df_.loc[:, 'delta_pdf_right'] = pdf_df_matrix[rn, pdfpr] - pdf_df_matrix[rn, pdfmode]
-        _df_.loc[:, 'delta_D_left'] = self.classlimits.loc['left', _df_.class_mode].values + \
-            (self.classlimits.loc['right', _df_.class_mode].values - self.classlimits.loc['left', _df_.class_mode].values)/2 - \
-            self.classlimits.loc['left', _df_.pl].values
-        _df_.loc[:, 'delta_D_right'] = self.classlimits.loc['right', _df_.pr].values - \
-            (self.classlimits.loc['left', _df_.class_mode].values +
-             (self.classlimits.loc['right', _df_.class_mode].values - self.classlimits.loc['left', _df_.class_mode].values)/2)
-        _df_.loc[:, 'grad_left'] = _df_.delta_pdf_left / _df_.delta_D_left
-        _df_.loc[:, 'grad_right'] = _df_.delta_pdf_right / _df_.delta_D_right
-
-        _df_.set_index('record number', inplace=True)
-        _df_.drop(columns=['class_mode', 'first_notzero_class', 'last_notzero_class', 'pl', 'pr', 'pln', 'prn', 'delta_pdf_left',
-                           'delta_pdf_right', 'delta_D_left', 'delta_D_right'], inplace=True)
-        _df_.columns = ['N', 'class_mode', 'pdf_mode', 'D_mode', 'first_notzero_class', 'last_notzero_class', 'D_span',
-                        'grad_left', 'grad_right']
-
+        pdf = self.flux_drop_pdf().values
+        _left_ = self.classlimits.loc['left', :].values
+        _right_ = self.classlimits.loc['right', :].values
+        _middle_ = _left_ + (_right_ - _left_) / 2
+        rn = np.arange(pdf.shape[0])
+
+        # mode variables: class with the maximum value of the pdf (first one if more than one) and its value
+        # (records without drops have no pdf: the first class is used)
+        pdfmode = np.argmax(np.where(np.isnan(pdf), -np.inf, pdf), axis=1)
+        pdfmax = pdf[rn, pdfmode]
+
+        # span variables: first and last class with non zero pdf
+        _notzero_ = pdf != 0
+        _first_ = np.argmax(_notzero_, axis=1)
+        _last_ = pdf.shape[1] - 1 - np.argmax(_notzero_[:, ::-1], axis=1)
+
+        # gradient: between the mode and the class 4 classes to the left (right) of the mode,
+        # but not beyond the first (last) class with non zero pdf
+        pdfpl = np.maximum(pdfmode - 4, _first_)
+        pdfpr = np.minimum(pdfmode + 4, _last_)
+        grad_left = (pdf[rn, pdfpl] - pdfmax) / (_middle_[pdfmode] - _left_[pdfpl])
+        grad_right = (pdf[rn, pdfpr] - pdfmax) / (_right_[pdfpr] - _middle_[pdfmode])
+
+        # class numbers start from 1 (class C1 is the first class)
+        _df_ = pd.DataFrame({'N': self.data.values.sum(axis=1, dtype=np.int64), 'class_mode': pdfmode + 1,
+                             'pdf_mode': pdfmax, 'D_mode': _middle_[pdfmode], 'first_notzero_class': _first_ + 1,
+                             'last_notzero_class': _last_ + 1, 'D_span': _right_[_last_] - _left_[_first_],
+                             'grad_left': grad_left, 'grad_right': grad_right}, index=self.data.index)
         return _df_
 
     # Method for calculating the renormalized spectrum (probability density) for each record (flux representation)
@@ -571,52 +1077,53 @@ class disdrorain(object):
         """
         Purpose: Calculate the renormalized probability density function for each record (flux representation)
                  D -> Dr = (D-mu)/sigma
+                 The pdf of each class is spread over the Dr bins in proportion to the fraction of each bin covered
+                 by the renormalized class, weighted with the number of drops of the record, and summed over records
 
-        Return: data frame with the renormalized spectrum for each record
+        Return: data frame with the renormalized spectrum (bins with non zero pdf)
 
         _bin_: bin size used for calcularing the renormalized spectrum
         Dr_left: minimum vale of Dr used when calculating the renormalized spectrum
         Dr_right: maximum vale of Dr used when calculating the renormalized spectrum
         """
-        _spectrum_ = self.flux_drop_pdf()
-        pdf = _spectrum_.values
-
-        cll = cp.deepcopy(self.classlimits)
+        pdf = self.flux_drop_pdf().values
 
-        _N_ = self.flux_phase_space_parameters()[['N']].values
-        _mu_ = self.flux_phase_space_parameters()[['mu']].values
-        _sigma_ = self.flux_phase_space_parameters()[['sigma']].values
+        # phase space parameters calculated only once (see psp_flux)
+        _psp_ = self.psp_flux
+        _N_ = _psp_['N'].values
+        _mu_ = _psp_['mu'].values
+        _sigma_ = _psp_['sigma'].values
 
-        _b_ = np.append(cll.loc[['left']].values, cll.loc[['right']].values[0, cll.shape[1]-1])
-        _borders_ = np.tile(_b_, (_spectrum_. shape[0], 1))
-        _borders_renorm = (_borders_[:, :]-_mu_[:])/_sigma_[:]
+        # renormalized class borders of all records in units of bins from Dr_left: (records x classes+1)
+        _b_ = np.append(self.classlimits.loc['left', :].values, self.classlimits.loc['right', :].values[-1])
+        _borders_renorm = ((_b_[None, :] - _mu_[:, None]) / _sigma_[:, None] - Dr_left) / _bin_
 
         _nbins_ = np.floor((Dr_right - Dr_left)/_bin_).astype(int)
-        res = np.zeros((_spectrum_.shape[0], _nbins_))
-
-        # print(res.shape)
-        for _row_ in range(0, _spectrum_.shape[0]):
-            # print(_row_)
-            for i in range(0, pdf.shape[1]):
-                lb = (_borders_renorm[_row_][i]+5)/_bin_
-                lb_int = lb.astype(int)
-                lb_rem = lb-lb_int
-                rb = (_borders_renorm[_row_][i+1]+5)/_bin_
-                rb_int = rb.astype(int)
-                rb_rem = rb-rb_int
-                # print(i,lb,lb_int,lb_rem,rb,rb_int,rb_rem)
-                if(pdf[_row_][i] > 0):
-                    # print(_row_,i,lb,lb_int,lb_rem,rb,rb_int,rb_rem)
-                    for k in range(lb_int+1, rb_int):
-                        res[_row_][k] = pdf[_row_][i]*_sigma_[_row_][0]
-                        # print(i,k,res[_row_][k])
-                    res[_row_][lb_int] = res[_row_][lb_int] + (1-lb_rem)*pdf[_row_][i]*_sigma_[_row_][0]
-                    res[_row_][rb_int] = res[_row_][rb_int] + rb_rem*pdf[_row_][i]*_sigma_[_row_][0]
-
-            res[_row_][:] = res[_row_][:]*_N_[_row_][0]
+
+        # one element per record and non empty class: renormalized borders (lb, rb) and mass per bin (N*pdf*sigma)
+        with np.errstate(invalid='ignore'):
+            _row_, _class_ = np.nonzero(pdf > 0)
+        lb = _borders_renorm[_row_, _class_]
+        rb = _borders_renorm[_row_, _class_ + 1]
+        _mass_ = pdf[_row_, _class_] * _sigma_[_row_] * _N_[_row_]
+        _finite_ = np.isfinite(lb) & np.isfinite(rb) & np.isfinite(_mass_)
+        (lb, rb, _mass_) = (lb[_finite_], rb[_finite_], _mass_[_finite_])
+
+        # fraction of each bin k covered by the class [lb, rb]: the bins from floor(lb) to floor(rb) are processed
+        # at once (broadcasting), in chunks of elements to limit the memory used, and scatter-added to the histogram
+        res = np.zeros(_nbins_)
+        lb_int = np.floor(lb).astype(np.int64)
+        _nspan_ = np.floor(rb).astype(np.int64) - lb_int + 1
+        _chunk_ = max(1, 2**22 // max(1, int(_nspan_.max(initial=1))))
+        for _start_ in range(0, len(lb), _chunk_):
+            _sl_ = slice(_start_, _start_ + _chunk_)
+            k = lb_int[_sl_, None] + np.arange(_nspan_[_sl_].max())[None, :]
+            _overlap_ = np.minimum(rb[_sl_, None], k + 1) - np.maximum(lb[_sl_, None], k)
+            _inside_ = (_overlap_ > 0) & (k >= 0) & (k < _nbins_)
+            res += np.bincount(k[_inside_], weights=(_overlap_ * _mass_[_sl_, None])[_inside_], minlength=_nbins_)
 
         xr = np.arange(Dr_left, Dr_right, _bin_)
-        renpdf = res.sum(axis=0)/_N_.sum()
+        renpdf = res/_N_.sum()
 
         _pd_ = pd.DataFrame({'Dr': xr, 'pdf': renpdf})
         _pd_ = _pd_.loc[_pd_.pdf > 0, :]
@@ -626,7 +1133,7 @@ class disdrorain(object):
 # class to process 2DVD disdrometer data
 class disdrorain_2dvd(object):
     def __init__(self, datapath=None, dataframe=None, fieldsep=' ',
-                 instrument_area=5000, time_interval=60):
+                 instrument_area=5000, time_interval=60, cachedir=None, rescache=None):
         """
         didrorain class for 2DVD data
         # datapath = path to file
@@ -636,12 +1143,25 @@ class disdrorain_2dvd(object):
             Default value is 10000 = 100cm^2
         # time_interval = time interval of disdrometer recording in seconds.
             Default value is 60 = 1 minute
+        # cachedir = path to the directory of the binary cache of parsed files (see cached_read_csv).
+            If None the environment variable DISDRORAIN_CACHEDIR is used, if not set no cache is used.
+            Diameter and speed of drops are stored in single precision when this does not change their values
+        # rescache = element of the resultcache class where the results of the calculations are stored (see
+            cached_result). If None the cache given by the environment variable DISDRORAIN_RESULTCACHE is used, if not
+            set results are not stored
         """
 
+        self.rescache = open_resultcache() if rescache is None else rescache
+        # content hash of the data file (only if results are stored, see fingerprint)
+        self._source_ = None
         if datapath is not None:
-            self.data = pd.read_csv(datapath, sep=fieldsep, header=None)
+            self.data = cached_read_csv(datapath, fieldsep=fieldsep, cachedir=cachedir,
+                                        _dtypes_={1: np.float32, 2: np.float32})
+            if self.rescache.cachedir is not None:
+                self._source_ = file_fingerprint(datapath)
         if dataframe is not None:
             self.data = dataframe.copy()
+            self._source_ = None
         self.data.rename(columns={0: 'timestamp', 1: 'diameter', 2: 'speed'}, inplace=True)
         self.data.index.name = 'record number'
         self.instrument_area = instrument_area
@@ -652,7 +1172,7 @@ class disdrorain_2dvd(object):
     @LazyProperty
     # Bulk Variable attribute: obtain bulk variables values using the "plaw" drop velocity
     def bulkvar(self):
-        return self.bulk_variables()
+        return self.cached_result('bulkvar', self.bulk_variables)
 
     # this attribute is not initialized at time of object class creation
     # but only if requested
@@ -660,7 +1180,7 @@ class disdrorain_2dvd(object):
     # phase space parameters attribute for flux representation:
     # obtain the satistical moments (phase space parameteres) of the flux pdf
     def psp_flux(self):
-        return self.flux_phase_space_parameters()
+        return self.cached_result('psp_flux', self.flux_phase_space_parameters)
 
     # this attribute is not initialized at time of object class creation
     # but only if requested
@@ -668,7 +1188,41 @@ class disdrorain_2dvd(object):
     # phase space parameters attribute for cloud representation under the "plaw" drop velocity:
     # obtain the satistical moments (phase space parameteres) of the cloud-plaw pdf
     def psp_cloud(self):
-        return self.cloud_phase_space_parameters()
+        return self.cached_result('psp_cloud', self.cloud_phase_space_parameters)
+
+    # this attribute is not initialized at time of object class creation
+    # but only if requested
+    @LazyProperty
+    # fingerprint attribute: hash of the data and of all the attributes used in the calculations (instrument area
+    # and time resolution). Results calculated with the same fingerprint are the same
+    def fingerprint(self):
+        _data_ = self._source_ if self._source_ is not None else frame_fingerprint(self.data)
+        return resultcache.key('disdrorain_2dvd', _data_, float(self.instrument_area), float(self.time_interval))
+
+    # Method for retrieving a result from the result cache (calculating and storing it if not found)
+    def cached_result(self, _name_, _func_, **_params_):
+        """
+        Purpose: retrieve a result of the calculations on the data from the result cache (see the resultcache class).
+                 If the result is not found it is calculated and stored. The result is identified by the fingerprint
+                 of the element, the name of the calculation and its parameters: if the data or the parameters
+                 change the result is calculated again
+
+        Return: the result
+
+        _name_: name of the calculation (e.g. 'psp_flux', 'rmi_parameters')
+        _func_: function without arguments calculating the result
+        _params_: parameters of the calculation (json serializable values)
+        """
+        if self.rescache.cachedir is None:
+            return _func_()
+        return self.rescache.cached(resultcache.key(self.fingerprint, _name_, _params_), _func_)
+
+    # Method for removing the values of the lazy attributes (e.g. psp_flux, fingerprint) after the data are changed
+    def _clear_lazy_properties_(self):
+        self._source_ = None
+        for _name_, _attr_ in type(self).__dict__.items():
+            if isinstance(_attr_, LazyProperty):
+                self.__dict__.pop(_name_, None)
 
     # Method for calculating the bulk variables
     def bulk_variables(self):
@@ -690,8 +1244,8 @@ class disdrorain_2dvd(object):
                    'z': 'float64', 'w': 'float64'})
 
         # number of drops trough the catchment area N
-        drops_per_record = self.data.groupby('timestamp')['diameter'].count()
-        NNvbulk['N'] = drops_per_record.values
+        drops_per_record, _, _ = self.moment_kernel([0, 3, 6])
+        NNvbulk['N'] = drops_per_record
 
         # Rainfall rate depends on the 3rd "flux" moment no matter what is the equation for v(D)
         R_df_ = self.flux_moment_calculator([3])
@@ -712,6 +1266,51 @@ class disdrorain_2dvd(object):
         NNvbulk.drop(columns=['Nv_float'], inplace=True)
         return NNvbulk
 
+    # Moment kernel shared by the moment calculators, the phase space parameters and the bulk variables:
+    # the timestamps are factorized once and the sums over the drops of each record of D^alpha (flux)
+    # and D^alpha/v (cloud) are obtained for all the moments with a single segmented sum
+    def moment_kernel(self, _alphalist_):
+        """
+        Purpose: calculate for each record (timestamp) the number of drops and the sums of D^alpha and D^alpha/v
+                 for all the moments in _alphalist_. The result is cached: the moments orders 0 to 6 are always
+                 calculated, so that flux moments, cloud moments and bulk variables share the same single pass
+
+        Return: (drops_per_record, flux_sums, cloud_sums) where drops_per_record is an array with one value per
+                record, and flux_sums, cloud_sums are arrays with shape (records, moments)
+
+        _alphalist_: list of moments order
+        """
+        # the cache is valid as long as the data frame is the same object
+        _cache_ = self.__dict__.get('_moment_kernel_cache')
+        if (_cache_ is None) or (_cache_[0] is not self.data):
+            _cache_ = (self.data, dict())
+            self._moment_kernel_cache = _cache_
+        for _orders_, _result_ in _cache_[1].items():
+            if set(_alphalist_) <= set(_orders_):
+                _columns_ = [_orders_.index(elem) for elem in _alphalist_]
+                return _result_[0], _result_[1][:, _columns_], _result_[2][:, _columns_]
+
+        _orders_ = tuple(sorted(set(_alphalist_) | {0, 1, 2, 3, 4, 5, 6}))
+        timestamp = self.data.timestamp.values
+        diameter = self.data.diameter.values.astype(float)
+        speed = self.data.speed.values.astype(float)
+        # sort drops by timestamp (2DVD files are already sorted: no reordering is done in this case)
+        if np.any(timestamp[1:] < timestamp[:-1]):
+            _order_ = np.argsort(timestamp, kind='stable')
+            timestamp, diameter, speed = timestamp[_order_], diameter[_order_], speed[_order_]
+        # first drop of each record
+        _starts_ = np.flatnonzero(np.r_[True, timestamp[1:] != timestamp[:-1]])
+        drops_per_record = np.diff(np.r_[_starts_, len(timestamp)])
+
+        # (drops x moments) blocks of D^alpha and D^alpha/v
+        d_alpha = np.power(diameter[:, None], np.array(_orders_, dtype=float)[None, :])
+        flux_sums = np.add.reduceat(d_alpha, _starts_, axis=0)
+        cloud_sums = np.add.reduceat(d_alpha / speed[:, None], _starts_, axis=0)
+
+        _cache_[1][_orders_] = (drops_per_record, flux_sums, cloud_sums)
+        _columns_ = [_orders_.index(elem) for elem in _alphalist_]
+        return drops_per_record, flux_sums[:, _columns_], cloud_sums[:, _columns_]
+
     # Moment Calculator method for the flux pdf
     def flux_moment_calculator(self, _alphalist_):
         """
@@ -723,13 +1322,9 @@ class disdrorain_2dvd(object):
         """
 
         moments_dict = dict()
-        drops_per_record = self.data.groupby('timestamp')['diameter'].count()
-        _tempdf_ = self.data.copy()
-        for elem in _alphalist_:
-            _tempdf_.loc[:, 'd_alpha'] = pow(_tempdf_.diameter, elem)
-            _sum_ = _tempdf_.groupby('timestamp')['d_alpha'].sum()
-            _malpha_ = _sum_/drops_per_record
-            moments_dict[f"M{elem}"] = _malpha_.values
+        drops_per_record, flux_sums, _ = self.moment_kernel(_alphalist_)
+        for i, elem in enumerate(_alphalist_):
+            moments_dict[f"M{elem}"] = flux_sums[:, i]/drops_per_record
 
         _df_ = pd.DataFrame(moments_dict)
         return _df_
@@ -739,43 +1334,25 @@ class disdrorain_2dvd(object):
         """
         Purpose: calculate for each record all the moments in the list of moments _alphalist_ (cloud pdf)
 
-        Return: data frame with moments as columns
+        Return: data frame with moments as columns (the zero-th moment is always included)
 
         _alphalist_: list of moments order (needs to be a python list)
         """
         moments_dict = dict()
-        drops_per_record = self.data.groupby('timestamp')['diameter'].count()
-        _tempdf_ = self.data.copy()
+        _alpha_ = _alphalist_.copy()
 
-        if 0 not in _alphalist_:
-            _alphalist_.append(0)
+        if 0 not in _alpha_:
+            _alpha_.append(0)
 
-        for elem in _alphalist_:
-            _tempdf_.loc[:, 'd_alpha'] = pow(_tempdf_.diameter, elem)/_tempdf_.speed
-            _sum_ = _tempdf_.groupby('timestamp')['d_alpha'].sum()
-            _malpha_ = _sum_/drops_per_record
-            moments_dict[f"M{elem}"] = _malpha_.values
+        drops_per_record, _, cloud_sums = self.moment_kernel(_alpha_)
+        _m0_ = cloud_sums[:, _alpha_.index(0)]/drops_per_record
+        for i, elem in enumerate(_alpha_):
+            if elem != 0:
+                moments_dict[f"M{elem}"] = cloud_sums[:, i]/drops_per_record/_m0_
+            else:
+                moments_dict[f"M{elem}"] = _m0_
 
         _df_ = pd.DataFrame(moments_dict)
-
-        columns_drop = list()
-        columns_name = list()
-
-        if 0 not in _alphalist_:
-            for elem in _alphalist_:
-                columns_drop.append(f"M{elem}")
-                if elem != 0:
-                    columns_name.append(f"M{elem}")
-                    _df_[f"X{elem}"] = _df_[f"M{elem}"]/_df_['M0']
-        else:
-            for elem in _alphalist_:
-                columns_name.append(f"M{elem}")
-                if elem != 0:
-                    columns_drop.append(f"M{elem}")
-                    _df_[f"X{elem}"] = _df_[f"M{elem}"]/_df_['M0']
-
-        _df_.drop(columns=columns_drop, inplace=True)
-        _df_.columns = columns_name
         return _df_
 
     # Method for calculating the phase space parameters (statistical moments) of the pdf in the flux representation
@@ -789,17 +1366,9 @@ class disdrorain_2dvd(object):
         """
         list_moments_order = list([1, 2, 3, 4, 5, 6])
         _df_ = self.flux_moment_calculator(list_moments_order)
-        drops_per_record = self.data.groupby('timestamp')['diameter'].count()
-        _df_['N'] = drops_per_record.values
-        _df_['mu'] = _df_.M1
-        _df_['sigma'] = pow((_df_.M2 - pow(_df_.M1, 2)), 0.5)
-        _df_['gamma'] = (_df_.M3 + (2 * pow(_df_.M1, 3)) - (3 * _df_.M1 * _df_.M2)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 1.5))
-        _df_['kappa'] = (_df_.M4 - (3 * pow(_df_.M1, 4)) + (6 * _df_.M2 * pow(_df_.M1, 2))
-                         - (4 * _df_.M1 * _df_.M3)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 2))
-        _df_['eta'] = (_df_.M5 + (4 * pow(_df_.M1, 5)) + (10 * _df_.M3 * pow(_df_.M1, 2)) - (10 * _df_.M2 * pow(_df_.M1, 3))
-                       - (5 * _df_.M4 * _df_.M1)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 2.5))
-        _df_['omega'] = (_df_.M6 - (6 * _df_.M5 * _df_.M1) + (15 * _df_.M4 * pow(_df_.M1, 2)) - (20 * _df_.M3 * pow(_df_.M1, 3))
-                         + (15 * _df_.M2 * pow(_df_.M1, 4)) - (5 * pow(_df_.M1, 6))) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 3))
+        drops_per_record, _, _ = self.moment_kernel(list_moments_order)
+        _df_['N'] = drops_per_record
+        _df_ = central_moments(_df_)
         _df_.drop(columns=['M1', 'M2', 'M3', 'M4', 'M5', 'M6'], inplace=True)
         return _df_
 
@@ -814,18 +1383,10 @@ class disdrorain_2dvd(object):
         """
         list_moments_order = list([0, 1, 2, 3, 4, 5, 6])
         _df_ = self.cloud_moment_calculator(list_moments_order)
-        drops_per_record = self.data.groupby('timestamp')['diameter'].count()
-        _df_['N'] = drops_per_record.values
+        drops_per_record, _, _ = self.moment_kernel(list_moments_order)
+        _df_['N'] = drops_per_record
         _df_['Nv'] = (round(1 / ((self.instrument_area / 1000000) * self.time_interval) * _df_.N * _df_.M0)).astype(int)
-        _df_['mu'] = _df_.M1
-        _df_['sigma'] = pow((_df_.M2 - pow(_df_.M1, 2)), 0.5)
-        _df_['gamma'] = (_df_.M3 + (2 * pow(_df_.M1, 3)) - (3 * _df_.M1 * _df_.M2)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 1.5))
-        _df_['kappa'] = (_df_.M4 - (3 * pow(_df_.M1, 4)) + (6 * _df_.M2 * pow(_df_.M1, 2))
-                         - (4 * _df_.M1 * _df_.M3)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 2))
-        _df_['eta'] = (_df_.M5 + (4 * pow(_df_.M1, 5)) + (10 * _df_.M3 * pow(_df_.M1, 2)) - (10 * _df_.M2 * pow(_df_.M1, 3))
-                       - (5 * _df_.M4 * _df_.M1)) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 2.5))
-        _df_['omega'] = (_df_.M6 - (6 * _df_.M5 * _df_.M1) + (15 * _df_.M4 * pow(_df_.M1, 2)) - (20 * _df_.M3 * pow(_df_.M1, 3))
-                         + (15 * _df_.M2 * pow(_df_.M1, 4)) - (5 * pow(_df_.M1, 6))) / (pow((_df_.M2 - (_df_.M1 * _df_.M1)), 3))
+        _df_ = central_moments(_df_)
         _df_.drop(columns=['N', 'M0', 'M1', 'M2', 'M3', 'M4', 'M5', 'M6'], inplace=True)
         return _df_
 
@@ -839,6 +1400,7 @@ class disdrorain_2dvd(object):
         _countth_: the count threshold
         """
         disdroclass_good = cp.deepcopy(self)
+        disdroclass_good._clear_lazy_properties_()
         _count_ = self.data.groupby('timestamp')['diameter'].count().to_frame()
         _count_.rename(columns=({'diameter': 'ndrops'}), inplace=True)
         disdroclass_good.data.set_index('timestamp', inplace=True)
@@ -859,6 +1421,7 @@ class disdrorain_2dvd(object):
         Return: object of class disdrorain_2dvd without the drops with offbound speed
         """
         disdroclass_good = cp.deepcopy(self)
+        disdroclass_good._clear_lazy_properties_()
         disdroclass_good.data['lower_speed_bound'] = (9.65-10.3*np.exp(-0.6*disdroclass_good.data.diameter))*0.6
         disdroclass_good.data['upper_speed_bound'] = (9.65-10.3*np.exp(-0.6*disdroclass_good.data.diameter))*1.4
         disdroclass_good.data.loc[(disdroclass_good.data.speed <= disdroclass_good.data.upper_speed_bound)
@@ -871,46 +1434,414 @@ class disdrorain_2dvd(object):
 
         return (disdroclass_good)
 
-    def twodvd_to_parsivel(self):
-        """
-        Purporse: cast 2DVD data into PARSIVEL counts
-        Return: data frame with PARSIVEL counts 
-        """
-
-        def findclass_alaparsivel(row):
-            """
-            Purporse: find class to which a drop of agaive ndiameter belongs
-            Return: interger = diameter class 
-            """
-            if row['diameter'] <= 1.25:
-                return int(row['diameter']/0.125)+1
-            if ((row['diameter'] > 1.25) & (row['diameter'] <= 2.5)):
-                return int((row['diameter']-1.25)/0.25)+11
-            if ((row['diameter'] > 2.5) & (row['diameter'] <= 5)):
-                return int((row['diameter']-2.5)/0.5)+16
-            if ((row['diameter'] > 5) & (row['diameter'] <= 10)):
-                return int((row['diameter']-5)/1)+21
-            if ((row['diameter'] > 10) & (row['diameter'] <= 20)):
-                return int((row['diameter']-10)/2)+26
-            else:
-                return int((row['diameter']-20)/3)+31
+    def twodvd_to_parsivel(self, classlimits=None):
+        """
+        Purporse: cast 2DVD data into PARSIVEL counts (or into the counts of any other disdrometer)
+        Return: data frame with PARSIVEL counts (one row per minute with at least one drop, one column per class)
 
-        disdroclass_good = cp.deepcopy(self)
-        disdroclass_good.data['bin'] = disdroclass_good.data.apply(lambda row: findclass_alaparsivel(row), axis=1)
-        # print(disdroclass_good.data.head(5))
-        _bins_ = disdroclass_good.data.groupby(['timestamp', 'bin']).agg({'diameter': 'count'})
-        _bins_ = _bins_.rename(columns={'diameter': 'bincount'})
-        _mydata_ = pd.DataFrame(data=_bins_.index.get_level_values('timestamp').unique())
-        # print(_mydata_)
-
-        for i in range(0, 32):
-            _mydata_[i] = 0
-
-        for _minid_ in _bins_.index.get_level_values('timestamp').unique():
-            _aa_ = _bins_.loc[_minid_]
-            for _bin_ in _aa_.index.get_level_values('bin'):
-                _cc_ = _aa_.loc[_bin_].values
-                _mydata_.loc[_mydata_.timestamp == _minid_, (_bin_-1)] = _cc_[0]
-        _mydata_.drop(columns=['timestamp'], inplace=True)
+        classlimits: data frame with the class limits (rows 'left' and 'right', one column per class) as the
+                     classlimits attribute of the disdrorain class. If None the PARSIVEL class limits are used.
+                     See drop_classes for how drops are assigned to classes
+        """
+
+        # class of each drop
+        _bin_, _nclasses_ = drop_classes(self.data.diameter.values, classlimits)
+        # minute of each drop
+        _minutes_, _minid_ = np.unique(self.data.timestamp.values, return_inverse=True)
+
+        # count drops per (minute, class)
+        _counts_ = np.bincount(_minid_ * _nclasses_ + _bin_, minlength=len(_minutes_) * _nclasses_)
+        _mydata_ = pd.DataFrame(_counts_.reshape(len(_minutes_), _nclasses_))
 
         return (_mydata_)
+
+
+# class to keep the running sums of the values of per-record variables (e.g. the phase space parameters of the records
+# added to an online accumulator): the number of records, the mean and the standard deviation of each variable are
+# updated in constant time (no need to keep the values of past records)
+class running_statistics(object):
+    def __init__(self):
+        """
+        running_statistics class
+        The sums are kept separately for each table of variables (e.g. psp_flux, bulkvar_vplaw). Missing and infinite
+        values (e.g. sigma of a record with drops in one class only) are not counted
+        """
+        # {table name: (number of finite values, sum of values, sum of squared values)}, one value per variable
+        self._sums_ = dict()
+
+    # Method for adding (or removing) records to the running sums
+    def update(self, _tables_, _sign_=1):
+        """
+        Purpose: add the records of each table to the running sums (remove them if _sign_ is -1)
+
+        Return: nothing
+
+        _tables_: dictionary {table name: data frame with one row per record and one column per variable}
+        _sign_: 1 to add the records, -1 to remove records previously added
+        """
+        for _name_, _df_ in _tables_.items():
+            _values_ = _df_.values.astype(float)
+            _finite_ = np.isfinite(_values_)
+            _values_ = np.where(_finite_, _values_, 0.)
+            _new_ = (_finite_.sum(axis=0), _values_.sum(axis=0), (_values_ * _values_).sum(axis=0))
+            if _name_ not in self._sums_:
+                self._sums_[_name_] = (list(_df_.columns),) + tuple(np.zeros(len(_df_.columns)) for _ in _new_)
+            _old_ = self._sums_[_name_]
+            self._sums_[_name_] = (_old_[0],) + tuple(_a_ + _sign_ * _b_ for _a_, _b_ in zip(_old_[1:], _new_))
+
+    # Method for obtaining the statistics of the variables
+    def summary(self):
+        """
+        Purpose: calculate the number of values, the mean and the standard deviation of each variable of each table
+
+        Return: data frame with one row per table and variable (multi index) and columns count, mean, std
+        """
+        _frames_ = dict()
+        for _name_, (_columns_, _n_, _sum_, _sumsq_) in self._sums_.items():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                _mean_ = _sum_ / _n_
+                _var_ = np.maximum(_sumsq_ - _n_ * _mean_ * _mean_, 0.) / (_n_ - 1)
+            _frames_[_name_] = pd.DataFrame({'count': _n_.astype(np.int64), 'mean': _mean_, 'std': np.sqrt(_var_)},
+                                            index=pd.Index(_columns_, name='variable'))
+        if len(_frames_) == 0:
+            return pd.DataFrame(columns=['count', 'mean', 'std'])
+        return pd.concat(_frames_, names=['table'])
+
+
+# function to calculate the phase space parameters of the pooled distribution of all the drops of many records
+def pooled_phase_space_parameters(_ndrops_, _flux_sums_, _cloud_sums_):
+    """
+    Purpose: calculate the phase space parameters of the distribution of all the drops of a set of records (as if
+             they were one record) from the sums over the records of the moment kernel sums (see the moment_kernel
+             method of the disdrorain and disdrorain_2dvd classes): the sums are additive, so the parameters of the
+             pooled distribution can be updated in constant time when new records arrive
+
+    Return: data frame with one row per representation and columns N, mu, sigma, gamma, kappa, eta, omega
+
+    _ndrops_: total number of drops
+    _flux_sums_: array with the total sums of D^alpha for the moments orders 0, 1, ..., 6
+    _cloud_sums_: dictionary {representation: array with the total sums of D^alpha/v for the moments orders 0, ..., 6}
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _rows_ = {'flux': np.asarray(_flux_sums_, dtype=float) / _ndrops_}
+        for _name_, _sums_ in _cloud_sums_.items():
+            _x_ = np.asarray(_sums_, dtype=float) / _ndrops_
+            _rows_[_name_] = _x_ / _x_[0]
+    _df_ = pd.DataFrame(_rows_, index=[f"M{elem}" for elem in range(0, 7)]).T
+    _df_ = central_moments(_df_)
+    _df_.insert(0, 'N', int(_ndrops_))
+    _df_.drop(columns=[f"M{elem}" for elem in range(0, 7)], inplace=True)
+    return _df_
+
+
+# class to process the records of a disdrometer feed (data divided in classes, e.g. non 2DVD data) as they arrive
+class disdrorain_online(object):
+    def __init__(self, disdrodata, history=True):
+        """
+        disdrorain_online class: online accumulator of disdrometer count data
+        # disdrodata = element of the disdrorain class with the class limits, the instrument area, the time interval and
+            the velocity laws of the disdrometer (e.g. the dataset of the site built by the data catalog)
+        # history = if True the records of disdrodata are added to the running sums (site level statistics)
+        New records are added with add_records: their phase space parameters and bulk variables are calculated with
+        the same moment kernel of the disdrorain class (one small matrix multiply, the time depends on the number of
+        classes and not on the number of past records). The site level statistics (see summary and pooled) are
+        updated with running sums
+        """
+        # element of the disdrorain class with no records: it gives class limits, instrument and velocity laws
+        self._template_ = disdrodata._copy_with_data_(disdrodata.data.iloc[:0, :])
+        # the results of single records are not stored in the result cache
+        self._template_.rescache = resultcache()
+        self.nrecords = 0
+        # number of the next record (records are added in order, see add_records)
+        self._next_record_ = 0
+        self.ndrops = 0
+        self.rainfall_total = 0.
+        self.statistics = running_statistics()
+        # running sums of the moment kernel sums (moments orders 0, ..., 6) of all the records
+        self._sums_ = {'flux': np.zeros(7), 'cloudplaw': np.zeros(7), 'cloudexpo': np.zeros(7)}
+        if history and (disdrodata.data.shape[0] > 0):
+            self.add_records(disdrodata.data)
+
+    # Method for adding new records
+    def add_records(self, _counts_):
+        """
+        Purpose: calculate the phase space parameters and the bulk variables of new records and add them to the
+                 running sums of the site level statistics
+
+        Return: dictionary {name: data frame with one row per new record} with names psp_flux, psp_cloud_vplaw,
+                psp_cloud_vexpo, bulkvar_vplaw, bulkvar_vexpo (same values of the attributes of the disdrorain class).
+                Records keep the integer index of a data frame (index record number), other records are numbered
+                after the last record added
+
+        _counts_: drop counts of the new records: one record (list or array with one value per class) or many records
+                  (array or data frame with one row per record and one column per class). Records must arrive in
+                  order: a ValueError is raised if the record numbers are not increasing or not after the last record
+                  added (a record already added would be counted twice in the running sums)
+        """
+        if isinstance(_counts_, pd.DataFrame) and pd.api.types.is_integer_dtype(_counts_.index):
+            _index_ = pd.Index(_counts_.index.values, name='record number')
+        else:
+            _index_ = None
+        _counts_ = np.atleast_2d(np.asarray(_counts_))
+        _columns_ = self._template_.data.columns
+        if _counts_.shape[1] != len(_columns_):
+            raise ValueError(f"records have {_counts_.shape[1]} classes, {len(_columns_)} expected")
+        if _index_ is None:
+            _index_ = pd.RangeIndex(self._next_record_, self._next_record_ + _counts_.shape[0], name='record number')
+        elif (len(_index_) > 0) and ((_index_[0] < self._next_record_) or not _index_.is_monotonic_increasing
+                                     or not _index_.is_unique):
+            raise ValueError(f"records must arrive in order: increasing record numbers from {self._next_record_} "
+                             f"expected, {_index_[0]} received")
+        if _counts_.shape[0] == 0:
+            return dict()
+        _obj_ = self._template_._copy_with_data_(pd.DataFrame(_counts_, columns=_columns_, index=_index_))
+
+        # all the tables share the same moment kernel matrix multiply (see the moment_kernel method)
+        _tables_ = {'psp_flux': _obj_.flux_phase_space_parameters(),
+                    'psp_cloud_vplaw': _obj_.cloud_phase_space_parameters(),
+                    'psp_cloud_vexpo': _obj_.cloud_phase_space_parameters(_speed_='expo'),
+                    'bulkvar_vplaw': _obj_.bulk_variables(),
+                    'bulkvar_vexpo': _obj_.bulk_variables(_speed_='expo')}
+        for _df_ in _tables_.values():
+            _df_.index = _index_
+
+        # running sums
+        drops_per_record, flux_sums, plaw_sums, expo_sums = _obj_.moment_kernel(list(range(0, 7)))
+        for _name_, _sums_ in [('flux', flux_sums), ('cloudplaw', plaw_sums), ('cloudexpo', expo_sums)]:
+            self._sums_[_name_] += _sums_.sum(axis=0)
+        self.nrecords += _counts_.shape[0]
+        self._next_record_ = int(_index_[-1]) + 1
+        self.ndrops += int(drops_per_record.sum())
+        self.rainfall_total += np.nansum(_tables_['bulkvar_vplaw'].R.values) * self._template_.time_interval / 3600
+        self.statistics.update(_tables_)
+        return _tables_
+
+    # Method for obtaining the statistics of the per-record variables of all the records
+    def summary(self):
+        """
+        Purpose: number of values, mean and standard deviation of the phase space parameters and bulk variables of
+                 all the records added (see running_statistics)
+
+        Return: data frame with one row per table and variable
+        """
+        return self.statistics.summary()
+
+    # Method for obtaining the phase space parameters of the pooled distribution of all the drops
+    def pooled(self):
+        """
+        Purpose: phase space parameters of the distribution of all the drops of all the records added, in the flux,
+                 cloud "plaw" and cloud "exponential" representations (see pooled_phase_space_parameters)
+
+        Return: data frame with one row per representation
+        """
+        return pooled_phase_space_parameters(self.ndrops, self._sums_['flux'],
+                                             {'cloudplaw': self._sums_['cloudplaw'], 'cloudexpo': self._sums_['cloudexpo']})
+
+
+# class to process the drops of a 2DVD disdrometer feed as they arrive
+class disdrorain_2dvd_online(object):
+    def __init__(self, disdrodata, history=True):
+        """
+        disdrorain_2dvd_online class: online accumulator of 2DVD data
+        # disdrodata = element of the disdrorain_2dvd class with the instrument area and the time interval of the
+            disdrometer (e.g. the dataset of the site built by the data catalog)
+        # history = if True the records of disdrodata are added to the running sums (site level statistics)
+        New drops are added with add_drops: a record is made of all the drops with the same timestamp. Drops must
+        arrive in time order: drops with the timestamp of the last record are added to it (its values and the running
+        sums are updated), so a record can be sent in more than one piece. The last record is added to the statistics
+        of the per-record variables only when a new record starts (see summary): a record with few drops can have
+        very large values of the higher moments, removing them from the running sums would spoil their precision
+        """
+        self.instrument_area = disdrodata.instrument_area
+        self.time_interval = disdrodata.time_interval
+        self.nrecords = 0
+        self.ndrops = 0
+        self.rainfall_total = 0.
+        self.statistics = running_statistics()
+        self._sums_ = {'flux': np.zeros(7), 'cloud': np.zeros(7)}
+        # last record: (timestamp, drops, tables, number of drops, flux sums, cloud sums)
+        self._last_ = None
+        if history and (disdrodata.data.shape[0] > 0):
+            self.add_drops(disdrodata.data)
+
+    # Method for adding (_sign_=1) or removing (_sign_=-1) the contribution of records to the running sums
+    def _update_sums_(self, _tables_, _ndrops_, _flux_sums_, _cloud_sums_, _nrecords_, _sign_=1):
+        self._sums_['flux'] += _sign_ * _flux_sums_
+        self._sums_['cloud'] += _sign_ * _cloud_sums_
+        self.nrecords += _sign_ * _nrecords_
+        self.ndrops += _sign_ * int(_ndrops_)
+        self.rainfall_total += _sign_ * np.nansum(_tables_['bulkvar'].R.values) * self.time_interval / 3600
+
+    # Method for adding new drops
+    def add_drops(self, _drops_):
+        """
+        Purpose: calculate the phase space parameters and the bulk variables of the records of new drops and add them
+                 to the running sums of the site level statistics
+
+        Return: dictionary {name: data frame with one row per record} with names psp_flux, psp_cloud, bulkvar (same
+                values of the attributes of the disdrorain_2dvd class), indexed by timestamp. If the first drops
+                belong to the last record already added, its updated values are returned
+
+        _drops_: data frame (columns timestamp, diameter, speed) or array (one row per drop, same three columns).
+                 Drops must arrive in time order: a ValueError is raised if a drop is older than the last record
+                 already added (a record already added would be counted twice in the running sums)
+        """
+        if isinstance(_drops_, pd.DataFrame):
+            _drops_ = _drops_.loc[:, ['timestamp', 'diameter', 'speed']].reset_index(drop=True)
+        else:
+            _drops_ = pd.DataFrame(np.atleast_2d(_drops_), columns=['timestamp', 'diameter', 'speed'])
+        _drops_ = _drops_.sort_values(by='timestamp', kind='stable', ignore_index=True)
+
+        if _drops_.shape[0] == 0:
+            return dict()
+        if (self._last_ is not None) and (_drops_.timestamp.values[0] < self._last_[0]):
+            raise ValueError(f"drops must arrive in time order: drops older than the last record (timestamp "
+                             f"{self._last_[0]}) received")
+        # drops of the last record: the record is calculated again with all its drops
+        if (self._last_ is not None) and (_drops_.timestamp.values[0] == self._last_[0]):
+            self._update_sums_(*self._last_[2:], 1, _sign_=-1)
+            _drops_ = pd.concat([self._last_[1], _drops_], ignore_index=True)
+        elif self._last_ is not None:
+            self.statistics.update(self._last_[2])
+
+        _obj_ = disdrorain_2dvd(dataframe=_drops_, instrument_area=self.instrument_area, time_interval=self.time_interval,
+                                rescache=resultcache())
+        # all the tables share the same moment kernel (see the moment_kernel method)
+        _tables_ = {'psp_flux': _obj_.flux_phase_space_parameters(),
+                    'psp_cloud': _obj_.cloud_phase_space_parameters(),
+                    'bulkvar': _obj_.bulk_variables()}
+        _timestamps_ = pd.Index(np.unique(_drops_.timestamp.values), name='timestamp')
+        for _df_ in _tables_.values():
+            _df_.index = _timestamps_
+
+        drops_per_record, flux_sums, cloud_sums = _obj_.moment_kernel(list(range(0, 7)))
+        self._update_sums_(_tables_, drops_per_record.sum(), flux_sums.sum(axis=0), cloud_sums.sum(axis=0),
+                           len(_timestamps_))
+        # the statistics of the per-record variables include only the records before the last one
+        self.statistics.update({_name_: _df_.iloc[:-1, :] for _name_, _df_ in _tables_.items()})
+        # the last record is kept to be updated if more drops with the same timestamp arrive
+        _lastdrops_ = _drops_.loc[_drops_.timestamp.values == _timestamps_[-1], :].reset_index(drop=True)
+        self._last_ = (_timestamps_[-1], _lastdrops_, {_name_: _df_.iloc[-1:, :] for _name_, _df_ in _tables_.items()},
+                       drops_per_record[-1], flux_sums[-1, :], cloud_sums[-1, :])
+        return _tables_
+
+    # Method for obtaining the statistics of the per-record variables of all the records
+    def summary(self):
+        """
+        Purpose: number of values, mean and standard deviation of the phase space parameters and bulk variables of
+                 all the records added (see running_statistics)
+
+        Return: data frame with one row per table and variable
+        """
+        if self._last_ is None:
+            return self.statistics.summary()
+        # the last record is added to a copy of the running sums
+        _statistics_ = cp.deepcopy(self.statistics)
+        _statistics_.update(self._last_[2])
+        return _statistics_.summary()
+
+    # Method for obtaining the phase space parameters of the pooled distribution of all the drops
+    def pooled(self):
+        """
+        Purpose: phase space parameters of the distribution of all the drops of all the records added, in the flux
+                 and cloud representations (see pooled_phase_space_parameters)
+
+        Return: data frame with one row per representation
+        """
+        return pooled_phase_space_parameters(self.ndrops, self._sums_['flux'], {'cloud2dvd': self._sums_['cloud']})
+
+
+# class to build the disdrometer datasets listed in a data catalog (e.g. data_catalog.csv)
+class disdrocatalog(object):
+    def __init__(self, catalogpath, datadir, maxsize=8, cachedir=None):
+        """
+        disdrocatalog class
+        # catalogpath = path to the catalog file (one row per dataset, see data_catalog.csv)
+        # datadir = path to the directory containing the datasets and the class limits files
+        # maxsize = maximum number of datasets kept in memory. When a new dataset is built and maxsize datasets are
+            already in memory the least recently used one is discarded
+        # cachedir = path to the directory of the binary cache of parsed files (see cached_read_csv)
+        """
+        self.catalog = pd.read_csv(catalogpath, sep=',')
+        # position of each dataset in the catalog
+        self.index = {_acronym_: i for i, _acronym_ in enumerate(self.catalog.ID2.values)}
+        self.datadir = datadir
+        self.maxsize = maxsize
+        self.cachedir = cachedir
+        self._datasets_ = OrderedDict()
+
+    def __contains__(self, acronym):
+        return acronym in self.index
+
+    # Method for retrieving the catalog row of a dataset
+    def metadata(self, acronym):
+        """
+        Purpose: retrieve the catalog row of a dataset
+
+        Return: series with the catalog values (GEO_ID, INSTRUMENT, CELLLIMITS, ...) of the dataset
+
+        acronym: acronym (ID2) identifying the data set in the catalog
+        """
+        return self.catalog.iloc[self.index[acronym]]
+
+    # Method for building (or retrieving if already built) the disdrorain or disdrorain_2dvd element of a dataset
+    def dataset(self, acronym):
+        """
+        Purpose: build the element of the disdrorain class (or of the disdrorain_2dvd class for 2DVD data) of a
+                 dataset with the class limits, instrument area and time resolution of the catalog. The last maxsize
+                 datasets requested are kept in memory together with the lazy attributes already calculated
+                 (psp_flux, bulkvar_vplaw, ...) and the same element is returned when requested again.
+                 The returned element is shared: its data and attributes must not be modified in place
+
+        Return: element of the disdrorain or disdrorain_2dvd class
+
+        acronym: acronym (ID2) identifying the data set in the catalog
+        """
+        if acronym in self._datasets_:
+            self._datasets_.move_to_end(acronym)
+            return self._datasets_[acronym]
+
+        row = self.metadata(acronym)
+        pathtodata = os.path.join(self.datadir, acronym)
+        # if data set is not from 2DVD disdrometer
+        if row['INSTRUMENT'] != '2DVD':
+            # if data set is RD80 with standard cell limits division
+            if (row['INSTRUMENT'] == 'RD80') and (row['CELLLIMITS'] == 'standard'):
+                disdrodata = disdrorain(datapath=pathtodata, instrument_area=row['AREA_INSTRUMENT'],
+                                        time_interval=row['TIME_RESOLUTION'], cachedir=self.cachedir)
+            else:
+                disdrodata = disdrorain(classpath=os.path.join(self.datadir, row['CELLLIMITS']), datapath=pathtodata,
+                                        instrument_area=row['AREA_INSTRUMENT'], time_interval=row['TIME_RESOLUTION'],
+                                        cachedir=self.cachedir)
+        else:
+            disdrodata = disdrorain_2dvd(datapath=pathtodata, instrument_area=row['AREA_INSTRUMENT'],
+                                         time_interval=row['TIME_RESOLUTION'], cachedir=self.cachedir)
+
+        self._datasets_[acronym] = disdrodata
+        while len(self._datasets_) > self.maxsize:
+            self._datasets_.popitem(last=False)
+        return disdrodata
+
+
+# catalogs opened in the current process (see open_catalog)
+_catalog_registry = dict()
+
+
+# function to open a data catalog: the same catalog is opened only once in a process, so that programs executed
+# in the same process (see batch_analysis.py) share the datasets already built
+def open_catalog(catalogpath, datadir, maxsize=8, cachedir=None):
+    """
+    Purpose: open a data catalog (see the disdrocatalog class). If the catalog file has not changed since it was
+             last opened (with the same datadir and cachedir) the disdrocatalog element already created is returned
+
+    Return: element of the disdrocatalog class
+
+    catalogpath: path to the catalog file
+    datadir: path to the directory containing the datasets and the class limits files
+    maxsize: maximum number of datasets kept in memory
+    cachedir: path to the directory of the binary cache of parsed files (see cached_read_csv)
+    """
+    _key_ = (os.path.abspath(catalogpath), os.stat(catalogpath).st_mtime_ns, os.path.abspath(datadir), cachedir)
+    if _key_ not in _catalog_registry:
+        _catalog_registry[_key_] = disdrocatalog(catalogpath, datadir, maxsize=maxsize, cachedir=cachedir)
+    return _catalog_registry[_key_]
@@ -42,9 +42,7 @@ print("Executing: ", sys.argv[0])
 print()
 
 # load catalog
-catalog = pd.read_csv(args._dc_, sep=',')
-# retrieve index of catalog data frame corresponding to the desired acronym
-index_acronym = catalog[catalog['ID2'] == args._da_].index.tolist()
+catalog = dr.open_catalog(args._dc_, args._ddp_)
 
 # check if to calculate also renormalized values
 
@@ -55,23 +53,9 @@ if args._re_ not in ['flux', 'cloudexpo', 'cloudplaw']:
 	sys.exit()
 
 # if acronym is part of the catalog we calculate the phase space parameters 
-if index_acronym:
-	row = catalog.loc[catalog.ID2 == args._da_,:]  # retrieve row corresponding to acronym
-	celllimits_path = args._ddp_+'/'+row['CELLLIMITS'].values[0]  # set file name with cell limits values 
-	areainstr = row['AREA_INSTRUMENT'].values[0]  # set area of instrument 
-	instr = row['INSTRUMENT'].values[0]  # set instrument type
-	tr = row['TIME_RESOLUTION'].values[0]  # set instrument time resolution
-	pathtodata = args._ddp_+'/'+args._da_  # set path to data set
-
-	# if data set is not from 2DVD disdrometer
-	if (instr != '2DVD'):
-		# if data set is RD80 with standard cell limits division
-		if ((instr == 'RD80') & (row['CELLLIMITS'].values[0] == 'standard')):
-			disdrodata = dr.disdrorain(datapath=pathtodata,instrument_area=areainstr,time_interval=tr)  # create disdrodata class 
-		else:
-			disdrodata = dr.disdrorain(classpath=celllimits_path,datapath=pathtodata,instrument_area=areainstr,time_interval=tr)  # create disdrodata class  
-	else:
-		disdrodata = dr.disdrorain_2dvd(datapath=pathtodata,instrument_area=areainstr,time_interval=tr)  # create disdrodata class for 2dvd data
+if args._da_ in catalog:
+	# create disdrodata class (disdrorain class or disdrorain_2dvd class for 2dvd data)
+	disdrodata = catalog.dataset(args._da_)
 
 	# calculate dsd paramters
 	list_moments_order = list([1, 2, 3, 4, 5, 6])
@@ -99,9 +99,7 @@ def _renormalize_(_dfin_, _rntable_, _rnrmtype_):
 
 
 # load catalog
-catalog = pd.read_csv(args._dc_, sep=',')
-# retrieve index of catalog data frame corresponding to the desired acronym
-index_acronym = catalog[catalog['ID2'] == args._da_].index.tolist()
+catalog = dr.open_catalog(args._dc_, args._ddp_)
 
 # check if representation value is admitted (only: flux, cloudexpo, cloudplaw)
 if args._re_ not in ['flux', 'cloudexpo', 'cloudplaw', 'cloud2dvd']:
@@ -110,41 +108,25 @@ if args._re_ not in ['flux', 'cloudexpo', 'cloudplaw', 'cloud2dvd']:
     sys.exit()
 
 # if acronym is part of the catalog we calculate the phase space parameters
-if index_acronym:
-    row = catalog.loc[catalog.ID2 == args._da_, :]  # retrieve row corresponding to acronym
-    celllimits_path = args._ddp_+'/'+row['CELLLIMITS'].values[0]  # set file name with cell limits values
-    areainstr = row['AREA_INSTRUMENT'].values[0]  # set area of instrument
-    instr = row['INSTRUMENT'].values[0]  # set instrument type
-    tr = row['TIME_RESOLUTION'].values[0]  # set instrument time resolution
-    pathtodata = args._ddp_+'/'+args._da_  # set path to data set
-
-    # if data set is not from 2DVD disdrometer
-    if (instr != '2DVD'):
-        # if data set is RD80 with standard cell limits division
-        if ((instr == 'RD80') & (row['CELLLIMITS'].values[0] == 'standard')):
-            disdrodata = dr.disdrorain(datapath=pathtodata, instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-        else:
-            disdrodata = dr.disdrorain(classpath=celllimits_path, datapath=pathtodata,
-                                       instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-    else:
-        disdrodata = dr.disdrorain_2dvd(datapath=pathtodata, instrument_area=areainstr,
-                                        time_interval=tr)  # create disdrodata class for 2dvd data
+if args._da_ in catalog:
+    # create disdrodata class (disdrorain class or disdrorain_2dvd class for 2dvd data)
+    disdrodata = catalog.dataset(args._da_)
 
     # calculate dsd paramters
     if args._re_ == 'flux':
         # calculate central moments in the flux (ground) representation
-        dsdpar = disdrodata.flux_phase_space_parameters()
+        dsdpar = disdrodata.psp_flux
     else:
         # calculate phase space paramter in the cloud representation
         if args._re_ == 'cloudexpo':
             # exponential law for drop speed
-            dsdpar = disdrodata.cloud_phase_space_parameters(_speed_='expo')
+            dsdpar = disdrodata.psp_cloud_vexpo
         if args._re_ == 'cloudplaw':
             # expoential law for drop speed
-            dsdpar = disdrodata.cloud_phase_space_parameters(_speed_='plaw')
+            dsdpar = disdrodata.psp_cloud_vplaw
         if args._re_ == 'cloud2dvd':
             # this are 2dvd data and we know the speed of each drop
-            dsdpar = disdrodata.cloud_phase_space_parameters()
+            dsdpar = disdrodata.psp_cloud
 
     # if renormalized value are desired
     if args._rn_ != 'N':
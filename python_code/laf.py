@@ -0,0 +1,188 @@
+# This program contains the functions used by the Local Adaptive Fit algorithm (see adaptive_fitting.py)
+# The grid centers can be split in tiles evaluated by a pool of worker processes (see laf_grid)
+#
+# Author: Massimiliano Ignaccolo
+#         massimiliano.ignaccolo [at] tutanota.com. massimiliano.ignaccolo [at] sas.com
+# Last modified: Feb 01 2022
+
+
+# ------------- Necessary Python packages -START
+import numpy as np
+from grispy import GriSPy
+from workerpool import shared, task_results
+# ------------- Necessary Python packages -END
+
+# data shared by the tasks of a worker process (see workerpool.task_results and _setup_worker_): data points
+# (mu_r, gamma_r) shared['points'], parameter values (one column per parameter) shared['params'] and GriSPy index of
+# the data points shared['gsp']
+
+# quantiles of the LAF estimates: median, q1, q3, 5%, 95%
+QUANTILES = [0.5, 0.25, 0.75, 0.05, 0.95]
+
+
+# function to calculate quantiles of many sets of values at once
+def segment_quantiles(_values_, _lengths_, _qlist_):
+    """
+    Purpose: calculate quantiles of consecutive segments of an array (e.g. the values of the parameter of the
+             neighbors of each grid center, one after the other). Each segment is sorted only once and all the
+             quantiles are read from the sorted values with the same interpolation of np.quantile (linear).
+             The median (0.5) is calculated as np.median (mean of the two central values for even lengths)
+
+    Return: numpy array of shape (number of segments, number of quantiles)
+
+    _values_: numpy array with the values of all segments (flat, CSR-style)
+    _lengths_: numpy array with the number of values of each segment (segments must not be empty)
+    _qlist_: list of quantiles to calculate (between 0 and 1)
+    """
+    _values_ = np.asarray(_values_, dtype=float).ravel()
+    _lengths_ = np.asarray(_lengths_, dtype=np.int64)
+    if len(_lengths_) == 0:
+        return np.zeros((0, len(_qlist_)))
+    _starts_ = np.concatenate(([0], np.cumsum(_lengths_)[:-1]))
+    # sort each segment: sort by value inside segment number
+    _segment_ = np.repeat(np.arange(len(_lengths_)), _lengths_)
+    _sorted_ = _values_[np.lexsort((_values_, _segment_))]
+
+    _res_ = np.empty((len(_lengths_), len(_qlist_)))
+    for j, q in enumerate(_qlist_):
+        if q == 0.5:
+            # median: as np.median
+            _low_ = _sorted_[_starts_ + (_lengths_ - 1) // 2]
+            _high_ = _sorted_[_starts_ + _lengths_ // 2]
+            _res_[:, j] = np.where(_lengths_ % 2 == 1, _low_, (_low_ + _high_) / 2.)
+            continue
+        # linear interpolation between the values around the virtual index (n-1)*q: as np.quantile
+        _virtual_ = (_lengths_ - 1) * q
+        _previous_ = np.floor(_virtual_).astype(np.int64)
+        _next_ = np.minimum(_previous_ + 1, _lengths_ - 1)
+        _gamma_ = _virtual_ - _previous_
+        _a_ = _sorted_[_starts_ + _previous_]
+        _b_ = _sorted_[_starts_ + _next_]
+        _diff_ = _b_ - _a_
+        _res_[:, j] = np.where(_gamma_ >= 0.5, _b_ - _diff_ * (1 - _gamma_), _a_ + _diff_ * _gamma_)
+    # segments with missing values: all quantiles are missing (as np.quantile)
+    _res_[np.add.reduceat(np.isnan(_values_), _starts_) > 0, :] = np.nan
+    return _res_
+
+
+# function to find, with one neighbor search, the smallest radius of a sequence with enough neighbors
+def smallest_radius_neighbors(_gsp_, _centers_, _listradius_, _occupancy_, _chunksize_=2048):
+    """
+    Purpose: find for each center the smallest radius of the sequence _listradius_ such that the number of data
+             points at distance <= radius is at least _occupancy_, and the indices of these data points.
+             The neighbors are searched only once, with the largest radius of the sequence: the number of neighbors
+             within each radius of the sequence is then counted on the distances of the neighbors found.
+             Centers are processed in chunks of _chunksize_ centers to limit the memory used.
+             The neighbors are the same found by searching the neighbors for each radius (_gsp_.bubble_neighbors with
+             distance_upper_bound=radius) and removing the centers with enough neighbors before the next radius.
+
+    Return: tuple (radius index, lengths, indices)
+            radius index: numpy array with the position in _listradius_ of the radius of each center (-1 if not enough
+                          neighbors are found with the largest radius)
+            lengths: numpy array with the number of neighbors of each center (0 if radius index is -1)
+            indices: numpy array with the indices of the neighbors of all the centers, one center after the other
+                     (flat, CSR-style: see segment_quantiles)
+
+    _gsp_: GriSPy object built on the data points
+    _centers_: numpy array (number of centers, 2) with the coordinates of the centers
+    _listradius_: list of radii (increasing order)
+    _occupancy_: minimum number of neighbors
+    _chunksize_: number of centers searched at once
+    """
+    _radii_ = np.asarray(_listradius_, dtype=float)
+    _occupancy_ = int(_occupancy_)
+    _rindex_ = np.full(len(_centers_), -1, dtype=np.int64)
+    _lengths_ = np.zeros(len(_centers_), dtype=np.int64)
+    _indices_ = list()
+
+    for _start_ in range(0, len(_centers_), _chunksize_):
+        _stop_ = min(_start_ + _chunksize_, len(_centers_))
+        bubble_dist, bubble_ind = _gsp_.bubble_neighbors(_centers_[_start_:_stop_], distance_upper_bound=float(_radii_.max()))
+        _nneigh_ = np.array([len(_item_) for _item_ in bubble_ind], dtype=np.int64)
+        if _nneigh_.sum() == 0:
+            continue
+        _dist_ = np.concatenate(bubble_dist)
+        _ind_ = np.concatenate(bubble_ind)
+        _segment_ = np.repeat(np.arange(len(_nneigh_)), _nneigh_)
+
+        # number of neighbors within each radius (one row per center, one column per radius)
+        _counts_ = np.zeros((len(_nneigh_), len(_radii_)), dtype=np.int64)
+        for j, _radius_ in enumerate(_radii_):
+            _counts_[:, j] = np.bincount(_segment_[_dist_ <= _radius_], minlength=len(_nneigh_))
+
+        # smallest radius with enough neighbors
+        _enough_ = _counts_ >= _occupancy_
+        _first_ = np.where(_enough_.any(axis=1), np.argmax(_enough_, axis=1), -1)
+        _rindex_[_start_:_stop_] = _first_
+        _lengths_[_start_:_stop_] = np.where(_first_ >= 0, _counts_[np.arange(len(_first_)), _first_], 0)
+
+        # neighbors within the radius of their center (none for centers without enough neighbors)
+        _cutoff_ = np.where(_first_ >= 0, _radii_[_first_], -np.inf)
+        _indices_.append(_ind_[_dist_ <= _cutoff_[_segment_]])
+
+    _indices_ = np.concatenate(_indices_) if len(_indices_) > 0 else np.zeros(0, dtype=np.int64)
+    return _rindex_, _lengths_, _indices_
+
+
+# function to complete the data points and the parameter values in a worker process (read-only float arrays)
+# each worker process builds its own GriSPy index of the data points
+def _setup_worker_(_shared_):
+    for _name_ in ['points', 'params']:
+        _array_ = np.array(_shared_[_name_], dtype=float)
+        _array_.setflags(write=False)
+        _shared_[_name_] = _array_
+    _shared_['gsp'] = GriSPy(_shared_['points'])
+
+
+# function to calculate the LAF estimates of a tile of grid centers (executed by a worker process)
+def _laf_tile_(_task_):
+    (_tile_, _centers_, _listradius_, _occupancy_) = _task_
+    _rindex_, _lengths_, _indices_ = smallest_radius_neighbors(shared['gsp'], _centers_, _listradius_, _occupancy_)
+    _params_ = shared['params']
+    _quantiles_ = np.full((len(_centers_), _params_.shape[1], len(QUANTILES)), np.nan)
+    _selected_ = _rindex_ >= 0
+    for j in range(0, _params_.shape[1]):
+        _quantiles_[_selected_, j, :] = segment_quantiles(_params_[_indices_, j], _lengths_[_selected_], QUANTILES)
+    return (_tile_, _rindex_, _quantiles_)
+
+
+# function to calculate the LAF estimates of all the grid centers
+def laf_grid(_points_, _params_, _centers_, _listradius_, _occupancy_, workers=1, ntiles=None):
+    """
+    Purpose: calculate the LAF estimates of the grid centers: for each center, the smallest radius of the sequence
+             _listradius_ with at least _occupancy_ data points at distance <= radius, and the quantiles (QUANTILES)
+             of the values of the parameters of these data points (see smallest_radius_neighbors and
+             segment_quantiles). The grid centers are split in tiles (consecutive centers) evaluated by a pool of
+             worker processes. Each worker process has a read-only copy of the data points and of the parameter values
+             and its own GriSPy index. The results do not depend on the number of workers or of tiles
+
+    Return: tuple (radius index, quantiles)
+            radius index: numpy array with the position in _listradius_ of the radius of each center (-1 if not enough
+                          neighbors are found with the largest radius)
+            quantiles: numpy array (number of centers, number of parameters, number of quantiles) (NaN if radius
+                       index is -1)
+
+    _points_: numpy array (number of data points, 2) with the coordinates of the data points
+    _params_: numpy array (number of data points, number of parameters) with the values of the parameters
+    _centers_: numpy array (number of centers, 2) with the coordinates of the centers
+    _listradius_: list of radii (increasing order)
+    _occupancy_: minimum number of neighbors
+    workers: number of worker processes. If 1 (or if called inside a worker process) no pool of processes is used
+    ntiles: number of tiles. If None 4 tiles per worker process are used (the centers far from the data points are
+            evaluated quickly: several tiles per worker process balance the load)
+    """
+    if ntiles is None:
+        ntiles = 4*workers
+    _tiles_ = np.array_split(np.arange(len(_centers_)), max(1, min(ntiles, len(_centers_))))
+    list_tasks = [(n, _centers_[_tile_], _listradius_, _occupancy_) for n, _tile_ in enumerate(_tiles_)]
+
+    _rindex_ = np.full(len(_centers_), -1, dtype=np.int64)
+    _quantiles_ = np.full((len(_centers_), np.shape(_params_)[1], len(QUANTILES)), np.nan)
+    with task_results(_laf_tile_, list_tasks, workers=workers, data={'points': _points_, 'params': _params_},
+                      setup=_setup_worker_) as _results_:
+        for n, (_tile_, _tilerindex_, _tilequantiles_) in enumerate(_results_):
+            print(f"grid tile {_tile_} ({n+1}/{len(list_tasks)})")  # info about progress
+            _rindex_[_tiles_[_tile_]] = _tilerindex_
+            _quantiles_[_tiles_[_tile_]] = _tilequantiles_
+
+    return (_rindex_, _quantiles_)
@@ -2,19 +2,13 @@
 #Written by Shuyang Gao (BiLL), email: gaos@usc.edu
 
 
-from scipy import stats
 import numpy as np
 import scipy.spatial as ss
-from scipy.special import digamma,gamma
+from scipy.special import digamma
 import numpy.random as nr
-import random
-import matplotlib.pyplot as plt
-import re
-from scipy.stats.stats import pearsonr
-import numpy.linalg as la
-from numpy.linalg import eig, inv, norm, det
-from scipy import stats
-from math import log,pi,hypot,fabs,sqrt
+import hashlib
+from collections import OrderedDict
+from math import log
 class MI:
 	
 	@staticmethod
@@ -24,195 +18,209 @@ class MI:
 		return [sum(sublist,[]) for sublist in zip(*args)]
 	
 	@staticmethod
-	def avgdigamma(points,dvec):
-	 	#This part finds number of neighbors in some radius in the marginal space
-		#returns expectation value of <psi(nx)>
+	def noisy_points(X,intens=1e-10,rng=None,seed=None):
+		#adding small noise to X, e.g., x<-X+noise (same random draws of the element by element version: dimension after dimension)
+		#rng is the numpy random Generator of the noise (the global numpy random generator if None)
+		#seed (integer): the noise of each dimension depends only on seed and on the values of the dimension (see noisy_column),
+		#the same variable gets the same noise in all the estimates (e.g. all the couples of a mutual information matrix)
+		#returns the (number of samples x dimensions) array of the noisy points
+		X = np.asarray(X,dtype=float)
+		if seed is not None:
+			return np.column_stack([MI.noisy_column(x,intens,seed) for x in X.reshape(len(X),-1)])
+		noise = nr.rand(*X.shape) if rng is None else rng.random(X.shape)
+		return (X + intens*noise).T
+
+	#number of points processed at once by knn_marginal_radii and lnc_correction: the (points x k+1 x d) arrays of the
+	#k-nearest neighbors are built one chunk at a time (memory does not grow with the number of samples)
+	chunk_size = 4096
+
+	#noisy columns already calculated {(hash of the values, intens, seed): noisy values}, least recently used first
+	_noisy_cache = OrderedDict()
+	noisy_cache_size = 32
+
+	@staticmethod
+	def noisy_column(x,intens=1e-10,seed=0):
+		#adding small noise to the values of one variable: the noise is drawn (in one call) from a random generator initialized
+		#with seed and a hash of the values, so the same values always get the same noise
+		#the noisy values are cached (read-only array): a variable used in many estimates is hashed but not drawn again
+		x = np.ascontiguousarray(x,dtype=float)
+		digest = hashlib.sha1(x.tobytes()).hexdigest()
+		key = (digest,float(intens),seed)
+		if key in MI._noisy_cache:
+			MI._noisy_cache.move_to_end(key)
+			return MI._noisy_cache[key]
+		rng = np.random.default_rng([seed,int(digest[:15],16)])
+		noisy = x + intens*rng.random(x.shape)
+		noisy.setflags(write=False)
+		MI._noisy_cache[key] = noisy
+		if len(MI._noisy_cache) > MI.noisy_cache_size:
+			MI._noisy_cache.popitem(last=False)
+		return noisy
+
+	@staticmethod
+	def knn_marginal_radii(points,k,comonotone=None):
+		#Find k-nearest neighbors in joint space (all points with one query), p=inf means max norm
+		#returns the indices of the k-nearest neighbors (first column is the point itself)
+		#and the distances to the k-nearest neighbors in each marginal space (one row per dimension)
+		#comonotone points are processed without a tree (see knn_comonotone): if comonotone is None this is checked
+		if comonotone is None:
+			comonotone = MI.is_comonotone(points) and len(points) > k
+		if comonotone:
+			knn = MI.knn_comonotone(points,k)
+		else:
+			tree = ss.cKDTree(points)
+			knn = tree.query(points,k+1,p=float('inf'))[1]
+		dvec = np.empty((points.shape[1],len(points)))
+		for start in range(0,len(points),MI.chunk_size):
+			chunk = knn[start:start+MI.chunk_size]
+			dvec[:,start:start+len(chunk)] = np.abs(points[chunk] - points[chunk[:,:1]]).max(axis=1).T
+		return knn, dvec
+
+	@staticmethod
+	def is_comonotone(points):
+		#True if all the dimensions are sorted in increasing order (e.g. the sorted variables of the RMI normalization)
+		return bool(np.all(np.diff(points,axis=0) >= 0))
+
+	@staticmethod
+	def knn_comonotone(points,k):
+		#Find k-nearest neighbors in joint space (p=inf) of comonotone points without a tree:
+		#moving away from a point (in either direction) the distance in each dimension, and so the max norm, does not
+		#decrease, hence the k-nearest neighbors are a points before and k-a points after it (a between 0 and k)
 		N = len(points)
-		tree = ss.cKDTree(points)
-		avg = 0.
-		for i in range(N):
-	  		dist = dvec[i]
-	  		#subtlety, we don't include the boundary point, 
-	  		#but we are implicitly adding 1 to kraskov def bc center point is included
-	  		num_points = len(tree.query_ball_point(points[i],dist-1e-15,p=float('inf'))) 
-	  		avg += digamma(num_points)/N
-		return avg
-	
+		#distances to the j-th point before (before[:,j]) and after (after[:,j]) each point
+		before = np.full((N,k+1),np.inf)
+		after = np.full((N,k+1),np.inf)
+		before[:,0] = 0.
+		after[:,0] = 0.
+		for j in range(1,k+1):
+			d = np.abs(points[j:] - points[:-j]).max(axis=1)
+			before[j:,j] = d
+			after[:-j,j] = d
+		#a minimizes the distance to the k-th neighbor
+		#note: neighbors at exactly the same distance may be chosen differently than in the tree query (the choice
+		#is arbitrary in both cases)
+		a = np.argmin(np.maximum(before,after[:,::-1]),axis=1)[:,None]
+		#the point itself comes first as in the tree query
+		j = np.arange(k+1)[None,:]
+		i = np.arange(N)[:,None]
+		return np.where(j <= a, i - j, i + j - a)
+
+	@staticmethod
+	def marginal_trees(points):
+		#one tree per marginal space (column of the noisy points): the trees can be reused for all the
+		#estimates involving the same (noisy) variable, e.g. all the couples of variables of a mutual information matrix
+		return [ss.cKDTree(points[:,i:i+1]) for i in range(points.shape[1])]
+
+	@staticmethod
+	def avgdigamma(points,dvec,tree=None):
+		#This part finds number of neighbors in some radius in the marginal space
+		#returns expectation value of <psi(nx)>
+		#tree is the tree of the marginal space (built from points if not given)
+		points = np.asarray(points,dtype=float).reshape(len(points),-1)
+		if tree is None:
+			tree = ss.cKDTree(points)
+		#subtlety, we don't include the boundary point,
+		#but we are implicitly adding 1 to kraskov def bc center point is included
+		num_points = tree.query_ball_point(points,np.asarray(dvec)-1e-15,p=float('inf'),return_length=True)
+		return np.mean(digamma(num_points))
+
+	@staticmethod
+	def kraskov_term(points,dvec,k,trees=None):
+		#Kraskov estimate of the mutual information from the noisy points and the marginal distances to the k-nearest neighbors
+		d = points.shape[1]
+		if trees is None:
+			trees = [None]*d
+		ret = 0.
+		for i in range(d):
+			ret -= MI.avgdigamma(points[:,i],dvec[i],trees[i])
+		ret += digamma(k) - (float(d)-1.)/float(k) + (float(d)-1.) * digamma(len(points))
+		return ret
+
 	@staticmethod 
-	def mi_Kraskov(X,k=5,base=np.exp(1),intens=1e-10):
+	def mi_Kraskov(X,k=5,base=np.exp(1),intens=1e-10,rng=None,seed=None):
 		'''The mutual information estimator by Kraskov et al.
 		   ith row of X represents ith dimension of the data, e.g. X = [[1.0,3.0,3.0],[0.1,1.2,5.4]], if X has two dimensions and we have three samples
-		   	
+		   rng, seed: random generator or seed of the small noise (see noisy_points), the same seed gives the same result
 		'''
-		#adding small noise to X, e.g., x<-X+noise
-		x = [];
-		for i in range(len(X)):
-			tem = [];
-			for j in range(len(X[i])):
-				tem.append([X[i][j] + intens*nr.rand(1)[0]]);
-			x.append(tem);
-	
-		points = [];
-		for j in range(len(x[0])):
-			tem = [];
-			for i in range(len(x)):	
-				tem.append(x[i][j][0]);
-			points.append(tem);
-		tree = ss.cKDTree(points);
-		dvec = [];
-		for i in range(len(x)):
-			dvec.append([])	
-		for point in points:
-			#Find k-nearest neighbors in joint space, p=inf means max norm
-			knn = tree.query(point,k+1,p=float('inf'));
-			points_knn = [];
-			for i in range(len(x)):
-				dvec[i].append(float('-inf'));
-				points_knn.append([]);
-			for j in range(k+1):
-				for i in range(len(x)):
-					points_knn[i].append(points[knn[1][j]][i]);
-
-			#Find distances to k-nearest neighbors in each marginal space
-			for i in range(k+1):
-				for j in range(len(x)):
-					if dvec[j][-1] < fabs(points_knn[j][i]-points_knn[j][0]):
-						dvec[j][-1] =  fabs(points_knn[j][i]-points_knn[j][0]);
-
-		ret = 0.
-		for i in range(len(x)):
-			ret -= MI.avgdigamma(x[i],dvec[i]);
-		ret += digamma(k) - (float(len(x))-1.)/float(k) + (float(len(x))-1.) * digamma(len(x[0]));
-		return ret;	
+		points = MI.noisy_points(X,intens,rng,seed)
+		knn, dvec = MI.knn_marginal_radii(points,k)
+		return MI.kraskov_term(points,dvec,k)
 
 	@staticmethod 
-	def mi_LNC(X,k=5,base=np.exp(1),alpha=0.25,intens = 1e-10):
+	def mi_LNC(X,k=5,base=np.exp(1),alpha=0.25,intens = 1e-10,rng=None,seed=None):
 		'''The mutual information estimator by PCA-based local non-uniform correction(LNC)
 		   ith row of X represents ith dimension of the data, e.g. X = [[1.0,3.0,3.0],[0.1,1.2,5.4]], if X has two dimensions and we have three samples
 		   alpha is a threshold parameter related to k and d(dimensionality), please refer to our paper for details about this parameter
+		   rng, seed: random generator or seed of the small noise (see noisy_points), the same seed gives the same result
+		'''
+		return MI.mi_LNC_points(MI.noisy_points(X,intens,rng,seed),k,base,alpha)
+
+	@staticmethod
+	def mi_LNC_points(points,k=5,base=np.exp(1),alpha=0.25,trees=None,comonotone=None):
+		'''The LNC mutual information estimator applied to points to which the small noise has already been added
+		   ith column of points represents ith dimension of the data (see noisy_points)
+		   trees are the trees of the marginal spaces (see marginal_trees), built from points if not given
+		   comonotone: see knn_marginal_radii
 		'''
 		#N is the number of samples
-		N = len(X[0]);
-		
+		N = len(points)
+
 		#First Step: calculate the mutual information using the Kraskov mutual information estimator
-		#adding small noise to X, e.g., x<-X+noise
-		x = [];
-		for i in range(len(X)):
-			tem = [];
-			for j in range(len(X[i])):
-				tem.append([X[i][j] + intens*nr.rand(1)[0]]);
-			x.append(tem);
-	
-		points = [];
-		for j in range(len(x[0])):
-			tem = [];
-			for i in range(len(x)):	
-				tem.append(x[i][j][0]);
-			points.append(tem);
-		tree = ss.cKDTree(points);
-		dvec = [];
-		for i in range(len(x)):
-			dvec.append([])	
-		for point in points:
-			#Find k-nearest neighbors in joint space, p=inf means max norm
-			knn = tree.query(point,k+1,p=float('inf'));
-			points_knn = [];
-			for i in range(len(x)):
-				dvec[i].append(float('-inf'));
-				points_knn.append([]);
-			for j in range(k+1):
-				for i in range(len(x)):
-					points_knn[i].append(points[knn[1][j]][i]);
-			
-			#Find distances to k-nearest neighbors in each marginal space
-			for i in range(k+1):
-				for j in range(len(x)):
-					if dvec[j][-1] < fabs(points_knn[j][i]-points_knn[j][0]):
-						dvec[j][-1] =  fabs(points_knn[j][i]-points_knn[j][0]);
+		#the k-nearest neighbors in joint space are found once and used also in the second step
+		knn, dvec = MI.knn_marginal_radii(points,k,comonotone)
+		ret = MI.kraskov_term(points,dvec,k,trees)
 
+		#Second Step: Add the correction term (Local Non-Uniform Correction)
+		return (ret + MI.lnc_correction(points,knn,dvec,k,alpha)/N)/log(base)
+
+	@staticmethod
+	def lnc_correction(points,knn,dvec,k,alpha):
+		#Local Non-Uniform Correction summed over all points (chunk_size points at once)
 		ret = 0.
-		for i in range(len(x)):
-			ret -= MI.avgdigamma(x[i],dvec[i]);
-		ret += digamma(k) - (float(len(x))-1.)/float(k) + (float(len(x))-1.) * digamma(len(x[0]));
+		for start in range(0,len(points),MI.chunk_size):
+			stop = start+MI.chunk_size
+			ret += MI.lnc_correction_chunk(points,knn[start:stop],dvec[:,start:stop],k,alpha)
+		return ret
 
-		#Second Step: Add the correction term (Local Non-Uniform Correction)
-		e = 0.
-		tot = -1;
-		for point in points:
-			tot += 1;
-			#Find k-nearest neighbors in joint space, p=inf means max norm
-			knn = tree.query(point,k+1,p=float('inf'));
-			knn_points = [];
-			for i in range(k+1):
-				tem = [];
-				for j in range(len(point)):
-					tem.append(points[knn[1][i]][j]);
-				knn_points.append(tem);
-				
-		
-			#Substract mean	of k-nearest neighbor points
-			for i in range(len(point)):
-				avg = knn_points[0][i];
-				for j in range(k+1):
-					knn_points[j][i] -= avg;
-		
-			#Calculate covariance matrix of k-nearest neighbor points, obtain eigen vectors
-			covr = [];
-			for i in range(len(point)):
-				tem = 0;
-				covr.append([]);
-				for j in range(len(point)):
-					covr[i].append(0);
-			for i in range(len(point)):
-				for j in range(len(point)):
-					avg = 0.
-					for ii in range(1,k+1):
-						avg += knn_points[ii][i] * knn_points[ii][j] / float(k);
-					covr[i][j] = avg;
-			w, v = la.eig(covr);
-			
-
-			#Calculate PCA-bounding box using eigen vectors
-			V_rect = 0;
-			cur = [];
-			for i in range(len(point)):
-				maxV = 0.
-				for j in range(0,k+1):
-					tem = 0.;
-					for jj in range(len(point)):
-						tem += v[jj,i] * knn_points[j][jj];
-					if fabs(tem) > maxV:
-						maxV = fabs(tem);						
-				cur.append(maxV);
-				V_rect = V_rect + log(cur[i]);
-		
-			#Calculate the volume of original box
-			log_knn_dist = 0.;
-			for i in range(len(dvec)):
-				log_knn_dist += log(dvec[i][tot]);
-
-			#Perform local non-uniformity checking
-			if V_rect >= log_knn_dist + log(alpha):
-				V_rect = log_knn_dist;
-
-			#Update correction term
-			if (log_knn_dist - V_rect) > 0:
-				e += (log_knn_dist - V_rect)/N;
-
-		return (ret + e)/log(base);
+	@staticmethod
+	def lnc_correction_chunk(points,knn,dvec,k,alpha):
+		#Local Non-Uniform Correction summed over the points of a chunk (knn, dvec: rows, columns of the chunk points)
+		#k-nearest neighbor points with the point itself substracted (chunk points x k+1 x d)
+		knn_points = points[knn] - points[knn[:,:1]]
+
+		#Calculate covariance matrix of k-nearest neighbor points, obtain eigen vectors (one d x d matrix per point)
+		covr = np.einsum('nki,nkj->nij',knn_points[:,1:,:],knn_points[:,1:,:]) / float(k)
+		w, v = np.linalg.eigh(covr)
+
+		#Calculate PCA-bounding box using eigen vectors
+		cur = np.abs(np.einsum('nkj,nji->nki',knn_points,v)).max(axis=1)
+		V_rect = np.log(cur).sum(axis=1)
+
+		#Calculate the volume of original box
+		log_knn_dist = np.log(dvec).sum(axis=0)
+
+		#Perform local non-uniformity checking
+		V_rect = np.where(V_rect >= log_knn_dist + log(alpha), log_knn_dist, V_rect)
+
+		#Update correction term
+		return np.where((log_knn_dist - V_rect) > 0, log_knn_dist - V_rect, 0.).sum()
 	
 	@staticmethod
-	def entropy(x,k=3,base=np.exp(1),intens=1e-10):
+	def entropy(x,k=3,base=np.exp(1),intens=1e-10,rng=None,seed=None):
 	  """ The classic K-L k-nearest neighbor continuous entropy estimator
 	      x should be a list of vectors, e.g. x = [[1.3],[3.7],[5.1],[2.4]]
 	      if x is a one-dimensional scalar and we have four samples
+	      rng, seed: random generator or seed of the small noise (see noisy_points), the same seed gives the same result
 	  """
 	  assert k <= len(x)-1, "Set k smaller than num. samples - 1"
 	  d = len(x[0])
 	  N = len(x)
-	  x = [list(p + intens*nr.rand(len(x[0]))) for p in x]
+	  if rng is None and seed is None:
+	    x = np.asarray(x,dtype=float) + intens*nr.rand(N,d)
+	  else:
+	    x = MI.noisy_points(np.asarray(x,dtype=float).T,intens,rng,seed)
 	  tree = ss.cKDTree(x)
-	  nn = [tree.query(point,k+1,p=float('inf'))[0][k] for point in x]
+	  nn = tree.query(x,k+1,p=float('inf'))[0][:,k]
 	  const = digamma(N)-digamma(k) + d*log(2)
 	  return (const + d*np.mean(list(map(log,nn))))/log(base)
 
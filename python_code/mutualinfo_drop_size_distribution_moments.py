@@ -13,6 +13,11 @@
 #
 # Output 1: rescaled mutual infromation between moments of the pdf of drop diameters (matrix format)
 # Output 2: rescaled mutual infromation between moments of the pdf of drop diameters (for plot format)
+# Output 3 (approximate mode, see --subsample): approximate rescaled mutual infromation with the bootstrap interval of
+#           the mean over the subsamples (subsample_low, subsample_high), number of records and subsample size
+#           Note: the approximate RMI underestimates the RMI (median relative difference from the exact RMI -26% on
+#           BBY with subsamples of 2000 records, see rmi.rmi_couples). The interval accounts for the variability of
+#           the subsamples only: it is not a confidence interval of the RMI
 #
 # Author: Massimiliano Ignaccolo
 #         massimiliano.ignaccolo [at] tutanota.com. massimiliano.ignaccolo [at] sas.com
@@ -33,7 +38,7 @@ import argparse
 # if pack_path not in sys.path:
 # sys.path.append(pack_path)
 import disdrorain as dr
-from lnc import MI
+import rmi
 #  ------------- Necessary Python packages -END
 
 # ARGUMENTS
@@ -50,34 +55,41 @@ parser.add_argument('--rmioutmatrix', action="store", dest='_dom_', default='rmi
 # --rmioutplot: output file name for rescaled mutual information results for plot format
 #               default is "rmiplot_dsd_paramters"
 parser.add_argument('--rmioutplot', action="store", dest='_dop_', default='rmiplot_dsd_paramters')
-args = parser.parse_args()
-
-
-# Method for calculating the Rescaled Mututal Information
-def calculate_RMI(_temp_):
+# --workers: number of worker processes for the RMI calculation (couples of moments of all representations are
+#            calculated in parallel). Default is 1 (no pool of processes)
+parser.add_argument('--workers', action="store", dest='_wo_', default='1')
+# --seed: seed of the random generator of the small noise added to the moments (same seed -> same results)
+parser.add_argument('--seed', action="store", dest='_se_', default='1')
+# --subsample: approximate mode. Number of records of the random subsamples used to approximate the MI (mean of the
+#              MI of the subsamples, with bootstrap interval). The normalization term is calculated with all the
+#              records. Default is 0: all records are used
+#              The approximate RMI is biased (-26% median relative difference on BBY with 2000 records): the
+#              interval covers the subsample variability only, not this bias (see Output 3)
+parser.add_argument('--subsample', action="store", dest='_ss_', default='0')
+# --nsubsamples: approximate mode. Maximum number of subsamples for each couple of moments
+parser.add_argument('--nsubsamples', action="store", dest='_ns_', default='20')
+# --stratify: approximate mode. Number of strata of rainfall rate (quantiles) of the stratified subsamples
+#             Default is 0: simple random subsamples
+parser.add_argument('--stratify', action="store", dest='_st_', default='0')
+# --tolerance: approximate mode. No more subsamples are drawn once the width of the 95% bootstrap interval
+#              is smaller than tolerance. Default is 0: nsubsamples subsamples are always used
+parser.add_argument('--tolerance', action="store", dest='_to_', default='0')
+# --rmioutci: approximate mode. Output file name for the rescaled mutual information with the bootstrap intervals
+#             default is "rmici_dsd_moments"
+parser.add_argument('--rmioutci', action="store", dest='_doc_', default='rmici_dsd_moments')
+
+
+# Method for calculating the Rescaled Mututal Information of all representations
+# _dsdpar_: dictionary {pdftype: data frame with dsd moments}
+# _strata_: stratum of each record for the stratified subsamples (None: simple random subsamples)
+def calculate_RMI(_dsdpar_, _strata_=None):
     listv = ['N/Nv', 'M1', 'M2', 'M3', 'M4', 'M5', 'M6']
-    mi_matrix = np.zeros(shape=(len(listv), len(listv)))
-    for k in range(0, len(listv)):
-        for l in range(k, len(listv)):
-            if k != l:
-                print(listv[k], listv[l])  # info about current couple of paramteter processed
-                x = _temp_.loc[:, listv[k]].values.tolist()
-                y = _temp_.loc[:, listv[l]].values.tolist()
-
-                xs = sorted(x)
-                ys = sorted(y)
-
-                mi_matrix[k][l] = MI.mi_LNC([x, y], k=20, base=np.exp(1), alpha=0.25)/MI.mi_LNC([xs, ys], k=20, base=np.exp(1), alpha=0.25)
-                mi_matrix[l][k] = mi_matrix[k][l]
-            else:
-                mi_matrix[k][l] = 0
-
-    _res_ = pd.DataFrame(mi_matrix)
-    _res_.columns = listv
-    _res_.index = listv
-    _res_.reset_index(inplace=True)
-
-    return _res_
+    _temp_ = {_pdftype_: _df_.loc[:, listv] for _pdftype_, _df_ in _dsdpar_.items()}
+    # couples of moments of all representations are calculated in parallel (see rmi.rmi_couples)
+    _couples_ = rmi.rmi_couples(_temp_, workers=int(args._wo_), seed=int(args._se_), _knn_=20, _alpha_=0.25,
+                                subsample=int(args._ss_), nsubsamples=int(args._ns_), strata=_strata_,
+                                tolerance=float(args._to_))
+    return (rmi.couples_to_matrices(_couples_, _temp_), _couples_)
 
 
 # Method for converting RMI matrix into dataset ideal for plotting
@@ -122,115 +134,123 @@ def rmi_4plot(_temp_, _pdftype_='flux'):
     return _df_
 
 
-print("Executing: ", sys.argv[0])
-print()
+# the program is executed only when invoked (see the note in workerpool.py)
+if __name__ == '__main__':
+    args = parser.parse_args()
 
-# load catalog
-catalog = pd.read_csv(args._dc_, sep=',')
-# retrieve index of catalog data frame corresponding to the desired acronym
-index_acronym = catalog[catalog['ID2'] == args._da_].index.tolist()
+    # parameters of the RMI calculation: results are stored in the result cache of the disdrorain package
+    # (see disdrorain.open_resultcache) and calculated again only if the data or these parameters change
+    rmi_options = {'seed': int(args._se_), 'knn': 20, 'alpha': 0.25, 'subsample': int(args._ss_), 'nsubsamples': int(args._ns_),
+                   'stratify': int(args._st_), 'tolerance': float(args._to_)}
 
-if index_acronym:
-    row = catalog.loc[catalog.ID2 == args._da_, :]
-    celllimits_path = args._ddp_+'/'+row['CELLLIMITS'].values[0]
-    areainstr = row['AREA_INSTRUMENT'].values[0]
-    instr = row['INSTRUMENT'].values[0]
-    tr = row['TIME_RESOLUTION'].values[0]
-    pathtodata = args._ddp_+'/'+args._da_
+    print("Executing: ", sys.argv[0])
+    print()
 
-    # if data set is not from 2DVD disdrometer
-    if (instr != '2DVD'):
-        # if data set is RD80 with standard cell limits division
-        if ((instr == 'RD80') & (row['CELLLIMITS'].values[0] == 'standard')):
-            disdrodata = dr.disdrorain(datapath=pathtodata, instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-        else:
-            disdrodata = dr.disdrorain(classpath=celllimits_path, datapath=pathtodata, instrument_area=areainstr,
-                                       time_interval=tr)  # create disdrodata class
-    else:
-        disdrodata = dr.disdrorain_2dvd(datapath=pathtodata, instrument_area=areainstr,
-                                        time_interval=tr)  # create disdrodata class for 2dvd data
-
-    # list of pdf's moment to calculate
-    list_moments_order = list([1, 2, 3, 4, 5, 6])
-
-    if (instr != '2DVD'):
-        # calculate bulk variables: this is used only to find the values of N or Nv
-        bvar_vexpo = disdrodata.bulk_variables(_speed_='expo')
-        bvar_vplaw = disdrodata.bulk_variables(_speed_='plaw')
-        # calculate dsd paramters
-        # calculate central moments in the flux (ground) representation
-        dsdpar_flux = disdrodata.flux_moment_calculator(list_moments_order)
-        dsdpar_flux['N/Nv'] = bvar_vplaw['N']  # it does not matter here if we use plaw or expo dataframe: N is always N
-        # calculate phase space paramter in the cloud representation
-        # exponential law for drop speed
-        dsdpar_cexpo = disdrodata.cloud_moment_calculator(list_moments_order, _speed_='expo')
-        dsdpar_cexpo['N/Nv'] = bvar_vexpo['Nv']
-        # expoential law for drop speed
-        dsdpar_cplaw = disdrodata.cloud_moment_calculator(list_moments_order, _speed_='plaw')
-        dsdpar_cplaw['N/Nv'] = bvar_vplaw['Nv']
-
-        print("1/3: processing flux representation")
-        _res_flux = calculate_RMI(dsdpar_flux)
-        _res_flux.rename(columns={'index': 'Variable'}, inplace=True)
-        _res_flux['pdftype'] = 'flux'
-        _res_flux_xplot = rmi_4plot(_res_flux)
-
-        print("2/3: processing cloudexpo representation")
-        _res_cexpo = calculate_RMI(dsdpar_cexpo)
-        _res_cexpo.rename(columns={'index': 'Variable'}, inplace=True)
-        _res_cexpo['pdftype'] = 'cloudexpo'
-        _res_cexpo_xplot = rmi_4plot(_res_cexpo, _pdftype_="cloudexpo")
-
-        print("3/3: processing cloudplaw representation")
-        _res_cplaw = calculate_RMI(dsdpar_cplaw)
-        _res_cplaw.rename(columns={'index': 'Variable'}, inplace=True)
-        _res_cplaw['pdftype'] = 'cloudplaw'
-        _res_cplaw_xplot = rmi_4plot(_res_cplaw, _pdftype_="cloudplaw")
-
-        res_summary = _res_flux.copy()
-        res_summary = pd.concat([res_summary, _res_cplaw], ignore_index=True)
-        res_summary = pd.concat([res_summary, _res_cexpo], ignore_index=True)
-        res_summary['site'] = args._da_
-        res_summary['instrument'] = instr
-
-        res_summary_xplot = _res_flux_xplot.copy()
-        res_summary_xplot = pd.concat([res_summary_xplot, _res_cplaw_xplot], ignore_index=True)
-        res_summary_xplot = pd.concat([res_summary_xplot, _res_cexpo_xplot], ignore_index=True)
+    # load catalog
+    catalog = dr.open_catalog(args._dc_, args._ddp_)
 
-    else:
-        # calculate bulk variables: this is used only to find the values of N or Nv
-        bvar = disdrodata.bulk_variables()
-        # calculate dsd paramters
-        # calculate central moments in the flux (ground) representation
+    if args._da_ in catalog:
+        instr = catalog.metadata(args._da_)['INSTRUMENT']  # set instrument type
+        # create disdrodata class (disdrorain class or disdrorain_2dvd class for 2dvd data)
+        disdrodata = catalog.dataset(args._da_)
+
+        # list of pdf's moment to calculate
         list_moments_order = list([1, 2, 3, 4, 5, 6])
-        dsdpar_flux = disdrodata.flux_moment_calculator(list_moments_order)
-        dsdpar_flux['N/Nv'] = bvar['N']
-        # calculate phase space paramter in the cloud representation
-        dsdpar_cloud = disdrodata.cloud_moment_calculator(list_moments_order)
-        dsdpar_cloud['N/Nv'] = bvar['Nv']
-
-        print("1/2: processing flux representation")
-        _res_flux = calculate_RMI(dsdpar_flux)
-        _res_flux.rename(columns={'index': 'Variable'}, inplace=True)
-        _res_flux['pdftype'] = 'flux'
-        _res_flux_xplot = rmi_4plot(_res_flux)
-
-        print("2/2: processing cloud representation")
-        _res_cloud = calculate_RMI(dsdpar_cloud)
-        _res_cloud.rename(columns={'index': 'Variable'}, inplace=True)
-        _res_cloud['pdftype'] = 'cloud2dvd'
-        _res_cloud_xplot = rmi_4plot(_res_cloud, _pdftype_="cloud2dvd")
-
-        res_summary = _res_flux.copy()
-        res_summary = pd.concat([res_summary, _res_cloud], ignore_index=True)
-        res_summary['site'] = args._da_
-        res_summary['instrument'] = instr
-
-        res_summary_xplot = _res_flux_xplot.copy()
-        res_summary_xplot = pd.concat([res_summary_xplot, _res_cloud_xplot], ignore_index=True)
-else:
-    print("Acronym not found in catalog")
-    sys.exit()
-
-res_summary.to_csv(args._dom_, sep=' ', index=None)
-res_summary_xplot.to_csv(args._dop_, sep=' ', index=None)
+
+        if (instr != '2DVD'):
+            # calculate bulk variables: this is used only to find the values of N or Nv
+            bvar_vexpo = disdrodata.bulkvar_vexpo
+            bvar_vplaw = disdrodata.bulkvar_vplaw
+            # calculate dsd paramters
+            # calculate central moments in the flux (ground) representation
+            dsdpar_flux = disdrodata.flux_moment_calculator(list_moments_order)
+            dsdpar_flux['N/Nv'] = bvar_vplaw['N']  # it does not matter here if we use plaw or expo dataframe: N is always N
+            # calculate phase space paramter in the cloud representation
+            # exponential law for drop speed
+            dsdpar_cexpo = disdrodata.cloud_moment_calculator(list_moments_order, _speed_='expo')
+            dsdpar_cexpo['N/Nv'] = bvar_vexpo['Nv']
+            # expoential law for drop speed
+            dsdpar_cplaw = disdrodata.cloud_moment_calculator(list_moments_order, _speed_='plaw')
+            dsdpar_cplaw['N/Nv'] = bvar_vplaw['Nv']
+
+            # calculate RMI in all representations
+            print("processing flux, cloudexpo, cloudplaw representations")
+            # strata of rainfall rate for the stratified subsamples (approximate mode)
+            _strata_ = rmi.rain_rate_strata(bvar_vplaw['R'], int(args._st_)) if int(args._st_) > 0 else None
+            dsdpar = {'flux': dsdpar_flux, 'cloudexpo': dsdpar_cexpo, 'cloudplaw': dsdpar_cplaw}
+            (_res_, _couples_) = disdrodata.cached_result('rmi_moments', lambda: calculate_RMI(dsdpar, _strata_), **rmi_options)
+
+            _res_flux = _res_['flux']
+            _res_flux.rename(columns={'index': 'Variable'}, inplace=True)
+            _res_flux['pdftype'] = 'flux'
+            _res_flux_xplot = rmi_4plot(_res_flux)
+
+            _res_cexpo = _res_['cloudexpo']
+            _res_cexpo.rename(columns={'index': 'Variable'}, inplace=True)
+            _res_cexpo['pdftype'] = 'cloudexpo'
+            _res_cexpo_xplot = rmi_4plot(_res_cexpo, _pdftype_="cloudexpo")
+
+            _res_cplaw = _res_['cloudplaw']
+            _res_cplaw.rename(columns={'index': 'Variable'}, inplace=True)
+            _res_cplaw['pdftype'] = 'cloudplaw'
+            _res_cplaw_xplot = rmi_4plot(_res_cplaw, _pdftype_="cloudplaw")
+
+            res_summary = _res_flux.copy()
+            res_summary = pd.concat([res_summary, _res_cplaw], ignore_index=True)
+            res_summary = pd.concat([res_summary, _res_cexpo], ignore_index=True)
+            res_summary['site'] = args._da_
+            res_summary['instrument'] = instr
+
+            res_summary_xplot = _res_flux_xplot.copy()
+            res_summary_xplot = pd.concat([res_summary_xplot, _res_cplaw_xplot], ignore_index=True)
+            res_summary_xplot = pd.concat([res_summary_xplot, _res_cexpo_xplot], ignore_index=True)
+
+        else:
+            # calculate bulk variables: this is used only to find the values of N or Nv
+            bvar = disdrodata.bulkvar
+            # calculate dsd paramters
+            # calculate central moments in the flux (ground) representation
+            list_moments_order = list([1, 2, 3, 4, 5, 6])
+            dsdpar_flux = disdrodata.flux_moment_calculator(list_moments_order)
+            dsdpar_flux['N/Nv'] = bvar['N']
+            # calculate phase space paramter in the cloud representation
+            dsdpar_cloud = disdrodata.cloud_moment_calculator(list_moments_order)
+            dsdpar_cloud['N/Nv'] = bvar['Nv']
+
+            # calculate RMI in all representations
+            print("processing flux, cloud2dvd representations")
+            # strata of rainfall rate for the stratified subsamples (approximate mode)
+            _strata_ = rmi.rain_rate_strata(bvar['R'], int(args._st_)) if int(args._st_) > 0 else None
+            dsdpar = {'flux': dsdpar_flux, 'cloud2dvd': dsdpar_cloud}
+            (_res_, _couples_) = disdrodata.cached_result('rmi_moments', lambda: calculate_RMI(dsdpar, _strata_), **rmi_options)
+
+            _res_flux = _res_['flux']
+            _res_flux.rename(columns={'index': 'Variable'}, inplace=True)
+            _res_flux['pdftype'] = 'flux'
+            _res_flux_xplot = rmi_4plot(_res_flux)
+
+            _res_cloud = _res_['cloud2dvd']
+            _res_cloud.rename(columns={'index': 'Variable'}, inplace=True)
+            _res_cloud['pdftype'] = 'cloud2dvd'
+            _res_cloud_xplot = rmi_4plot(_res_cloud, _pdftype_="cloud2dvd")
+
+            res_summary = _res_flux.copy()
+            res_summary = pd.concat([res_summary, _res_cloud], ignore_index=True)
+            res_summary['site'] = args._da_
+            res_summary['instrument'] = instr
+
+            res_summary_xplot = _res_flux_xplot.copy()
+            res_summary_xplot = pd.concat([res_summary_xplot, _res_cloud_xplot], ignore_index=True)
+    else:
+        print("Acronym not found in catalog")
+        sys.exit()
+
+    res_summary.to_csv(args._dom_, sep=' ', index=None)
+    res_summary_xplot.to_csv(args._dop_, sep=' ', index=None)
+    if int(args._ss_) > 0:
+        _couples_['site'] = args._da_
+        _couples_['instrument'] = instr
+        # number of records and of records of the subsamples (the bias of the approximate RMI depends on both)
+        _couples_['nrecords'] = disdrodata.psp_flux.shape[0]
+        _couples_['subsample'] = int(args._ss_)
+        _couples_.to_csv(args._doc_, sep=' ', index=None)
@@ -100,33 +100,16 @@ print("Executing: ", sys.argv[0])
 print()
 
 # load catalog
-catalog = pd.read_csv(args._dc_, sep=',')
-# retrieve index of catalog data frame corresponding to the desired acronym
-index_acronym = catalog[catalog['ID2'] == args._da_].index.tolist()
-
-if index_acronym:
-    row = catalog.loc[catalog.ID2 == args._da_, :]
-    celllimits_path = args._ddp_+'/'+row['CELLLIMITS'].values[0]
-    areainstr = row['AREA_INSTRUMENT'].values[0]
-    instr = row['INSTRUMENT'].values[0]
-    tr = row['TIME_RESOLUTION'].values[0]
-    pathtodata = args._ddp_+'/'+args._da_
-
-    # if data set is not from 2DVD disdrometer
-    if (instr != '2DVD'):
-        # if data set is RD80 with standard cell limits division
-        if ((instr == 'RD80') & (row['CELLLIMITS'].values[0] == 'standard')):
-            disdrodata = dr.disdrorain(datapath=pathtodata, instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-        else:
-            disdrodata = dr.disdrorain(classpath=celllimits_path, datapath=pathtodata,
-                                       instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-    else:
-        disdrodata = dr.disdrorain_2dvd(datapath=pathtodata, instrument_area=areainstr,
-                                        time_interval=tr)  # create disdrodata class for 2dvd data
+catalog = dr.open_catalog(args._dc_, args._ddp_)
+
+if args._da_ in catalog:
+    instr = catalog.metadata(args._da_)['INSTRUMENT']  # set instrument type
+    # create disdrodata class (disdrorain class or disdrorain_2dvd class for 2dvd data)
+    disdrodata = catalog.dataset(args._da_)
 
     # calculate dsd paramters
     # calculate central moments in the flux (ground) representation
-    dsdpar_flux = disdrodata.flux_phase_space_parameters()
+    dsdpar_flux = disdrodata.psp_flux
     # process flux representation
     (_pca_flux, _pca_compo_flux) = PCA_maker(dsdpar_flux, ndropspdf='yes', pdftype='flux')
     (_pca_flux_noN, _pca_compo_flux_noN) = PCA_maker(dsdpar_flux, ndropspdf='no', pdftype='flux')
@@ -138,9 +121,9 @@ if index_acronym:
     if (instr != '2DVD'):
         # calculate phase space paramter in the cloud representation
         # exponential law for drop speed
-        dsdpar_cexpo = disdrodata.cloud_phase_space_parameters(_speed_='expo')
+        dsdpar_cexpo = disdrodata.psp_cloud_vexpo
         # expoential law for drop speed
-        dsdpar_cplaw = disdrodata.cloud_phase_space_parameters(_speed_='plaw')
+        dsdpar_cplaw = disdrodata.psp_cloud_vplaw
 
         # process cloudexpo representation
         (_pca_cplaw, _pca_compo_cplaw) = PCA_maker(dsdpar_cplaw, ndropspdf='yes', pdftype='cloudplaw')
@@ -170,7 +153,7 @@ if index_acronym:
         res_pca_compo['site'] = args._da_
         res_pca_compo['instrument'] = instr
     else:
-        dsdpar_cloud = disdrodata.cloud_phase_space_parameters()
+        dsdpar_cloud = disdrodata.psp_cloud
 
         # process cloudplaw representation
         (_pca_cloud, _pca_compo_cloud) = PCA_maker(dsdpar_cloud, ndropspdf='yes', pdftype='cloud2dvd')
@@ -0,0 +1,242 @@
+# This program contains the functions to calculate the rescaled mutual information (RMI) matrices of drop size
+# distribution parameters (or moments) using the LNC mutual information estimator (see lnc.py)
+# The RMI of a couple of variables (x,y) is MI(x,y)/MI(xs,ys) where xs, ys are the sorted values of x and y
+# The calculation of the couples of all representations (flux, cloudexpo, ...) is distributed over a pool of
+# worker processes
+# For long datasets the MI of a couple can be approximated by the mean MI of random subsamples of the records (the
+# normalization term is always calculated with all the records). The approximation is biased: the interval reported
+# is the bootstrap interval of the mean over the subsamples, not a confidence interval of the RMI (see rmi_couples)
+#
+# Author: Massimiliano Ignaccolo
+#         massimiliano.ignaccolo [at] tutanota.com. massimiliano.ignaccolo [at] sas.com
+# Last modified: Feb 01 2022
+
+
+# ------------- Necessary Python packages -START
+import pandas as pd
+import numpy as np
+from lnc import MI
+from workerpool import shared, task_results
+# ------------- Necessary Python packages -END
+
+# data shared by the tasks of a worker process (see workerpool.task_results and _setup_worker_):
+#   shared['points']: noisy values of the variables of each representation {representation: (points, sorted points)}
+#   shared['strata']: records of each stratum (list of arrays of record numbers) for the stratified subsamples
+#                     (empty if not stratified)
+#   shared['trees']: marginal trees of the variables already used by the worker process
+#                    {(representation, variable number, 0 for the points or 1 for the sorted points): tree}
+
+# minimum number of subsamples before the width of the bootstrap interval is checked (early stop)
+MIN_SUBSAMPLES = 5
+
+
+# function to complete the shared data in a worker process: records of each stratum, no marginal tree yet
+def _setup_worker_(_shared_):
+    _strata_ = _shared_['strata']
+    _shared_['strata'] = list() if _strata_ is None else [np.flatnonzero(_strata_ == _s_) for _s_ in np.unique(_strata_)]
+    _shared_['trees'] = dict()
+
+
+# function to get the marginal tree of a variable (built only once in each worker process)
+# _sorted_: 0 tree of the noisy values, 1 tree of the sorted values (they have their own noise, see noisy_variables)
+def _marginal_tree_(_pdftype_, _col_, _sorted_=0):
+    if (_pdftype_, _col_, _sorted_) not in shared['trees']:
+        _points_ = shared['points'][_pdftype_][_sorted_]
+        shared['trees'][(_pdftype_, _col_, _sorted_)] = MI.marginal_trees(_points_[:, [_col_]])[0]
+    return shared['trees'][(_pdftype_, _col_, _sorted_)]
+
+
+# function to split the records of a subsample among the strata in proportion to their number of records
+# largest remainder: the sizes of the strata sum to _size_ (ties of the remainders go to the first strata)
+def stratum_sizes(_lengths_, _size_):
+    _lengths_ = np.asarray(_lengths_, dtype=np.int64)
+    _quota_ = _size_ * _lengths_ / _lengths_.sum()
+    _sizes_ = np.floor(_quota_).astype(np.int64)
+    _order_ = np.argsort(-(_quota_ - _sizes_), kind='stable')
+    _sizes_[_order_[:_size_ - _sizes_.sum()]] += 1
+    return _sizes_
+
+
+# function to draw the record numbers of a subsample (without replacement)
+# stratified: each stratum contributes in proportion to its number of records (see stratum_sizes)
+def _draw_subsample_(_nrec_, _size_, rng):
+    if len(shared['strata']) == 0:
+        return rng.choice(_nrec_, size=_size_, replace=False)
+    _sizes_ = stratum_sizes([len(_records_) for _records_ in shared['strata']], _size_)
+    _idx_ = [rng.choice(_records_, size=_n_, replace=False) for _records_, _n_ in zip(shared['strata'], _sizes_)]
+    return np.concatenate(_idx_)
+
+
+# function to calculate the RMI of a couple of variables (executed by a worker process)
+# exact: all records are used. approximate (_size_ > 0): mean of the MI of random subsamples of _size_ records
+# divided by the normalization term, which is always calculated with all the records
+def _rmi_couple_(_task_):
+    (_pdftype_, k, l, _knn_, _alpha_, _size_, _nsub_, _tol_, _conf_, _seed_) = _task_
+    (points, points_sorted) = shared['points'][_pdftype_]
+    trees_sorted = [_marginal_tree_(_pdftype_, k, 1), _marginal_tree_(_pdftype_, l, 1)]
+    _norm_ = MI.mi_LNC_points(points_sorted[:, [k, l]], k=_knn_, base=np.exp(1), alpha=_alpha_, trees=trees_sorted)
+    if _size_ == 0:
+        trees = [_marginal_tree_(_pdftype_, k), _marginal_tree_(_pdftype_, l)]
+        _rmi_ = MI.mi_LNC_points(points[:, [k, l]], k=_knn_, base=np.exp(1), alpha=_alpha_, trees=trees) / _norm_
+        return (_pdftype_, k, l, _rmi_, np.nan, np.nan, 0)
+
+    rng = np.random.default_rng(_seed_)
+    _values_ = list()
+    (_low_, _high_) = (np.nan, np.nan)
+    for n in range(0, _nsub_):
+        _sub_ = points[_draw_subsample_(len(points), _size_, rng)][:, [k, l]]
+        _values_.append(MI.mi_LNC_points(_sub_, k=_knn_, base=np.exp(1), alpha=_alpha_) / _norm_)
+        if len(_values_) >= min(MIN_SUBSAMPLES, _nsub_):
+            (_low_, _high_) = bootstrap_interval(_values_, rng, confidence=_conf_)
+            if (_high_ - _low_) < _tol_:
+                break  # early stop: the interval is narrow enough
+    return (_pdftype_, k, l, np.mean(_values_), _low_, _high_, len(_values_))
+
+
+def bootstrap_interval(_values_, rng, confidence=0.95, nboot=1000):
+    """
+    Purpose: calculate the bootstrap (percentile) confidence interval of the mean of a set of values
+
+    Return: (lower limit, upper limit) of the interval
+
+    _values_: list or array of values
+    rng: numpy random Generator used for resampling
+    confidence: confidence level of the interval
+    nboot: number of bootstrap resamplings
+    """
+    _values_ = np.asarray(_values_, dtype=float)
+    _means_ = _values_[rng.integers(0, len(_values_), size=(nboot, len(_values_)))].mean(axis=1)
+    return tuple(np.quantile(_means_, [(1 - confidence) / 2, (1 + confidence) / 2]))
+
+
+def rain_rate_strata(_rainrate_, nstrata=4):
+    """
+    Purpose: assign each record to a stratum of rainfall rate (quantiles of the rainfall rate: the strata have
+             approximately the same number of records)
+
+    Return: numpy array with the stratum number of each record
+
+    _rainrate_: rainfall rate of each record (e.g. column R of bulkvar)
+    nstrata: number of strata
+    """
+    return pd.qcut(np.asarray(_rainrate_), nstrata, labels=False, duplicates='drop')
+
+
+def noisy_variables(_temp_, seed, intens=1e-10):
+    """
+    Purpose: add the small noise of the LNC estimator to the variables (columns) of a data frame. The noise of a
+             variable depends only on seed and on its values (see lnc.MI.noisy_column): the same seed gives the same
+             noisy values, and the same variable gets the same noise in all the representations and programs
+
+    Return: (points, sorted points) numpy arrays (number of records x number of variables). The sorted points
+            are the sorted values of each variable with their own small noise (couples with the same marginals and
+            comonotone dependence). As in the original calculate_RMI the values are sorted before the noise is
+            added: tied values (e.g. N, Nv) are in random order, sorting the noisy values would make them
+            comonotone too and increase the normalization term
+
+    _temp_: data frame with the variables
+    seed: seed of the random generator (integer)
+    intens: intensity of the noise
+    """
+    points = MI.noisy_points(_temp_.values.T, intens=intens, seed=seed)
+    points_sorted = MI.noisy_points(np.sort(_temp_.values, axis=0).T, intens=intens, seed=seed)
+    return (points, points_sorted)
+
+
+def rmi_couples(_dsdpar_, workers=1, seed=1, _knn_=20, _alpha_=0.25, subsample=0, nsubsamples=20, strata=None,
+                tolerance=0., confidence=0.95):
+    """
+    Purpose: calculate the RMI of all the couples of variables of each representation. The couples of all
+             representations are independent tasks distributed over a pool of worker processes. The noise of the
+             variables is drawn once (in the calling process, see noisy_variables). Each task has its own random
+             generator (for the subsamples) with a seed derived from seed and the position of the task: results do
+             not depend on the number of workers or on the order in which tasks are completed. Progress is printed
+             as couples are completed
+             Approximate mode (subsample > 0): the MI of a couple is the mean of the MI of nsubsamples random
+             subsamples of subsample records (drawn without replacement), divided by the normalization term
+             calculated once with all the records (as in exact mode). The MI estimated with fewer records is smaller
+             (the k nearest neighbors span a larger part of the distribution): the approximate RMI underestimates the
+             RMI, mostly for the couples with a weak dependence. Median relative difference from the exact RMI on BBY
+             (10819 records): -26% with subsamples of 2000 records (couples with N/Nv -80%), -9% with subsamples of
+             5000 records (couples with N/Nv -44%); on DRW (6925 records) -6% with subsamples of 2000 records.
+             The interval (subsample_low, subsample_high) is the bootstrap interval of the mean over the subsamples:
+             it accounts for the variability of the subsamples only and it is not a confidence interval of the RMI
+             (it contains the exact RMI for 7% of the couples on BBY and 33% on DRW with subsamples of 2000 records).
+             The time of the numerator depends on the size of the subsamples, the time of the normalization term on
+             the number of records
+
+    Return: data frame with one row per couple: representation (pdftype), variables (x, y), RMI (rmi), limits of the
+            bootstrap interval of the mean over the subsamples (subsample_low, subsample_high: NaN in exact mode),
+            number of subsamples used (nsubsamples: 0 in exact mode)
+
+    _dsdpar_: dictionary {representation: data frame with the variables}. e.g. {'flux': ..., 'cloudexpo': ...}
+    workers: number of worker processes. If 1 (or if called inside a worker process) no pool of processes is used
+    seed: seed of the random generators
+    _knn_: number of nearest neighbors of the LNC estimator
+    _alpha_: alpha parameter of the LNC estimator
+    subsample: number of records of each subsample. If 0 (or not smaller than the number of records) all
+               records are used (exact mode)
+    nsubsamples: maximum number of subsamples of each couple
+    strata: stratum of each record (e.g. see rain_rate_strata). If given the subsamples are stratified: each
+            stratum contributes in proportion to its number of records. If None simple random subsamples are used
+    tolerance: early stop. No more subsamples are drawn once the width of the bootstrap interval is smaller
+               than tolerance (checked from MIN_SUBSAMPLES subsamples on). If 0 nsubsamples subsamples are used
+    confidence: confidence level of the bootstrap interval of the mean over the subsamples
+    """
+    _nrec_ = min([_temp_.shape[0] for _temp_ in _dsdpar_.values()])
+    if subsample >= _nrec_:
+        subsample = 0
+    _points_ = {_pdftype_: noisy_variables(_temp_, seed) for _pdftype_, _temp_ in _dsdpar_.items()}
+    list_tasks = [(_pdftype_, k, l) for _pdftype_, _temp_ in _dsdpar_.items()
+                  for k in range(0, _temp_.shape[1]) for l in range(k+1, _temp_.shape[1])]
+    _task_seeds_ = np.random.SeedSequence([seed, len(_dsdpar_)]).spawn(len(list_tasks))
+    list_tasks = [_task_ + (_knn_, _alpha_, subsample, nsubsamples, tolerance, confidence, _task_seeds_[i])
+                  for i, _task_ in enumerate(list_tasks)]
+
+    _rows_ = list()
+    with task_results(_rmi_couple_, list_tasks, workers=workers, data={'points': _points_, 'strata': strata},
+                      setup=_setup_worker_) as _results_:
+        for n, (_pdftype_, k, l, _rmi_, _low_, _high_, _nsub_) in enumerate(_results_):
+            _names_ = _dsdpar_[_pdftype_].columns
+            print(f"{_pdftype_}: {_names_[k]} {_names_[l]} ({n+1}/{len(list_tasks)})")  # info about progress
+            _rows_.append([_pdftype_, k, l, _names_[k], _names_[l], _rmi_, _low_, _high_, _nsub_])
+
+    _res_ = pd.DataFrame(_rows_, columns=['pdftype', 'k', 'l', 'x', 'y', 'rmi', 'subsample_low', 'subsample_high',
+                                          'nsubsamples'])
+    # same order of the couples whatever the order of completion of the tasks
+    _res_['order'] = _res_.pdftype.map({_pdftype_: i for i, _pdftype_ in enumerate(_dsdpar_)})
+    _res_ = _res_.sort_values(by=['order', 'k', 'l']).drop(columns=['order', 'k', 'l']).reset_index(drop=True)
+    return _res_
+
+
+def couples_to_matrices(_couples_, _dsdpar_):
+    """
+    Purpose: convert the RMI of the couples of variables (see rmi_couples) into one RMI matrix per representation
+
+    Return: dictionary {representation: data frame}. Data frame has the RMI matrix (zero on the diagonal) with the
+            variables as columns and an "index" column with the variables
+
+    _couples_: data frame with the RMI of the couples (see rmi_couples)
+    _dsdpar_: dictionary {representation: data frame with the variables} used to calculate _couples_
+    """
+    _res_ = dict()
+    for _pdftype_, _temp_ in _dsdpar_.items():
+        mi_matrix = pd.DataFrame(0., columns=_temp_.columns, index=_temp_.columns)
+        for _row_ in _couples_.loc[_couples_.pdftype == _pdftype_, :].itertuples():
+            mi_matrix.loc[_row_.x, _row_.y] = _row_.rmi
+            mi_matrix.loc[_row_.y, _row_.x] = _row_.rmi
+        _res_[_pdftype_] = mi_matrix.reset_index()
+    return _res_
+
+
+def rmi_matrices(_dsdpar_, workers=1, seed=1, _knn_=20, _alpha_=0.25, **kwargs):
+    """
+    Purpose: calculate the RMI matrix of the variables of each representation (see rmi_couples)
+
+    Return: dictionary {representation: data frame} (see couples_to_matrices)
+
+    _dsdpar_: dictionary {representation: data frame with the variables}. e.g. {'flux': ..., 'cloudexpo': ...}
+    workers, seed, _knn_, _alpha_, kwargs: see rmi_couples
+    """
+    return couples_to_matrices(rmi_couples(_dsdpar_, workers=workers, seed=seed, _knn_=_knn_, _alpha_=_alpha_, **kwargs),
+                               _dsdpar_)
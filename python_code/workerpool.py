@@ -0,0 +1,63 @@
+# This program contains the function used to execute independent tasks on a pool of worker processes (see
+# rmi.rmi_couples and laf.laf_grid)
+# The read-only data needed by the tasks (e.g. the noisy variables of the RMI, the data points of the LAF) are sent
+# once to each worker process and kept in the dictionary shared: the tasks carry only their own parameters
+#
+# Note: with the "spawn" or "forkserver" start methods the worker processes import the program that created the
+#       pool. The programs using a pool (also when invoked by batch_analysis.py) are executed only under
+#       if __name__ == '__main__', so that the worker processes do not execute them again
+#
+# Author: Massimiliano Ignaccolo
+#         massimiliano.ignaccolo [at] tutanota.com. massimiliano.ignaccolo [at] sas.com
+# Last modified: Feb 01 2022
+
+
+# ------------- Necessary Python packages -START
+import contextlib
+import multiprocessing
+# ------------- Necessary Python packages -END
+
+# read-only data shared by the tasks {name: value}, set once in each worker process (see _init_worker_)
+shared = dict()
+
+
+# function to set the shared data in a worker process
+# _setup_: function completing the shared data in the worker process (e.g. building search trees), or None
+def _init_worker_(_data_, _setup_):
+    shared.clear()
+    shared.update(_data_)
+    if _setup_ is not None:
+        _setup_(shared)
+
+
+@contextlib.contextmanager
+def task_results(_function_, list_tasks, workers=1, data=None, setup=None):
+    """
+    Purpose: execute _function_ on each task of list_tasks, on a pool of worker processes. The tasks are independent:
+             their results are returned in order of completion. Daemonic processes (e.g. the worker processes of
+             batch_analysis.py) cannot have children: inside them (or if workers is 1) the tasks are executed one
+             after the other in the calling process. The pool is terminated (and the shared data of the calling
+             process cleared) when the with block ends, also if an exception is raised
+
+    Return: context manager giving an iterator over the results of the tasks
+            e.g. with task_results(_function_, list_tasks, workers=4) as _results_: for _res_ in _results_: ...
+
+    _function_: function executed on each task (defined at module level: it is sent to the worker processes)
+    list_tasks: list of tasks (each one the argument of _function_)
+    workers: number of worker processes
+    data: dictionary of read-only data used by the tasks: available as shared in each worker process
+    setup: function called with shared once the data are set in each worker process (module level function), or None
+    """
+    _data_ = dict() if data is None else data
+    pool = None
+    try:
+        if (workers > 1) and (not multiprocessing.current_process().daemon):
+            pool = multiprocessing.Pool(processes=workers, initializer=_init_worker_, initargs=(_data_, setup))
+            yield pool.imap_unordered(_function_, list_tasks)
+        else:
+            _init_worker_(_data_, setup)
+            yield map(_function_, list_tasks)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        shared.clear()
@@ -87,34 +87,17 @@ def xcorr_4plot(_xcorr_matrix_, _pdftype_):
 
 
 # load catalog
-catalog = pd.read_csv(args._dc_, sep=',')
-# retrieve index of catalog data frame corresponding to the desired acronym
-index_acronym = catalog[catalog['ID2'] == args._da_].index.tolist()
+catalog = dr.open_catalog(args._dc_, args._ddp_)
 
 # if acronym is part of the catalog we calculate the phase space parameters
-if index_acronym:
-    row = catalog.loc[catalog.ID2 == args._da_, :]  # retrieve row corresponding to acronym
-    celllimits_path = args._ddp_+'/'+row['CELLLIMITS'].values[0]  # set file name with cell limits values
-    areainstr = row['AREA_INSTRUMENT'].values[0]  # set area of instrument
-    instr = row['INSTRUMENT'].values[0]  # set instrument type
-    tr = row['TIME_RESOLUTION'].values[0]  # set instrument time resolution
-    pathtodata = args._ddp_+'/'+args._da_  # set path to data set
-
-    # if data set is not from 2DVD disdrometer
-    if (instr != '2DVD'):
-        # if data set is RD80 with standard cell limits division
-        if ((instr == 'RD80') & (row['CELLLIMITS'].values[0] == 'standard')):
-            disdrodata = dr.disdrorain(datapath=pathtodata, instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-        else:
-            disdrodata = dr.disdrorain(classpath=celllimits_path, datapath=pathtodata,
-                                       instrument_area=areainstr, time_interval=tr)  # create disdrodata class
-    else:
-        disdrodata = dr.disdrorain_2dvd(datapath=pathtodata, instrument_area=areainstr,
-                                        time_interval=tr)  # create disdrodata class for 2dvd data
+if args._da_ in catalog:
+    instr = catalog.metadata(args._da_)['INSTRUMENT']  # set instrument type
+    # create disdrodata class (disdrorain class or disdrorain_2dvd class for 2dvd data)
+    disdrodata = catalog.dataset(args._da_)
 
     # calculate dsd paramters
     # calculate central moments in the flux (ground) representation
-    dsdpar_flux = disdrodata.flux_phase_space_parameters()
+    dsdpar_flux = disdrodata.psp_flux
 
     # calculate cross correlation in the flux (ground) representation
     xcorr_dsdpar_flux = dsdpar_flux.corr().reset_index()
@@ -126,9 +109,9 @@ if index_acronym:
     if (instr != '2DVD'):
         # calculate phase space paramter in the cloud representation
         # exponential law for drop speed
-        dsdpar_cexpo = disdrodata.cloud_phase_space_parameters(_speed_='expo')
+        dsdpar_cexpo = disdrodata.psp_cloud_vexpo
         # expoential law for drop speed
-        dsdpar_cplaw = disdrodata.cloud_phase_space_parameters(_speed_='plaw')
+        dsdpar_cplaw = disdrodata.psp_cloud_vplaw
 
         xcorr_dsdpar_cexpo = dsdpar_cexpo.corr().reset_index()
         xcorr_dsdpar_cexpo.rename(columns={'index': 'Variable', 'Nv': 'N/Nv'}, inplace=True)
@@ -152,7 +135,7 @@ if index_acronym:
 
     else:
         # calculate phase space paramter in the cloud representation
-        dsdpar_cloud = disdrodata.cloud_phase_space_parameters()
+        dsdpar_cloud = disdrodata.psp_cloud
         xcorr_dsdpar_cloud = dsdpar_cloud.corr().reset_index()
         xcorr_dsdpar_cloud.rename(columns={'index': 'Variable', 'Nv': 'N/Nv'}, inplace=True)
         xcorr_dsdpar_cloud['pdftype'] = 'cloud2dvd'